@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Time per call of the functions of metlib with Xarray.DataArray against
+             the accessor .metlib of the Xarray.Dataset, that resolves the roles of
+             the dimensions and the grid metrics once per Dataset. The difference is
+             the overhead of each call, that matters most on small grids.
+
+Usage: python benchmarks/accessor.py [repeats]
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import sys
+import time
+import xarray as xr
+import metlib
+from suite import synthetic_fields, as_dataarrays
+#-----------------------------------------------------------------------------------------------------------------------------------
+def per_call(Function, Repeats):
+   Function()   # warm up (e.g. grid metrics and numba compilation)
+   Start = time.perf_counter()
+   for i in range(Repeats):
+      Function()
+   return (time.perf_counter() - Start)/Repeats
+
+
+def main(Repeats=50):
+   print('{:>24} {:>20} {:>14} {:>14} {:>8}'.format('grid', 'diagnostic', 'function [ms]', 'accessor [ms]', 'speedup'))
+   for dLon, nz, nt in [(2.0, 1, 1), (1.0, 1, 1), (1.0, 8, 2), (0.25, 8, 1)]:
+      Temperature, UComp, VComp, Lon, Lat, Levels = synthetic_fields(dLon, nz, nt)
+      Data = xr.Dataset(dict( (Field.name, Field) for Field in as_dataarrays(Temperature, UComp, VComp, Lon, Lat, Levels) ))
+      Cases = [('relative_vorticity', lambda: metlib.relative_vorticity(Data.u, Data.v, periodic_x='auto'),
+                                      lambda: Data.metlib.vorticity(periodic_x='auto')),
+               ('advection', lambda: metlib.advection(Data.t, Data.u, Data.v, periodic_x='auto'),
+                             lambda: Data.metlib.advection('t', periodic_x='auto')),
+               ('potential_vorticity', lambda: metlib.potential_vorticity(Data.t, Data.u, Data.v, periodic_x='auto'),
+                                       lambda: Data.metlib.potential_vorticity(periodic_x='auto'))]
+      Label = '{}deg {}x{}x{}'.format(dLon, nt, nz, len(Lat))
+      for Name, Function, Accessor in Cases:
+         Time1, Time2 = per_call(Function, Repeats), per_call(Accessor, Repeats)
+         print('{:>24} {:>20} {:14.3f} {:14.3f} {:8.2f}'.format(Label, Name, Time1*1e3, Time2*1e3, Time1/Time2))
+
+
+if __name__ == '__main__':
+   main(*[ int(Arg) for Arg in sys.argv[1:2] ])
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Compares the results and the time of the compute backends of metlib
+             (set_options(backend=...)) over synthetic fields on a 1 degree global
+             grid, in float64 and with set_options(dtype='float32').
+
+             It exits with status 1 if any result is not identical (tests/test_backends.py
+             checks it with pytest).
+
+Usage: python benchmarks/backend_parity.py [repeats]
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import sys
+import time
+import numpy as np
+import metlib
+from float32_accuracy import synthetic_fields
+#-----------------------------------------------------------------------------------------------------------------------------------
+def best_time(Function, Repeats):
+   Times = []
+   for i in range(Repeats):
+      Start = time.perf_counter()
+      Function()
+      Times.append(time.perf_counter()-Start)
+   return min(Times)
+
+
+def main(Repeats=3):
+   Backends = metlib.available_backends()
+   print('available backends: {}'.format(', '.join(Backends)))
+   if 'numba' not in Backends:
+      print('numba is not installed, there is nothing to compare')
+      return
+
+   Fields = synthetic_fields(nt=4)
+   Grid = metlib.grid_metrics(Fields[3], Fields[4])
+
+   def diagnostics(Temperature, UComp, VComp):
+      return [
+         ('cdiff X', lambda: metlib.cdiff(Temperature, 'X')),
+         ('cdiff Z', lambda: metlib.cdiff(Temperature, 'Z')),
+         ('relative_vorticity', lambda: metlib.relative_vorticity(UComp, VComp, Grid=Grid)),
+         ('absolute_vorticity', lambda: metlib.absolute_vorticity(UComp, VComp, Grid=Grid)),
+         ('divergence', lambda: metlib.divergence(UComp, VComp, Grid=Grid)),
+         ('advection', lambda: metlib.advection(Temperature, UComp, VComp, Grid=Grid)),
+         ('batch_advection', lambda: metlib.batch_advection(np.stack([Temperature, UComp, VComp]), UComp, VComp, Grid=Grid)),
+      ]
+
+   Mismatches = 0
+   print('{:>24} {:>8} {:>10} {:>10} {:>8} {:>10}'.format('diagnostic', 'dtype', 'numpy [s]', 'numba [s]', 'speedup', 'identical'))
+   # the inputs already in the dtype of the calculations, so only the kernels are timed
+   for dtype in ['float64', 'float32']:
+      for Name, Function in diagnostics(*[ Field.astype(dtype) for Field in Fields[:3] ]):
+         with metlib.set_options(dtype=dtype, backend='numba'):
+            Function()   # compilation
+            Numba = Function()
+            TimeNumba = best_time(Function, Repeats)
+         with metlib.set_options(dtype=dtype, backend='numpy'):
+            Numpy = Function()
+            TimeNumpy = best_time(Function, Repeats)
+         Identical = np.array_equal(Numba, Numpy, equal_nan=True)
+         Mismatches += not Identical
+         print('{:>24} {:>8} {:10.4f} {:10.4f} {:8.2f} {:>10}'.format(Name, str(Numpy.dtype), TimeNumpy, TimeNumba, TimeNumpy/TimeNumba, str(Identical)))
+   return Mismatches
+
+
+if __name__ == '__main__':
+   sys.exit(1 if main(*[ int(Arg) for Arg in sys.argv[1:2] ]) else 0)
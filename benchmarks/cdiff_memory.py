@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Compares the peak memory and the time of metlib.cdiff against the
+             previous implementation based on NaN padding and np.concatenate.
+
+Usage: python benchmarks/cdiff_memory.py
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import time
+import tracemalloc
+import numpy as np
+import metlib
+#-----------------------------------------------------------------------------------------------------------------------------------
+def padded_cdiff(Field, axis):
+   # previous implementation: NaN slab + concatenated copy + subtraction
+   Shape = list(Field.shape)
+   Shape[axis] = 1
+   Nans = np.full(Shape, np.nan)
+   Field = np.concatenate((Nans,Field,Nans), axis=axis)
+   n = Field.shape[axis]
+   Hi = [slice(None)]*Field.ndim
+   Lo = [slice(None)]*Field.ndim
+   Hi[axis] = slice(2, None)
+   Lo[axis] = slice(None, n-2)
+   return Field[tuple(Hi)] - Field[tuple(Lo)]
+
+
+def measure(func, *args, **kwargs):
+   tracemalloc.start()
+   tracemalloc.reset_peak()
+   t0 = time.perf_counter()
+   func(*args, **kwargs)
+   Elapsed = time.perf_counter() - t0
+   Peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   return Elapsed, Peak
+
+
+def main():
+   Shapes = [(721,1440), (37,721,1440), (4,37,361,720)]
+   print('{:>20} {:>4} {:>14} {:>14} {:>14} {:>10} {:>10}'.format('shape', 'dim', 'field [MB]', 'padded [MB]', 'cdiff [MB]', 'padded [s]', 'cdiff [s]'))
+
+   for Shape in Shapes:
+      Field = np.random.default_rng(0).standard_normal(Shape)
+      Out = np.empty_like(Field)
+
+      for Dim in ['X','Y','Z','T'][:Field.ndim]:
+         axis = metlib.functions._cdiff_axis(Field.ndim, Dim)
+         TimeOld, PeakOld = measure(padded_cdiff, Field, axis)
+         TimeNew, PeakNew = measure(metlib.cdiff, Field, Dim)
+         TimeOut, PeakOut = measure(metlib.cdiff, Field, Dim, out=Out)
+
+         print('{:>20} {:>4} {:14.1f} {:14.1f} {:14.1f} {:10.3f} {:10.3f}'.format(
+               str(Shape), Dim, Field.nbytes/2**20, PeakOld/2**20, PeakNew/2**20, TimeOld, TimeNew))
+         print('{:>20} {:>4} {:>14} {:>14} {:14.1f} {:>10} {:10.3f}'.format('', 'out=', '', '', PeakOut/2**20, '', TimeOut))
+
+
+if __name__ == '__main__':
+   main()
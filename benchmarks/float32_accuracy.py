@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Compares the results of metlib with set_options(dtype='float32') against
+             the float64 ones, over synthetic float32 fields on a 1 degree global grid.
+             The error is the difference relative to the RMS of the float64 result.
+
+Usage: python benchmarks/float32_accuracy.py
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import numpy as np
+import metlib
+#-----------------------------------------------------------------------------------------------------------------------------------
+def synthetic_fields(nt=2, Levels=np.array([1000.,925.,850.,700.,500.,300.,250.,200.]), dLon=1.0):
+   # smooth large-scale waves plus small noise, stored in float32 as in ERA5 files
+   Lon = np.arange(0.0, 360.0, dLon)
+   Lat = np.arange(-89.0, 89.0+dLon/2, dLon)
+   Rng = np.random.default_rng(0)
+   Lon3 = np.deg2rad(Lon)[None,None,None,:]
+   Lat3 = np.deg2rad(Lat)[None,None,:,None]
+   Lev3 = Levels[None,:,None,None]
+   Time = np.arange(nt)[:,None,None,None]
+   Shape = (nt, Levels.size, Lat.size, Lon.size)
+
+   Temperature = 300.0*(Lev3/1000.0)**0.2 - 30.0*np.sin(Lat3)**2 + 3.0*np.cos(4*Lon3-0.3*Time)*np.cos(Lat3) + 0.1*Rng.standard_normal(Shape)
+   UComp = 30.0*np.cos(Lat3)**2*(1.0-Lev3/1200.0) + 8.0*np.sin(5*Lon3+Time)*np.cos(2*Lat3) + 0.5*Rng.standard_normal(Shape)
+   VComp = 8.0*np.cos(5*Lon3+Time)*np.cos(Lat3) + 0.5*Rng.standard_normal(Shape)
+
+   return Temperature.astype(np.float32), UComp.astype(np.float32), VComp.astype(np.float32), Lon, Lat, Levels
+
+
+def relative_error(Single, Double):
+   Mask = np.isfinite(Double)
+   Error = np.abs(Single[Mask].astype(np.float64) - Double[Mask])
+   Scale = np.sqrt(np.mean(Double[Mask]**2))
+   return np.median(Error)/Scale, np.max(Error)/Scale
+
+
+def main():
+   Temperature, UComp, VComp, Lon, Lat, Levels = synthetic_fields()
+
+   Diagnostics = [
+      ('cdiff X', lambda: metlib.cdiff(Temperature, 'X')),
+      ('cdiff Z', lambda: metlib.cdiff(Temperature, 'Z')),
+      ('relative_vorticity', lambda: metlib.relative_vorticity(UComp, VComp, Lon, Lat)),
+      ('absolute_vorticity', lambda: metlib.absolute_vorticity(UComp, VComp, Lon, Lat)),
+      ('divergence', lambda: metlib.divergence(UComp, VComp, Lon, Lat)),
+      ('advection', lambda: metlib.advection(Temperature, UComp, VComp, Lon, Lat)),
+      ('potential_temperature', lambda: metlib.potential_temperature(Temperature, Levels)),
+      ('potential_vorticity', lambda: metlib.potential_vorticity(Temperature, UComp, VComp, Lon, Lat, Levels)),
+   ]
+
+   print('{:>24} {:>8} {:>8} {:>14} {:>14}'.format('diagnostic', 'dtype64', 'dtype32', 'median error', 'max error'))
+   for Name, Function in Diagnostics:
+      Double = Function()
+      with metlib.set_options(dtype='float32'):
+         Single = Function()
+      Median, Maximum = relative_error(Single, Double)
+      print('{:>24} {:>8} {:>8} {:14.2e} {:14.2e}'.format(Name, str(Double.dtype), str(Single.dtype), Median, Maximum))
+
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Measures the time to import metlib in a new Python process, with and
+             without xarray. metlib imports xarray only when it receives a Xarray
+             object, so the workers that only use Numpy arrays do not pay for the
+             import of xarray and pandas. "import metlib, xarray" is the time of the
+             previous eager import.
+
+Usage: python benchmarks/import_time.py [repeats]
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import subprocess
+import sys
+import numpy as np
+#-----------------------------------------------------------------------------------------------------------------------------------
+def import_time(Statement, Repeats):
+   # median wall time of Statement in a new process, and if it imported xarray and pandas
+   Code = ('import time; Start = time.perf_counter(); {}; Elapsed = time.perf_counter() - Start; '
+           'import sys; print(Elapsed, "xarray" in sys.modules, "pandas" in sys.modules)').format(Statement)
+   Times = []
+   for i in range(Repeats):
+      Output = subprocess.check_output([sys.executable, '-c', Code]).decode().split()
+      Times.append(float(Output[0]))
+   return np.median(Times), Output[1] == 'True', Output[2] == 'True'
+
+
+def main(Repeats=7):
+   # the first calculation also loads the compute backend, numba with backend='auto'
+   # when it is installed, so it is shown with the 'numpy' backend too
+   Cases = [('import numpy', 'import numpy'),
+            ('import metlib', 'import metlib'),
+            ('import metlib, xarray (eager)', 'import metlib; import xarray'),
+            ('import + first cdiff (numpy)', 'import numpy, metlib; metlib.set_options(backend="numpy"); metlib.cdiff(numpy.ones((3,4)), "X")'),
+            ('import + first cdiff (auto)', 'import numpy, metlib; metlib.cdiff(numpy.ones((3,4)), "X")')]
+
+   print('{:>32} {:>10} {:>8} {:>8}'.format('statement', 'time [ms]', 'xarray', 'pandas'))
+   for Label, Statement in Cases:
+      Elapsed, Xarray, Pandas = import_time(Statement, Repeats)
+      print('{:>32} {:10.1f} {:>8} {:>8}'.format(Label, Elapsed*1e3, str(Xarray), str(Pandas)))
+
+
+if __name__ == '__main__':
+   main(*[ int(Arg) for Arg in sys.argv[1:2] ])
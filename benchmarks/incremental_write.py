@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Peak memory and time to calculate diagnostics of a netCDF file and write
+             them, loading the whole file and writing the result with to_netcdf,
+             against metlib.write of the time steps of metlib.stream (and of the
+             planner, one time step at a time). With metlib.write only one time
+             step of the inputs and the results is in memory. The last case adds the
+             zlib compression of level 1. The files are written in a temporary
+             directory.
+
+Usage: python benchmarks/incremental_write.py [grid spacing] [levels] [times]
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import xarray as xr
+import metlib
+from suite import synthetic_fields, as_dataarrays
+#-----------------------------------------------------------------------------------------------------------------------------------
+Diagnostics = ['vor', 'div', 'adv_t', 'pv']
+
+
+def measure(Function):
+   tracemalloc.start()
+   Start = time.perf_counter()
+   Function()
+   Elapsed = time.perf_counter() - Start
+   Peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   return Elapsed, Peak
+
+
+def whole(Input, Output):
+   with xr.open_dataset(Input) as Data:
+      Results = metlib.compute(Data.load(), Diagnostics)
+   Results.to_netcdf(Output)
+
+
+def streamed(Input, Output):
+   Functions = {'vor': lambda ds: metlib.relative_vorticity(ds.u, ds.v),
+                'div': lambda ds: metlib.divergence(ds.u, ds.v),
+                'adv_t': lambda ds: metlib.advection(ds.t, ds.u, ds.v),
+                'pv': lambda ds: metlib.potential_vorticity(ds.t, ds.u, ds.v)}
+   with xr.open_dataset(Input) as Data:
+      metlib.write(metlib.stream(Data, Functions), Output)
+
+
+def planned(Input, Output, Compression=None):
+   with xr.open_dataset(Input) as Data:
+      Steps = ( metlib.compute(Data.isel(time=slice(i, i+1)).load(), Diagnostics) for i in range(Data.sizes['time']) )
+      metlib.write(Steps, Output, Compression=Compression, Level=1)
+
+
+def main(dLon=1.0, nz=16, nt=8):
+   Temperature, UComp, VComp, Lon, Lat, Levels = synthetic_fields(dLon, nz, nt)
+   Data = xr.Dataset(dict( (Field.name, Field) for Field in as_dataarrays(Temperature, UComp, VComp, Lon, Lat, Levels) ))
+   del Temperature, UComp, VComp
+
+   with tempfile.TemporaryDirectory() as Directory:
+      Input = os.path.join(Directory, 'input.nc')
+      Data.to_netcdf(Input)
+      print('input: {:.1f} MB, {} time steps'.format(Data.nbytes/2.0**20, nt))
+      del Data
+
+      print('{:>32} {:>10} {:>10} {:>12}'.format('method', 'time [s]', 'peak [MB]', 'output [MB]'))
+      for Label, Function in [('load + compute + to_netcdf', whole),
+                              ('write(stream(...))', streamed),
+                              ('write(compute of each step)', planned),
+                              ('write(..., Compression=zlib)', lambda Input, Output: planned(Input, Output, 'zlib'))]:
+         Output = os.path.join(Directory, 'output.nc')
+         Elapsed, Peak = measure(lambda: Function(Input, Output))
+         print('{:>32} {:10.2f} {:10.1f} {:12.1f}'.format(Label, Elapsed, Peak/2.0**20, os.path.getsize(Output)/2.0**20))
+         os.remove(Output)
+
+
+if __name__ == '__main__':
+   main(*[ float(Arg) if i == 0 else int(Arg) for i, Arg in enumerate(sys.argv[1:4]) ])
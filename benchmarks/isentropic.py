@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Time of isentropic_interpolate of the potential vorticity to isentropic
+             surfaces against a loop that interpolates each column alone (np.interp,
+             timed over a sample of columns and scaled to the whole grid), and time and
+             peak memory (tracemalloc, without the inputs) of the potential vorticity
+             computed on the levels and then interpolated against the option isentropes
+             of potential_vorticity, which interpolates it while it is computed.
+
+Usage: python benchmarks/isentropic.py [grid spacing] [levels] [times]
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import sys
+import time
+import tracemalloc
+import numpy as np
+import metlib
+from suite import synthetic_fields
+#-----------------------------------------------------------------------------------------------------------------------------------
+def measure(Function):
+   tracemalloc.start()
+   Start = time.perf_counter()
+   Result = Function()
+   Elapsed = time.perf_counter() - Start
+   Peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   return Result, Elapsed, Peak
+
+
+def columns(Field, Theta, Targets, Sample):
+   # the usual loop over the columns, with the levels sorted by potential temperature
+   Field = Field.reshape((Field.shape[0], -1))
+   Theta = Theta.reshape((Theta.shape[0], -1))
+   Result = np.empty((len(Targets), Sample))
+   for i in range(Sample):
+      Order = np.argsort(Theta[:,i])
+      Result[:,i] = np.interp(Targets, Theta[Order,i], Field[Order,i], left=np.nan, right=np.nan)
+   return Result
+
+
+def main(dLon=0.25, nz=37, nt=1):
+   Temperature, UComp, VComp, Lon, Lat, Levels = synthetic_fields(dLon, nz, nt)
+   Grid = metlib.grid_metrics(Lon, Lat, periodic_x=True)
+   Targets = [300.0, 315.0, 330.0, 350.0]
+   print('fields: {}, {:.1f} MB'.format('x'.join([ str(n) for n in Temperature.shape ]), Temperature.nbytes/1e6))
+
+   PVor = metlib.potential_vorticity(Temperature, UComp, VComp, Levels=Levels, Grid=Grid)
+   PTemp = metlib.potential_temperature(Temperature, Levels=Levels)
+
+   Vectorized = measure(lambda: metlib.isentropic_interpolate(PVor, PTemp, Targets))[1]
+   Sample = min(20000, Temperature.shape[-1]*Temperature.shape[-2])
+   Start = time.perf_counter()
+   columns(PVor[(0,)*(PVor.ndim-3)], PTemp[(0,)*(PTemp.ndim-3)], Targets, Sample)
+   Loop = (time.perf_counter() - Start)*PVor.size/PVor.shape[-3]/Sample
+   print('{:>34} {:10.3f} s'.format('isentropic_interpolate', Vectorized))
+   print('{:>34} {:10.3f} s  (estimated from {} columns)'.format('loop over the columns', Loop, Sample))
+   del PVor, PTemp
+
+   print('{:>34} {:>10} {:>12}'.format('potential vorticity on isentropes', 'time [s]', 'peak [MB]'))
+   Unfused = lambda: metlib.isentropic_interpolate(metlib.potential_vorticity(Temperature, UComp, VComp, Levels=Levels, Grid=Grid),
+                                                   metlib.potential_temperature(Temperature, Levels=Levels), Targets)
+   Fused = lambda: metlib.potential_vorticity(Temperature, UComp, VComp, Levels=Levels, Grid=Grid, isentropes=Targets)
+   for Name, Function in [('levels, then interpolated', Unfused), ('isentropes option', Fused)]:
+      Result, Elapsed, Peak = measure(Function)
+      print('{:>34} {:10.3f} {:12.1f}'.format(Name, Elapsed, Peak/1e6))
+
+
+if __name__ == '__main__':
+   main(*[ float(Arg) if i == 0 else int(Arg) for i, Arg in enumerate(sys.argv[1:4]) ])
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Peak memory and time of metlib over raw binary files opened with
+             np.memmap and results written in np.memmap, against the same fields
+             in memory. The files are written in a temporary directory (about
+             5 times the size of one field). With np.memmap the leading axes are
+             processed in slabs of the option slab_size, so the peak memory is set
+             by the slabs and not by the size of the files.
+
+Usage: python benchmarks/memmap_slabs.py [grid spacing] [levels] [times] [slab MB]
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import metlib
+from suite import synthetic_fields
+#-----------------------------------------------------------------------------------------------------------------------------------
+def measure(Function):
+   tracemalloc.start()
+   Start = time.perf_counter()
+   Result = Function()
+   Elapsed = time.perf_counter() - Start
+   Peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   del Result
+   return Elapsed, Peak
+
+
+def memmap(Directory, Name, Array=None, Shape=None, dtype=None):
+   # raw binary file with Array, or a new file of Shape for a result
+   Path = os.path.join(Directory, Name)
+   if Array is None:
+      return np.memmap(Path, dtype=dtype, mode='w+', shape=Shape)
+   File = np.memmap(Path, dtype=Array.dtype, mode='w+', shape=Array.shape)
+   File[:] = Array
+   File.flush()
+   del File
+   return np.memmap(Path, dtype=Array.dtype, mode='r', shape=Array.shape)
+
+
+def main(dLon=0.5, nz=37, nt=8, SlabMB=64):
+   Temperature, UComp, VComp, Lon, Lat, Levels = synthetic_fields(dLon, nz, nt)
+   Grid = metlib.grid_metrics(Lon, Lat)
+   print('fields of {} x {} x {} x {} float32: {:.0f} MB each, slab_size {} MB'.format(nt, nz, Lat.size, Lon.size, Temperature.nbytes/2.0**20, SlabMB))
+
+   with tempfile.TemporaryDirectory() as Directory:
+      TFile, UFile, VFile = [ memmap(Directory, Name, Array) for Name, Array in [('t', Temperature), ('u', UComp), ('v', VComp)] ]
+      Out = memmap(Directory, 'out', Shape=Temperature.shape, dtype=np.float64)
+
+      Cases = [
+         ('cdiff Z', lambda: metlib.cdiff(Temperature, 'Z'), lambda: metlib.cdiff(TFile, 'Z', out=Out)),
+         ('relative_vorticity', lambda: metlib.relative_vorticity(UComp, VComp, Grid=Grid), lambda: metlib.relative_vorticity(UFile, VFile, Grid=Grid, out=Out)),
+         ('advection', lambda: metlib.advection(Temperature, UComp, VComp, Grid=Grid), lambda: metlib.advection(TFile, UFile, VFile, Grid=Grid, out=Out)),
+         ('potential_vorticity', lambda: metlib.potential_vorticity(Temperature, UComp, VComp, Grid=Grid, Levels=Levels),
+                                 lambda: metlib.potential_vorticity(TFile, UFile, VFile, Grid=Grid, Levels=Levels, out=Out)),
+      ]
+
+      print('{:>22} {:>12} {:>12} {:>14} {:>14}'.format('diagnostic', 'memory [s]', 'memmap [s]', 'memory [MB]', 'memmap [MB]'))
+      for Name, InMemory, OutOfCore in Cases:
+         TimeMemory, PeakMemory = measure(InMemory)
+         with metlib.set_options(slab_size=SlabMB*2**20):
+            TimeFile, PeakFile = measure(OutOfCore)
+         print('{:>22} {:12.3f} {:12.3f} {:14.1f} {:14.1f}'.format(Name, TimeMemory, TimeFile, PeakMemory/2.0**20, PeakFile/2.0**20))
+
+      del TFile, UFile, VFile, Out
+
+
+if __name__ == '__main__':
+   main(*[ float(Arg) if i == 0 else int(Arg) for i, Arg in enumerate(sys.argv[1:5]) ])
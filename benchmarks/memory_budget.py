@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Predicted peak memory of memory_plan against the peak measured with
+             tracemalloc (result plus temporaries, the inputs are not included) and
+             time of the 4D diagnostics with several values of the option max_memory.
+             The budgets are fractions of the peak of the calculation at once, and the
+             calculations keep the dtype of the fields (option dtype).
+
+Usage: python benchmarks/memory_budget.py [grid spacing] [levels] [times] [backend]
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import sys
+import time
+import tracemalloc
+import metlib
+from suite import synthetic_fields
+#-----------------------------------------------------------------------------------------------------------------------------------
+def measure(Function):
+   Function()   # warm up (e.g. grid metrics and numba compilation)
+   tracemalloc.start()
+   Start = time.perf_counter()
+   Function()
+   Elapsed = time.perf_counter() - Start
+   Peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   return Elapsed, Peak
+
+
+def main(dLon=1.0, nz=16, nt=4, Backend='auto'):
+   Temperature, UComp, VComp, Lon, Lat, Levels = synthetic_fields(dLon, nz, nt)
+   Cases = [('relative_vorticity', lambda: metlib.relative_vorticity(UComp, VComp, Lon=Lon, Lat=Lat, periodic_x=True)),
+            ('wind_gradients', lambda: metlib.wind_gradients(UComp, VComp, Lon=Lon, Lat=Lat, periodic_x=True)),
+            ('advection', lambda: metlib.advection(Temperature, UComp, VComp, Lon=Lon, Lat=Lat, periodic_x=True)),
+            ('potential_vorticity', lambda: metlib.potential_vorticity(Temperature, UComp, VComp, Lon=Lon, Lat=Lat, Levels=Levels, periodic_x=True))]
+
+   print('fields: {}, {:.1f} MB'.format('x'.join([ str(n) for n in Temperature.shape ]), Temperature.nbytes/1e6))
+   print('{:>20} {:>12} {:>8} {:>14} {:>14} {:>10}'.format('function', 'budget [MB]', 'blocks', 'predicted [MB]', 'measured [MB]', 'time [s]'))
+   with metlib.set_options(backend=Backend, dtype=Temperature.dtype):
+      for Name, Function in Cases:
+         Whole = metlib.memory_plan(Name, Temperature.shape, Temperature.dtype).peak
+         for Fraction in [None, 0.75, 0.5, 0.25]:
+            Budget = None if Fraction is None else int(Whole*Fraction)
+            with metlib.set_options(max_memory=Budget):
+               Plan = metlib.memory_plan(Name, Temperature.shape, Temperature.dtype)
+               Elapsed, Peak = measure(Function)
+            print('{:>20} {:>12} {:>8} {:14.1f} {:14.1f} {:10.4f}{}'.format(Name, '-' if Budget is None else '{:.1f}'.format(Budget/1e6), len(Plan.blocks),
+                                                                          Plan.peak/1e6, Peak/1e6, Elapsed, '' if Plan.fits else '  (does not fit)'))
+
+
+if __name__ == '__main__':
+   main(*[ float(Arg) if i == 0 else (int(Arg) if i < 3 else Arg) for i, Arg in enumerate(sys.argv[1:5]) ])
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Time of streamfunction and velocity_potential over all the levels and
+             times at once against a loop that solves each level alone, and their
+             error relative to the exact inverse Laplacian of a spherical harmonic
+             (sin(lat)*cos(lat)**2*cos(2*lon), with Laplacian -12/a**2 times itself)
+             on a grid from pole to pole.
+
+Usage: python benchmarks/poisson.py [grid spacing] [levels] [times]
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import sys
+import time
+import numpy as np
+import metlib
+from suite import synthetic_fields
+#-----------------------------------------------------------------------------------------------------------------------------------
+def elapsed(Function):
+   Start = time.perf_counter()
+   Function()
+   return time.perf_counter() - Start
+
+
+def main(dLon=0.25, nz=37, nt=1):
+   Temperature, UComp, VComp, Lon, Lat, Levels = synthetic_fields(dLon, nz, nt)
+   Grid = metlib.grid_metrics(Lon, Lat, periodic_x=True)
+   Vorticity = metlib.relative_vorticity(UComp, VComp, Grid=Grid)
+   Divergence = metlib.divergence(UComp, VComp, Grid=Grid)
+   del Temperature, UComp, VComp
+   print('fields: {}, {:.1f} MB'.format('x'.join([ str(n) for n in Vorticity.shape ]), Vorticity.nbytes/1e6))
+
+   Build = elapsed(lambda: metlib.streamfunction(Vorticity[(0,)*(Vorticity.ndim-2)], Grid=Grid))
+   print('{:>20} {:>14} {:>16}'.format('function', 'all levels [s]', 'level by level [s]'))
+   for Name, Function, Field in [('streamfunction', metlib.streamfunction, Vorticity), ('velocity_potential', metlib.velocity_potential, Divergence)]:
+      Batched = elapsed(lambda: Function(Field, Grid=Grid))
+      Flat = Field.reshape((-1,)+Field.shape[-2:])
+      Loop = elapsed(lambda: [ Function(Flat[i], Grid=Grid) for i in range(Flat.shape[0]) ])
+      print('{:>20} {:14.3f} {:16.3f}'.format(Name, Batched, Loop))
+   print('first call of the grid (elimination of the systems in latitude): {:.3f} s'.format(Build))
+
+   # error of the solver against the exact solution
+   Lat = np.linspace(-90.0, 90.0, int(round(180.0/dLon))+1)
+   Lon2, Lat2 = np.meshgrid(np.deg2rad(Lon), np.deg2rad(Lat))
+   Exact = np.sin(Lat2)*np.cos(Lat2)**2*np.cos(2*Lon2)
+   Solution = metlib.streamfunction(-12.0/6.37e6**2*Exact, Lon=Lon, Lat=Lat)
+   print('max error relative to the exact solution: {:.2e}'.format(np.abs(Solution-Exact).max()/np.abs(Exact).max()))
+
+
+if __name__ == '__main__':
+   main(*[ float(Arg) if i == 0 else int(Arg) for i, Arg in enumerate(sys.argv[1:4]) ])
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Time and peak memory of the dynamic calcs over the whole globe against
+             the option region over a window (South America by default), and the
+             maximum difference between the window of the global result and the
+             regional one (it must be 0).
+
+Usage: python benchmarks/region.py [grid spacing] [levels] [times] [lon_min lon_max lat_min lat_max]
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import sys
+import time
+import tracemalloc
+import numpy as np
+import metlib
+from suite import synthetic_fields
+#-----------------------------------------------------------------------------------------------------------------------------------
+def measure(Function):
+   Function()   # warm up (e.g. grid metrics and numba compilation)
+   tracemalloc.start()
+   Start = time.perf_counter()
+   Result = Function()
+   Elapsed = time.perf_counter() - Start
+   Peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   return Result, Elapsed, Peak
+
+
+def main(dLon=0.25, nz=8, nt=2, Region=(-90.0, -30.0, -60.0, 15.0)):
+   Temperature, UComp, VComp, Lon, Lat, Levels = synthetic_fields(dLon, nz, nt)
+   Cases = [('relative_vorticity', lambda **kw: metlib.relative_vorticity(UComp, VComp, Lon=Lon, Lat=Lat, periodic_x=True, **kw)),
+            ('divergence', lambda **kw: metlib.divergence(UComp, VComp, Lon=Lon, Lat=Lat, periodic_x=True, **kw)),
+            ('advection', lambda **kw: metlib.advection(Temperature, UComp, VComp, Lon=Lon, Lat=Lat, periodic_x=True, **kw)),
+            ('potential_vorticity', lambda **kw: metlib.potential_vorticity(Temperature, UComp, VComp, Lon=Lon, Lat=Lat, Levels=Levels, periodic_x=True, **kw))]
+
+   Columns = np.flatnonzero((Lon - Region[0]) % 360.0 <= (Region[1] - Region[0]) % 360.0)
+   Rows = np.flatnonzero((Lat >= Region[2]) & (Lat <= Region[3]))
+   print('grid: {} x {}, region {}: {} x {} ({:.1f}% of the points)'.format(len(Lat), len(Lon), Region, len(Rows), len(Columns),
+                                                                       100.0*len(Rows)*len(Columns)/(len(Lat)*len(Lon))))
+   print('{:>20} {:>12} {:>12} {:>12} {:>12} {:>10}'.format('function', 'global [s]', 'region [s]', 'global [MB]', 'region [MB]', 'max diff'))
+   for Name, Function in Cases:
+      Global, GlobalTime, GlobalPeak = measure(Function)
+      Window, RegionTime, RegionPeak = measure(lambda: Function(region=Region))
+      Difference = np.nanmax(np.abs(Global[..., Rows[0]:Rows[-1]+1, :][..., Columns] - Window))
+      print('{:>20} {:12.4f} {:12.4f} {:12.1f} {:12.1f} {:10.1e}'.format(Name, GlobalTime, RegionTime, GlobalPeak/2.0**20, RegionPeak/2.0**20, Difference))
+
+
+if __name__ == '__main__':
+   Args = sys.argv[1:]
+   main(*([ float(Arg) if i == 0 else int(Arg) for i, Arg in enumerate(Args[:3]) ] + ([tuple( float(Arg) for Arg in Args[3:7] )] if len(Args) >= 7 else [])))
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Accuracy and cost of the orders of the centered differences (order=2, 4
+             and 6) in metlib.advection, over an analytic field on global grids from
+             1 to 0.1 degrees. The error is the maximum difference with the analytic
+             advection relative to its maximum, between 80S and 80N.
+
+Usage: python benchmarks/stencil_order.py
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import time
+import tracemalloc
+import numpy as np
+import metlib
+#-----------------------------------------------------------------------------------------------------------------------------------
+Radius = 6.37e6
+Waves = 12
+
+
+def analytic(dLon):
+   # T = sin(m*lon)*cos(lat)**2 advected by a constant wind of 10 m/s in x and 5 m/s in y
+   Lon = np.arange(0.0, 360.0, dLon)
+   Lat = np.arange(-89.0, 89.0+dLon/2, dLon)
+   Lon2, Lat2 = np.meshgrid(np.deg2rad(Lon), np.deg2rad(Lat))
+   Temperature = np.sin(Waves*Lon2)*np.cos(Lat2)**2
+   UComp = np.full(Temperature.shape, 10.0)
+   VComp = np.full(Temperature.shape, 5.0)
+
+   dTdLon = Waves*np.cos(Waves*Lon2)*np.cos(Lat2)**2
+   dTdLat = -2.0*np.sin(Waves*Lon2)*np.cos(Lat2)*np.sin(Lat2)
+   Advection = -(UComp*dTdLon/(Radius*np.cos(Lat2)) + VComp*dTdLat/Radius)
+
+   return Temperature, UComp, VComp, Lon, Lat, Advection
+
+
+def main():
+   print('{:>6} {:>6} {:>14} {:>10} {:>10}'.format('grid', 'order', 'max rel error', 'time [s]', 'peak [MB]'))
+   for dLon in [1.0, 0.5, 0.25, 0.1]:
+      Temperature, UComp, VComp, Lon, Lat, Exact = analytic(dLon)
+      Band = np.abs(Lat) <= 80.0
+      for Order in [2, 4, 6]:
+         Grid = metlib.grid_metrics(Lon, Lat, periodic_x=True, order=Order)
+         metlib.advection(Temperature, UComp, VComp, Grid=Grid)   # warm up (e.g. numba compilation)
+
+         tracemalloc.start()
+         Start = time.perf_counter()
+         Advection = metlib.advection(Temperature, UComp, VComp, Grid=Grid)
+         Elapsed = time.perf_counter() - Start
+         Peak = tracemalloc.get_traced_memory()[1]
+         tracemalloc.stop()
+
+         Error = np.nanmax(np.abs(Advection[Band]-Exact[Band]))/np.abs(Exact[Band]).max()
+         print('{:>6} {:>6} {:14.2e} {:10.4f} {:10.1f}'.format(dLon, Order, Error, Elapsed, Peak/2.0**20))
+
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Benchmark suite of the public diagnostics of metlib. It runs every
+             diagnostic over synthetic global grids (1, 0.25 and 0.1 degrees, 1 to 37
+             levels and 1 to 24 times) with Numpy and Xarray inputs, and records the
+             wall time and the peak memory of each case. The results can be saved in
+             a JSON file and compared against a previous run to catch regressions.
+
+             The functions of metlib.__all__ without calculations (set_options,
+             get_options, register_backend and available_backends) are not timed.
+
+Usage: python benchmarks/suite.py [--suite quick|default|full] [--only NAME ...]
+                                  [--json FILE] [--compare FILE] [--tolerance 0.25]
+
+e.g.:  python benchmarks/suite.py --suite quick --json base.json
+       python benchmarks/suite.py --suite quick --compare base.json
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import xarray as xr
+import metlib
+#-----------------------------------------------------------------------------------------------------------------------------------
+# ERA5 pressure levels, the cases with n levels use the first n
+Era5Levels = np.array([1000., 975., 950., 925., 900., 875., 850., 825., 800., 775., 750., 700., 650.,
+                       600., 550., 500., 450., 400., 350., 300., 250., 225., 200., 175., 150., 125.,
+                       100., 70., 50., 30., 20., 10., 7., 5., 3., 2., 1.])
+
+# (grid spacing in degrees, levels, times)
+Suites = {'quick': [ (1.0, nz, nt) for nz in [1, 8] for nt in [1, 2] ],
+          'default': [ (dLon, nz, nt) for dLon in [1.0, 0.25, 0.1] for nz in [1, 37] for nt in [1, 24] ],
+          'full': [ (dLon, nz, nt) for dLon in [1.0, 0.25, 0.1] for nz in [1, 8, 37] for nt in [1, 4, 24] ]}
+
+# rough peak of a case in bytes per grid point (float32 inputs, float64 results and temporaries),
+# the cases above max-memory are skipped
+BytesPerPoint = 64
+#-----------------------------------------------------------------------------------------------------------------------------------
+def synthetic_fields(dLon, nz, nt):
+   # smooth large-scale waves plus small noise in float32 as in reanalysis files,
+   # generated time by time to keep the memory close to the size of the fields
+   Lon = np.arange(0.0, 360.0, dLon)
+   Lat = np.linspace(-89.0, 89.0, int(round(178.0/dLon))+1)
+   Levels = Era5Levels[:nz]
+   Rng = np.random.default_rng(0)
+   Lon3 = np.deg2rad(Lon)[None,None,:]
+   Lat3 = np.deg2rad(Lat)[None,:,None]
+   Lev3 = Levels[:,None,None]
+   Shape = (nt, nz, Lat.size, Lon.size)
+
+   Temperature = np.empty(Shape, dtype=np.float32)
+   UComp = np.empty(Shape, dtype=np.float32)
+   VComp = np.empty(Shape, dtype=np.float32)
+   for t in range(nt):
+      Temperature[t] = 300.0*(Lev3/1000.0)**0.2 - 30.0*np.sin(Lat3)**2 + 3.0*np.cos(4*Lon3-0.3*t)*np.cos(Lat3) + 0.1*Rng.standard_normal(Shape[1:], dtype=np.float32)
+      UComp[t] = 30.0*np.cos(Lat3)**2*(1.0-Lev3/1200.0) + 8.0*np.sin(5*Lon3+t)*np.cos(2*Lat3) + 0.5*Rng.standard_normal(Shape[1:], dtype=np.float32)
+      VComp[t] = 8.0*np.cos(5*Lon3+t)*np.cos(Lat3) + 0.5*Rng.standard_normal(Shape[1:], dtype=np.float32)
+
+   return Temperature, UComp, VComp, Lon, Lat, Levels
+
+
+def as_dataarrays(Temperature, UComp, VComp, Lon, Lat, Levels):
+   Coords = {'time': np.arange(Temperature.shape[0]), 'level': Levels, 'lat': Lat, 'lon': Lon}
+   Dims = ['time', 'level', 'lat', 'lon']
+   return [ xr.DataArray(Field, coords=Coords, dims=Dims, name=Name, attrs={'units': Units})
+            for Field, Name, Units in [(Temperature, 't', 'K'), (UComp, 'u', 'm s**-1'), (VComp, 'v', 'm s**-1')] ]
+
+
+def cases(Kind, Temperature, UComp, VComp, Lon, Lat, Levels):
+   # name -> function without arguments of each benchmark
+   if Kind == 'numpy':
+      Coords = (Lon, Lat)
+      PCoords = (Lon, Lat, Levels)
+      PTLevels = (Levels,)
+   else:
+      Temperature, UComp, VComp = as_dataarrays(Temperature, UComp, VComp, Lon, Lat, Levels)
+      Coords = PCoords = PTLevels = ()
+
+   # t, u and v advected by the same wind in one call
+   if Kind == 'numpy':
+      Tracers = np.stack([Temperature, UComp, VComp])
+   else:
+      Tracers = xr.Dataset({'t': Temperature, 'u': UComp, 'v': VComp})
+
+   Cases = [
+      ('cdiff X', lambda: metlib.cdiff(Temperature, 'X')),
+      ('cdiff Y', lambda: metlib.cdiff(Temperature, 'Y')),
+      ('cdiff Z', lambda: metlib.cdiff(Temperature, 'Z')),
+      ('cdiff T', lambda: metlib.cdiff(Temperature, 'T')),
+      ('relative_vorticity', lambda: metlib.relative_vorticity(UComp, VComp, *Coords)),
+      ('absolute_vorticity', lambda: metlib.absolute_vorticity(UComp, VComp, *Coords)),
+      ('divergence', lambda: metlib.divergence(UComp, VComp, *Coords)),
+      ('wind_gradients', lambda: metlib.wind_gradients(UComp, VComp, *Coords)),
+      ('advection', lambda: metlib.advection(Temperature, UComp, VComp, *Coords)),
+      ('batch_advection', lambda: metlib.batch_advection(Tracers, UComp, VComp, *Coords)),
+      ('potential_temperature', lambda: metlib.potential_temperature(Temperature, *PTLevels)),
+      ('potential_vorticity', lambda: metlib.potential_vorticity(Temperature, UComp, VComp, *PCoords)),
+   ]
+
+   # vor, div, adv_t and pv in one call of the planner, against the same diagnostics in separate calls
+   Planned = ['vor', 'div', 'adv_t', 'pv']
+   if Kind == 'numpy':
+      Cases += [
+         ('compute', lambda: metlib.compute({'t': Temperature, 'u': UComp, 'v': VComp}, Planned, Lon=Lon, Lat=Lat, Levels=Levels)),
+      ]
+   else:
+      Cases += [
+         ('compute', lambda: metlib.compute(xr.Dataset({'t': Temperature, 'u': UComp, 'v': VComp}), Planned)),
+      ]
+
+   if Kind == 'numpy':
+      Cases += [
+         ('GridMetrics', lambda: metlib.GridMetrics(Lon, Lat)),
+         ('grid_metrics', lambda: metlib.grid_metrics(Lon, Lat)),
+      ]
+   else:
+      Data = xr.Dataset({'t': Temperature, 'u': UComp, 'v': VComp})
+      Diagnostics = {'vor': lambda ds: metlib.relative_vorticity(ds.u, ds.v),
+                     'pv': lambda ds: metlib.potential_vorticity(ds.t, ds.u, ds.v)}
+      Cases += [
+         ('stream', lambda: [ Step for Step in metlib.stream(Data, Diagnostics) ]),
+      ]
+
+   return Cases
+
+
+def measure(Function, Repeats):
+   # best wall time of Repeats calls, and peak memory traced in one more call
+   Times = []
+   for i in range(Repeats):
+      Start = time.perf_counter()
+      Result = Function()
+      Times.append(time.perf_counter()-Start)
+      del Result
+
+   tracemalloc.start()
+   tracemalloc.reset_peak()
+   Result = Function()
+   Peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   del Result
+
+   return min(Times), Peak
+
+
+def run(Suite, Kinds, Only, Repeats, MaxMemory):
+   Results = []
+   print('{:>6} {:>4} {:>4} {:>7} {:>22} {:>10} {:>12} {:>10}'.format('grid', 'nz', 'nt', 'input', 'diagnostic', 'time [s]', 'peak [MB]', 'MB/s'))
+
+   for dLon, nz, nt in Suites[Suite]:
+      ny, nx = int(round(178.0/dLon))+1, int(round(360.0/dLon))
+      Points = nt*nz*ny*nx
+      if Points*BytesPerPoint > MaxMemory:
+         print('{:>6} {:>4} {:>4} skipped, it needs ~{:.1f} GB (see --max-memory)'.format(dLon, nz, nt, Points*BytesPerPoint/2.0**30))
+         continue
+
+      Fields = synthetic_fields(dLon, nz, nt)
+      Bytes = Fields[0].nbytes
+
+      for Kind in Kinds:
+         for Name, Function in cases(Kind, *Fields):
+            if Only and Name.split()[0] not in Only:
+               continue
+            Elapsed, Peak = measure(Function, Repeats)
+            Results.append({'name': Name, 'input': Kind, 'grid': dLon, 'levels': nz, 'times': nt,
+                            'time': Elapsed, 'peak': Peak, 'bytes': Bytes})
+            print('{:>6} {:>4} {:>4} {:>7} {:>22} {:10.4f} {:12.1f} {:10.1f}'.format(dLon, nz, nt, Kind, Name, Elapsed, Peak/2.0**20, Bytes/2.0**20/max(Elapsed, 1e-9)))
+            sys.stdout.flush()
+
+      del Fields
+
+   return Results
+
+
+def compare(Results, Path, Tolerance):
+   # cases slower or with a larger peak memory than the baseline by more than Tolerance
+   with open(Path) as File:
+      Baseline = dict( ((Case['name'], Case['input'], Case['grid'], Case['levels'], Case['times']), Case) for Case in json.load(File)['results'] )
+
+   Regressions = 0
+   for Case in Results:
+      Old = Baseline.get((Case['name'], Case['input'], Case['grid'], Case['levels'], Case['times']))
+      if Old is None:
+         continue
+      for Key, Unit, Scale in [('time', 's', 1.0), ('peak', 'MB', 2.0**20)]:
+         if Case[Key] > Old[Key]*(1.0+Tolerance) and Case[Key]-Old[Key] > 0.001*Scale:
+            Regressions += 1
+            print('REGRESSION {} {} grid={} nz={} nt={}: {} {:.4g} -> {:.4g} {}'.format(Case['name'], Case['input'], Case['grid'], Case['levels'], Case['times'],
+                                                                                        Key, Old[Key]/Scale, Case[Key]/Scale, Unit))
+   print('{} regressions against {}'.format(Regressions, Path))
+   return Regressions
+
+
+def main(argv=None):
+
+   Parser = argparse.ArgumentParser(description='Benchmark suite of the diagnostics of metlib')
+   Parser.add_argument('--suite', choices=sorted(Suites), default='default', help='grid sizes of the cases (default: default)')
+   Parser.add_argument('--input', choices=['numpy', 'xarray', 'both'], default='both', help='type of the inputs (default: both)')
+   Parser.add_argument('--only', nargs='+', default=None, metavar='NAME', help='run only these diagnostics, e.g. cdiff potential_vorticity')
+   Parser.add_argument('--repeat', type=int, default=3, help='timed calls of each case, the best is reported (default: 3)')
+   Parser.add_argument('--max-memory', type=float, default=4.0, help='skip the cases that need more GB than this (default: 4)')
+   Parser.add_argument('--json', default=None, metavar='FILE', help='save the results in FILE')
+   Parser.add_argument('--compare', default=None, metavar='FILE', help='compare against the results saved in FILE, exit code 1 if there are regressions')
+   Parser.add_argument('--tolerance', type=float, default=0.25, help='relative increase reported as a regression (default: 0.25)')
+   Args = Parser.parse_args(argv)
+
+   Kinds = ['numpy', 'xarray'] if Args.input == 'both' else [Args.input]
+   Results = run(Args.suite, Kinds, Args.only, max(Args.repeat, 1), Args.max_memory*2.0**30)
+
+   if Args.json is not None:
+      with open(Args.json, 'w') as File:
+         json.dump({'metlib': metlib.__version__, 'numpy': np.__version__, 'xarray': xr.__version__,
+                    'python': platform.python_version(), 'machine': platform.machine(),
+                    'options': dict( (Key, str(Value)) for Key, Value in metlib.get_options().items() ),
+                    'results': Results}, File, indent=1)
+
+   if Args.compare is not None:
+      return 1 if compare(Results, Args.compare, Args.tolerance) > 0 else 0
+
+   return 0
+
+
+if __name__ == '__main__':
+   sys.exit(main())
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Time and peak memory of the centered time tendency of a series of time
+             steps with TimeTendency, that receives one time step at a time and keeps
+             three of them, against cdiff(Field, 'T') over the whole series in memory.
+             The time of each push of TimeTendency is shown for the first and last
+             steps, to check that it does not grow with the number of steps.
+
+Usage: python benchmarks/time_tendency.py [grid spacing] [levels] [times]
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import sys
+import time
+import tracemalloc
+import numpy as np
+import metlib
+from suite import synthetic_fields
+#-----------------------------------------------------------------------------------------------------------------------------------
+def main(dLon=1.0, nz=16, nt=24):
+   Temperature = synthetic_fields(dLon, nz, nt)[0]
+   dt = 3600.0
+   print('field of one time step: {:.1f} MB, {} time steps'.format(Temperature[0].nbytes/2.0**20, nt))
+
+   tracemalloc.start()
+   Start = time.perf_counter()
+   Tendency = metlib.cdiff(Temperature, 'T')/(2.0*dt)
+   Elapsed = time.perf_counter() - Start
+   Peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   del Tendency
+   print('{:>32} {:10.3f} s {:10.1f} MB'.format("cdiff(Field, 'T') of the series", Elapsed, Peak/2.0**20))
+
+   Tend = metlib.TimeTendency(dt=dt)
+   Times = []
+   tracemalloc.start()
+   Start = time.perf_counter()
+   for i in range(nt):
+      Step = time.perf_counter()
+      Tendency = Tend.push(Temperature[i])
+      Times.append(time.perf_counter() - Step)
+      del Tendency
+   Elapsed = time.perf_counter() - Start
+   Peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   print('{:>32} {:10.3f} s {:10.1f} MB'.format('TimeTendency.push of each step', Elapsed, Peak/2.0**20))
+   print('time of push: steps 3-5 {:.2f} ms, last 3 steps {:.2f} ms'.format(np.mean(Times[2:5])*1e3, np.mean(Times[-3:])*1e3))
+
+
+if __name__ == '__main__':
+   main(*[ float(Arg) if i == 0 else int(Arg) for i, Arg in enumerate(sys.argv[1:4]) ])
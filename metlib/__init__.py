@@ -1,7 +1,25 @@
 name = "metlib"
+import sys
 from .functions import *
+from .stream import stream, TimeTendency
+from .planner import compute
+from .poisson import streamfunction, velocity_potential
+from .isentropic import isentropic_interpolate
+from .writer import write
+from .options import set_options, get_options
+from .memory import memory_plan, MemoryPlan
+from .backends import register_backend, available_backends
+from .profiling import profile
+# the accessor .metlib needs xarray, so it is registered here only if xarray was
+# imported before metlib (otherwise with the first Xarray object, or import metlib.accessor)
+if 'xarray' in sys.modules:
+   from . import accessor
 __all__ = ['cdiff',
            'relative_vorticity', 'absolute_vorticity',
-           'divergence', 'advection',
-           'potential_temperature','potential_vorticity']
+           'divergence', 'wind_gradients', 'advection', 'batch_advection',
+           'streamfunction', 'velocity_potential',
+           'potential_temperature','potential_vorticity', 'isentropic_interpolate',
+           'GridMetrics', 'grid_metrics', 'compute',
+           'stream', 'TimeTendency', 'write', 'set_options', 'get_options', 'memory_plan', 'MemoryPlan',
+           'register_backend', 'available_backends', 'profile']
 __version__ = '0.0.1.3'
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Numba backend of metlib, with fused stencil kernels compiled with numba
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import numba
+import numpy as np
+#-----------------------------------------------------------------------------------------------------------------------------------
+# The kernels get C-contiguous arrays of one dtype, reshaped to [lead,y,x] (or
+# [pre,n,post] for cdiff), and the 2D grid metrics in the same dtype. Each point
+# is computed with the same operations of the Numpy backend in one pass over the
+# inputs, and nogil lets them run in the thread pool of the workers option. On
+# periodic grids the first and last columns use the opposite side in X.
+@numba.njit(nogil=True, cache=True)
+def _cdiff3(Field, out):
+   pre, n, post = Field.shape
+   if post == 1:
+      # derivative along the last (contiguous) axis
+      for i in range(pre):
+         out[i,0,0] = np.nan
+         out[i,n-1,0] = np.nan
+         for j in range(1, n-1):
+            out[i,j,0] = Field[i,j+1,0] - Field[i,j-1,0]
+      return
+   for i in range(pre):
+      for k in range(post):
+         out[i,0,k] = np.nan
+         out[i,n-1,k] = np.nan
+      for j in range(1, n-1):
+         for k in range(post):
+            out[i,j,k] = Field[i,j+1,k] - Field[i,j-1,k]
+
+
+@numba.njit(nogil=True, cache=True)
+def _edges(out):
+   nl, ny, nx = out.shape
+   for l in range(nl):
+      for i in range(nx):
+         out[l,0,i] = np.nan
+         out[l,ny-1,i] = np.nan
+      for j in range(ny):
+         out[l,j,0] = np.nan
+         out[l,j,nx-1] = np.nan
+
+
+@numba.njit(nogil=True, cache=True, inline='always')
+def _vorticity_point(UComp, VComp, coslat, dx, dy, acoslat, fc, Absolute, l, j, i, im, ip):
+   dvdx = VComp[l,j,ip] - VComp[l,j,im]
+   dudy = UComp[l,j+1,i]*coslat[j+1,i] - UComp[l,j-1,i]*coslat[j-1,i]
+   vor = (dvdx/dx[j,i] - dudy/dy[j,i])/acoslat[j,i]
+   if Absolute:
+      vor = vor + fc[j,i]
+   return vor
+
+
+@numba.njit(nogil=True, cache=True)
+def _vorticity3(UComp, VComp, coslat, dx, dy, acoslat, fc, Absolute, Periodic, out):
+   nl, ny, nx = UComp.shape
+   _edges(out)
+   for l in range(nl):
+      for j in range(1, ny-1):
+         for i in range(1, nx-1):
+            out[l,j,i] = _vorticity_point(UComp, VComp, coslat, dx, dy, acoslat, fc, Absolute, l, j, i, i-1, i+1)
+         if Periodic and nx > 2:
+            out[l,j,0] = _vorticity_point(UComp, VComp, coslat, dx, dy, acoslat, fc, Absolute, l, j, 0, nx-1, 1)
+            out[l,j,nx-1] = _vorticity_point(UComp, VComp, coslat, dx, dy, acoslat, fc, Absolute, l, j, nx-1, nx-2, 0)
+
+
+@numba.njit(nogil=True, cache=True, inline='always')
+def _divergence_point(UComp, VComp, coslat, dx, dy, acoslat, l, j, i, im, ip):
+   dudx = UComp[l,j,ip] - UComp[l,j,im]
+   dvdy = VComp[l,j+1,i]*coslat[j+1,i] - VComp[l,j-1,i]*coslat[j-1,i]
+   return (dudx/dx[j,i] + dvdy/dy[j,i])/acoslat[j,i]
+
+
+@numba.njit(nogil=True, cache=True)
+def _divergence3(UComp, VComp, coslat, dx, dy, acoslat, Periodic, out):
+   nl, ny, nx = UComp.shape
+   _edges(out)
+   for l in range(nl):
+      for j in range(1, ny-1):
+         for i in range(1, nx-1):
+            out[l,j,i] = _divergence_point(UComp, VComp, coslat, dx, dy, acoslat, l, j, i, i-1, i+1)
+         if Periodic and nx > 2:
+            out[l,j,0] = _divergence_point(UComp, VComp, coslat, dx, dy, acoslat, l, j, 0, nx-1, 1)
+            out[l,j,nx-1] = _divergence_point(UComp, VComp, coslat, dx, dy, acoslat, l, j, nx-1, nx-2, 0)
+
+
+@numba.njit(nogil=True, cache=True, inline='always')
+def _advection_point(Field, UComp, VComp, coslat, dx, dy, Minus, Radius, l, j, i, im, ip):
+   dfdx = Field[l,j,ip] - Field[l,j,im]
+   dfdy = Field[l,j+1,i] - Field[l,j-1,i]
+   return Minus*( ((UComp[l,j,i]*dfdx)/(coslat[j,i]*dx[j,i])) + ((VComp[l,j,i]*dfdy)/(dy[j,i])) )/Radius
+
+
+@numba.njit(nogil=True, cache=True)
+def _advection3(Field, UComp, VComp, coslat, dx, dy, Minus, Radius, Periodic, out):
+   nl, ny, nx = Field.shape
+   _edges(out)
+   for l in range(nl):
+      for j in range(1, ny-1):
+         for i in range(1, nx-1):
+            out[l,j,i] = _advection_point(Field, UComp, VComp, coslat, dx, dy, Minus, Radius, l, j, i, i-1, i+1)
+         if Periodic and nx > 2:
+            out[l,j,0] = _advection_point(Field, UComp, VComp, coslat, dx, dy, Minus, Radius, l, j, 0, nx-1, 1)
+            out[l,j,nx-1] = _advection_point(Field, UComp, VComp, coslat, dx, dy, Minus, Radius, l, j, nx-1, nx-2, 0)
+
+
+@numba.njit(nogil=True, cache=True, inline='always')
+def _batch_advection_point(Fields, UFactor, VFactor, Radius, l, m, j, i, im, ip):
+   dfdx = Fields[l,j,ip] - Fields[l,j,im]
+   dfdy = Fields[l,j+1,i] - Fields[l,j-1,i]
+   return ((dfdx*UFactor[m,j,i]) + (dfdy*VFactor[m,j,i]))/Radius
+
+
+@numba.njit(nogil=True, cache=True)
+def _batch_advection3(Fields, UFactor, VFactor, Radius, Periodic, out):
+   # Fields is the stack of fields [n*lead,y,x] and the wind terms are [lead,y,x]
+   nl, ny, nx = Fields.shape
+   nw = UFactor.shape[0]
+   _edges(out)
+   for l in range(nl):
+      m = l % nw
+      for j in range(1, ny-1):
+         for i in range(1, nx-1):
+            out[l,j,i] = _batch_advection_point(Fields, UFactor, VFactor, Radius, l, m, j, i, i-1, i+1)
+         if Periodic and nx > 2:
+            out[l,j,0] = _batch_advection_point(Fields, UFactor, VFactor, Radius, l, m, j, 0, nx-1, 1)
+            out[l,j,nx-1] = _batch_advection_point(Fields, UFactor, VFactor, Radius, l, m, j, nx-1, nx-2, 0)
+
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _as3d(Array):
+   return Array.reshape((-1,)+Array.shape[-2:])
+
+
+def cdiff(Field, axis, out):
+   Shape = Field.shape
+   if Shape[axis] == 0:
+      return out
+   Shape3 = (int(np.prod(Shape[:axis])), Shape[axis], int(np.prod(Shape[axis+1:])))
+   _cdiff3(Field.reshape(Shape3), out.reshape(Shape3))
+   return out
+
+
+def _vorticity(UComp, VComp, Grid, Absolute):
+   Grid = Grid.astype(UComp.dtype)
+   out = np.empty(UComp.shape, dtype=UComp.dtype)
+   _vorticity3(_as3d(UComp), _as3d(VComp), Grid.coslat, Grid.dx, Grid.dy, Grid.acoslat, Grid.fc, Absolute, Grid.periodic_x, _as3d(out))
+   return out
+
+
+def relative_vorticity(UComp, VComp, Grid):
+   return _vorticity(UComp, VComp, Grid, False)
+
+
+def absolute_vorticity(UComp, VComp, Grid):
+   return _vorticity(UComp, VComp, Grid, True)
+
+
+def divergence(UComp, VComp, Grid):
+   Grid = Grid.astype(UComp.dtype)
+   out = np.empty(UComp.shape, dtype=UComp.dtype)
+   _divergence3(_as3d(UComp), _as3d(VComp), Grid.coslat, Grid.dx, Grid.dy, Grid.acoslat, Grid.periodic_x, _as3d(out))
+   return out
+
+
+def advection(Field, UComp, VComp, Grid):
+   Grid = Grid.astype(Field.dtype)
+   out = np.empty(Field.shape, dtype=Field.dtype)
+   # the constants in the dtype of the fields, as the Python floats of the Numpy backend
+   _advection3(_as3d(Field), _as3d(UComp), _as3d(VComp), Grid.coslat, Grid.dx, Grid.dy,
+               Field.dtype.type(-1.0), Field.dtype.type(6.37e6), Grid.periodic_x, _as3d(out))
+   return out
+
+
+def batch_advection(Fields, UFactor, VFactor, Grid):
+   out = np.empty(Fields.shape, dtype=Fields.dtype)
+   _batch_advection3(_as3d(Fields), _as3d(UFactor), _as3d(VFactor), Fields.dtype.type(-6.37e6), Grid.periodic_x, _as3d(out))
+   return out
+
+
+Kernels = {'cdiff': cdiff,
+           'relative_vorticity': relative_vorticity,
+           'absolute_vorticity': absolute_vorticity,
+           'divergence': divergence,
+           'advection': advection,
+           'batch_advection': batch_advection}
+
+#-----------------------------------------------------------------------------------------------------------------------------------
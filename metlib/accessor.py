@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Accessor .metlib of the Xarray.DataArray and Xarray.Dataset
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import xarray
+from .functions import (grid_metrics, cdiff, relative_vorticity, absolute_vorticity, divergence, wind_gradients, advection,
+                        potential_temperature, potential_vorticity, _KinematicsAttrs, _advection_attrs, _is_xarray, _is_dask, _wrap)
+from .planner import compute, _Attrs, _Plan, _valid
+from .stream import _time_dim
+from .profiling import _stage
+#-----------------------------------------------------------------------------------------------------------------------------------
+class MetlibAccessor(object):
+
+   '''
+   Accessor .metlib of the Xarray.DataArray and Xarray.Dataset, e.g.:
+   ds.metlib.vorticity(u='u', v='v')
+   ds.metlib.potential_vorticity(t='t', u='u', v='v', periodic_x='auto')
+   ds.t.metlib.advection(u=ds.u, v=ds.v)
+
+   The roles of the dimensions (longitude, latitude, level and time) and the grid
+   metrics are resolved once per object and kept in the accessor, which xarray keeps
+   with the object, so the calls after the first one do not search the dimensions
+   nor recompute the grid. The results of Numpy data are built around the computed
+   arrays, sharing the coordinates of the inputs without copying them. The results
+   are the same of the functions of metlib.
+
+   The variables are the names of the variables of the Xarray.Dataset or
+   Xarray.DataArray. In the accessor of a Xarray.DataArray, the field of cdiff,
+   advection and potential_temperature is the Xarray.DataArray itself.
+   It is registered when metlib receives its first Xarray object, when metlib is
+   imported after xarray, or with import metlib.accessor.
+
+   '''
+
+   def __init__(self, Data):
+      self._Data = Data
+      self._Roles = {}
+      self._Grids = {}
+
+
+   def _field(self, Variable):
+      # Xarray.DataArray of a variable: a name of the Xarray.Dataset, a Xarray.DataArray,
+      # or the Xarray.DataArray of the accessor when it is None
+      if _is_xarray(Variable):
+         return Variable
+      if Variable is None and _is_xarray(self._Data):
+         return self._Data
+      if _is_xarray(self._Data, 'Dataset') and Variable in self._Data.data_vars:
+         return self._Data[Variable]
+      print('\nThe variable {} is not in the Xarray.Dataset\n'.format(Variable))
+      return None
+
+
+   def _fields(self, *Variables):
+      # Xarray.DataArray of the variables, which must have the same dimensions (in the
+      # same order) because their data are passed to the functions as Numpy arrays
+      Fields = [ self._field(Variable) for Variable in Variables ]
+      if True in [ Field is None for Field in Fields ]:
+         return
+
+      try:
+         assert False not in [ Field.dims == Fields[0].dims for Field in Fields ]
+      except AssertionError:
+         print('\nThe variables {} do not have the same dimensions\n'.format(', '.join([ str(Field.name) for Field in Fields ])))
+         return
+      return Fields
+
+
+   def roles(self, Variable=None):
+
+      '''
+      Returns a dictionary with the dimensions of the roles lon, lat, level and time of
+      a variable (None if it does not have the role), resolved once per set of dimensions.
+      '''
+
+      Field = self._field(Variable if Variable is not None or _is_xarray(self._Data) else list(self._Data.data_vars)[0])
+      if Field is None:
+         return
+
+      Dims = Field.dims
+      if Dims not in self._Roles:
+         if len(Dims) >= 2 and True in [ True if word in Dims[-1] else False for word in ['lon','LON','Lon'] ]   and   True in [ True if word in Dims[-2] else False for word in ['lat','LAT','Lat'] ]:
+            Time = _time_dim(Field)
+            self._Roles[Dims] = {'lon': Dims[-1], 'lat': Dims[-2], 'level': Dims[-3] if len(Dims) >= 3 and Dims[-3] != Time else None, 'time': Time}
+         else:
+            self._Roles[Dims] = None
+      return self._Roles[Dims]
+
+
+   def grid(self, periodic_x=False, order=2, Variable=None):
+
+      '''
+      Returns the GridMetrics of the longitudes and latitudes of a variable (see
+      grid_metrics). They are kept in the accessor for each periodic_x and order,
+      except the ones of Xarray.DataArray of other objects.
+      '''
+
+      Field = self._field(Variable if Variable is not None or _is_xarray(self._Data) else list(self._Data.data_vars)[0])
+      if Field is None:
+         return
+      Roles = self.roles(Field)
+
+      try:
+         assert Roles is not None
+      except AssertionError:
+         print('\nThe variables must have unless two dimensions [latitude, longitude]')
+         print('If they have three dimensions their structure must be [level, latitude, longitude] or [time, latitude, longitude]')
+         print('If they have four dimensions their structure must be [time, level, latitude, longitude]\n')
+         return
+
+      if _is_xarray(Variable) and Variable is not self._Data:
+         return grid_metrics(Field.coords[Roles['lon']].values, Field.coords[Roles['lat']].values, periodic_x=periodic_x, order=order)
+
+      Key = (Roles['lon'], Roles['lat'], periodic_x, order)
+      if Key not in self._Grids:
+         self._Grids[Key] = grid_metrics(Field.coords[Roles['lon']].values, Field.coords[Roles['lat']].values, periodic_x=periodic_x, order=order)
+      return self._Grids[Key]
+
+
+   def _levels(self, Field):
+      Roles = self.roles(Field)
+      return Field.coords[Roles['level']].values if Roles['level'] is not None else None
+
+
+   def _output(self, Template, Data, Name, Attrs):
+      # result of Numpy data around the computed array, with the coordinates of Template
+      with _stage('output'):
+         Result = _wrap(Template, Data, Name)
+         Result.attrs.update(Attrs)
+      return Result
+
+
+   def _lazy(self, Fields, region):
+      # the Xarray.DataArray backed by Dask, and the regions, are calculated by the
+      # functions with the Xarray.DataArray
+      return region is not None or True in [ _is_dask(Field.data) for Field in Fields ]
+
+
+   def cdiff(self, Dim, Variable=None, periodic_x=False, order=2):
+
+      '''
+      Centered finite difference of a variable in Dim (see cdiff), e.g. ds.t.metlib.cdiff('X').
+      '''
+
+      Field = self._field(Variable)
+      if Field is None:
+         return
+      if periodic_x == 'auto':
+         Grid = self.grid('auto', order, Variable)
+         if Grid is None:
+            return
+         periodic_x = Grid.periodic_x
+      return cdiff(Field, Dim, periodic_x=periodic_x, order=order)
+
+
+   def vorticity(self, u='u', v='v', periodic_x=False, order=2, region=None):
+
+      '''
+      Relative vorticity of the wind (see relative_vorticity), e.g. ds.metlib.vorticity(u='u', v='v').
+      '''
+
+      Fields = self._fields(u, v)
+      Grid = self.grid(periodic_x, order, u) if Fields is not None else None
+      if Grid is None:
+         return
+      if self._lazy(Fields, region):
+         return relative_vorticity(*Fields, Grid=Grid, region=region)
+      return self._output(Fields[0], relative_vorticity(Fields[0].data, Fields[1].data, Grid=Grid), 'vor', _KinematicsAttrs['vor'])
+
+
+   def absolute_vorticity(self, u='u', v='v', periodic_x=False, order=2, region=None):
+
+      '''
+      Absolute vorticity of the wind (see absolute_vorticity).
+      '''
+
+      Fields = self._fields(u, v)
+      Grid = self.grid(periodic_x, order, u) if Fields is not None else None
+      if Grid is None:
+         return
+      if self._lazy(Fields, region):
+         return absolute_vorticity(*Fields, Grid=Grid, region=region)
+      return self._output(Fields[0], absolute_vorticity(Fields[0].data, Fields[1].data, Grid=Grid), 'avor', _KinematicsAttrs['avor'])
+
+
+   def divergence(self, u='u', v='v', periodic_x=False, order=2, region=None):
+
+      '''
+      Divergence of the wind (see divergence).
+      '''
+
+      Fields = self._fields(u, v)
+      Grid = self.grid(periodic_x, order, u) if Fields is not None else None
+      if Grid is None:
+         return
+      if self._lazy(Fields, region):
+         return divergence(*Fields, Grid=Grid, region=region)
+      return self._output(Fields[0], divergence(Fields[0].data, Fields[1].data, Grid=Grid), 'div', _KinematicsAttrs['div'])
+
+
+   def wind_gradients(self, u='u', v='v', periodic_x=False, order=2):
+
+      '''
+      Vorticity, divergence and deformation of the wind in a Xarray.Dataset (see wind_gradients).
+      '''
+
+      Fields = self._fields(u, v)
+      Grid = self.grid(periodic_x, order, u) if Fields is not None else None
+      if Grid is None:
+         return
+      if self._lazy(Fields, None):
+         return wind_gradients(*Fields, Grid=Grid)
+      Kinematics = wind_gradients(Fields[0].data, Fields[1].data, Grid=Grid)
+      return xarray.Dataset(dict( (Name, self._output(Fields[0], Kinematics[Name], Name, _KinematicsAttrs[Name])) for Name in Kinematics ))
+
+
+   def advection(self, Variable=None, u='u', v='v', periodic_x=False, order=2, region=None):
+
+      '''
+      Horizontal advection of a variable by the wind (see advection), e.g.
+      ds.metlib.advection('t') or ds.t.metlib.advection(u=ds.u, v=ds.v).
+      '''
+
+      Fields = self._fields(Variable, u, v)
+      Grid = self.grid(periodic_x, order, Variable) if Fields is not None else None
+      if Grid is None:
+         return
+      if self._lazy(Fields, region):
+         return advection(*Fields, Grid=Grid, region=region)
+      adv = self._output(Fields[0], advection(Fields[0].data, Fields[1].data, Fields[2].data, Grid=Grid), 'adv', {})
+      return _advection_attrs(adv, Fields[0])
+
+
+   def potential_temperature(self, t=None):
+
+      '''
+      Potential temperature of the temperature t [K] (see potential_temperature). By
+      default t is the Xarray.DataArray of the accessor, or the variable 't' of the Xarray.Dataset.
+      '''
+
+      Field = self._field(t if t is not None or _is_xarray(self._Data) else 't')
+      if Field is None:
+         return
+      if self.roles(Field) is None or self._levels(Field) is None or _is_dask(Field.data):
+         return potential_temperature(Field)
+      return self._output(Field, potential_temperature(Field.data, self._levels(Field)), 'PTemp', _Attrs['ptemp'])
+
+
+   def potential_vorticity(self, t='t', u='u', v='v', periodic_x=False, order=2, region=None, isentropes=None):
+
+      '''
+      Baroclinic potential vorticity (see potential_vorticity), e.g. ds.metlib.potential_vorticity(t='t', u='u', v='v'),
+      or on isentropic surfaces with isentropes, e.g. ds.metlib.potential_vorticity(isentropes=330.0).
+      '''
+
+      Fields = self._fields(t, u, v)
+      Grid = self.grid(periodic_x, order, t) if Fields is not None else None
+      if Grid is None:
+         return
+      if self._lazy(Fields, region) or self._levels(Fields[0]) is None or isentropes is not None:
+         return potential_vorticity(*Fields, Grid=Grid, region=region, isentropes=isentropes)
+      PVor = potential_vorticity(Fields[0].data, Fields[1].data, Fields[2].data, Levels=self._levels(Fields[0]), Grid=Grid)
+      return self._output(Fields[0], PVor, 'PVor', _Attrs['pv'])
+
+
+   def compute(self, Diagnostics, Names=None, periodic_x=False, order=2):
+
+      '''
+      Calculates many diagnostics of the Xarray.Dataset at once (see compute), e.g.
+      ds.metlib.compute(['vor', 'div', 'adv_t', 'pv']).
+      '''
+
+      Grid = None
+      if _is_xarray(self._Data, 'Dataset') and False not in [ _valid(Diagnostic) for Diagnostic in Diagnostics ]:
+         Role = _Plan(Diagnostics).Inputs[0]
+         Name = (Names or {}).get(Role, Role)
+         if Name in self._Data.data_vars:
+            Grid = self.grid(periodic_x, order, Name)
+      return compute(self._Data, Diagnostics, Names, Grid=Grid, periodic_x=periodic_x, order=order)
+
+
+
+xarray.register_dataarray_accessor('metlib')(MetlibAccessor)
+xarray.register_dataset_accessor('metlib')(MetlibAccessor)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
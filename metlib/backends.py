@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Registry of the compute backends of metlib
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import importlib.util
+from collections import OrderedDict
+#-----------------------------------------------------------------------------------------------------------------------------------
+# name -> dictionary of kernels, or a function without arguments that returns it
+# (so the backend is imported only when it is used)
+_Backends = OrderedDict()
+
+
+def register_backend(Name, Kernels):
+
+   '''
+   Registers a compute backend.
+
+
+   Parameters
+   ----------
+   Name: String (str)
+         Name of the backend, it is selected with set_options(backend=Name).
+
+   Kernels: Dictionary or function
+            Kernels of the backend, or a function without arguments that returns them.
+            The keys can be 'cdiff', 'relative_vorticity', 'absolute_vorticity',
+            'divergence', 'advection' and 'batch_advection', with the signatures:
+            cdiff(Field, axis, out), that writes the difference along axis in out;
+            relative_vorticity(UComp, VComp, Grid), absolute_vorticity(UComp, VComp, Grid),
+            divergence(UComp, VComp, Grid), advection(Field, UComp, VComp, Grid) and
+            batch_advection(Fields, UFactor, VFactor, Grid), with the stack of fields
+            [n,...] and the wind terms u/(cos(lat)*dx) and v/dy, that return the result.
+            They get C-contiguous Numpy arrays in the dtype of the result and a GridMetrics. The kernels that are not defined are
+            taken from the 'numpy' backend.
+
+   '''
+
+   _Backends[Name] = Kernels
+
+
+def available_backends():
+
+   '''
+   Returns a list with the names of the registered backends that can be used.
+   '''
+
+   return [ Name for Name in _Backends if _load(Name) is not None ]
+
+
+def _load(Name):
+   # kernels of a backend, or None if it can not be loaded (e.g. numba is not installed)
+   Kernels = _Backends.get(Name)
+   if callable(Kernels):
+      try:
+         Kernels = Kernels()
+      except ImportError:
+         Kernels = None
+      _Backends[Name] = Kernels
+   return Kernels
+
+
+def _resolve(Name):
+   # name of the backend selected by the backend option
+   if Name == 'auto':
+      if 'numba' in _Backends and _Backends['numba'] is not None and importlib.util.find_spec('numba') is not None:
+         return 'numba'
+      return 'numpy'
+   return Name
+
+
+def _numba_kernels():
+   from . import _numba
+   return _numba.Kernels
+
+
+register_backend('numba', _numba_kernels)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: metlib-batch, command line program to calculate diagnostics of many netCDF files
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .planner import compute, _Plan, _valid
+from .options import set_options
+from .stream import _time_dim
+from .writer import write
+#-----------------------------------------------------------------------------------------------------------------------------------
+_Description = '''Calculates diagnostics of a set of netCDF files and writes one output file per input file.
+The files are read, calculated and written one time step at a time.
+
+diagnostics:
+  vor, avor, div           relative vorticity, absolute vorticity and divergence (needs u, v)
+  stdef, shdef, tdef       stretching, shearing and total deformation (needs u, v)
+  adv_<name>               horizontal advection of the variable <name> (needs u, v), e.g. adv_t,
+                           or of one of these diagnostics, e.g. adv_ptemp
+  ptemp                    potential temperature (needs t)
+  pv                       potential vorticity (needs t, u, v)
+
+example:
+  metlib-batch era5_*.nc --var u=u --var v=v --var t=t --diag vor,div,adv_t,pv --outdir out
+'''
+
+
+def _compute(Data, Names, Diagnostics):
+   # the diagnostics of one dataset with the planner, so the fields they share
+   # (e.g. the wind gradients of vor, div and pv) are calculated only once
+   return compute(Data, Diagnostics, Names)
+
+
+def _output_path(Path, OutDir, Suffix, Extension='.nc'):
+   Name = os.path.splitext(os.path.basename(Path))[0] + Suffix + Extension
+   return os.path.join(OutDir if OutDir is not None else os.path.dirname(os.path.abspath(Path)), Name)
+
+
+def _steps(Data, Names, Diagnostics, TimeDim, Counter):
+   # the diagnostics of each time step, loaded and calculated only when the writer asks
+   # for them, so only one time step of the inputs and the results is in memory
+   if TimeDim is None:
+      Step = Data.load()
+      Counter[0] += Step.nbytes
+      yield _compute(Step, Names, Diagnostics)
+      return
+
+   for i in range(Data.sizes[TimeDim]):
+      Step = Data.isel({TimeDim: slice(i, i+1)}).load()
+      Counter[0] += Step.nbytes
+      yield _compute(Step, Names, Diagnostics)
+      del Step
+
+
+def _process(Path, Names, Diagnostics, OutDir, Suffix, Workers, Compression=None, Level=4, Extension='.nc'):
+   # runs in a worker process, xarray is imported here so the main process
+   # starts without it
+   import xarray as xr
+   set_options(workers=Workers)
+   Start = time.time()
+   Output = _output_path(Path, OutDir, Suffix, Extension)
+   Counter = [0]
+
+   with xr.open_dataset(Path) as Data:
+      Variables = sorted(set( Names.get(Role, Role) for Role in _Plan(Diagnostics).Inputs ))
+      Data = Data[Variables]
+      write(_steps(Data, Names, Diagnostics, _time_dim(Data), Counter), Output, Compression=Compression, Level=Level)
+
+   return Output, time.time()-Start, Counter[0]
+
+
+def _parse_names(Pairs):
+   Names = {}
+   for Pair in Pairs:
+      Role, Sep, Name = Pair.partition('=')
+      if Sep == '' or Role == '' or Name == '':
+         raise argparse.ArgumentTypeError('--var must be ROLE=NAME, e.g. --var t=temperature')
+      Names[Role] = Name
+   return Names
+
+
+def main(argv=None):
+
+   Parser = argparse.ArgumentParser(prog='metlib-batch', description=_Description,
+                                    formatter_class=argparse.RawDescriptionHelpFormatter)
+   Parser.add_argument('files', nargs='+', help='input netCDF files')
+   Parser.add_argument('--var', action='append', default=[], metavar='ROLE=NAME',
+                       help='name of the variable of a role (u, v, t or a tracer) in the files, e.g. --var t=temperature')
+   Parser.add_argument('--diag', required=True, help='comma separated list of diagnostics, e.g. vor,div,adv_t,pv')
+   Parser.add_argument('--outdir', default=None, help='directory of the output files (default: the directory of each input)')
+   Parser.add_argument('--suffix', default='_metlib', help='suffix of the output file names (default: _metlib)')
+   Parser.add_argument('--processes', type=int, default=os.cpu_count(), help='number of files processed in parallel (default: number of CPUs)')
+   Parser.add_argument('--workers', type=int, default=1, help='threads per process for each diagnostic (default: 1)')
+   Parser.add_argument('--compression', default='none', help="compression of the output variables, e.g. zlib, or none (default: none)")
+   Parser.add_argument('--level', type=int, default=4, help='level of the compression, from 1 to 9 (default: 4)')
+   Parser.add_argument('--zarr', action='store_true', help='writes Zarr stores (.zarr) instead of netCDF files')
+   Args = Parser.parse_args(argv)
+
+   try:
+      Names = _parse_names(Args.var)
+   except argparse.ArgumentTypeError as Error:
+      Parser.error(str(Error))
+
+   Diagnostics = [ Diagnostic.strip() for Diagnostic in Args.diag.split(',') if Diagnostic.strip() != '' ]
+   Unknown = [ Diagnostic for Diagnostic in Diagnostics if not _valid(Diagnostic) ]
+   if len(Unknown) > 0:
+      Parser.error('unknown diagnostics: {}'.format(', '.join(Unknown)))
+   if Args.processes < 1 or Args.workers < 1:
+      Parser.error('--processes and --workers must be greater or equal than 1')
+
+   Compression = None if Args.compression.lower() == 'none' else Args.compression
+   Extension = '.zarr' if Args.zarr else '.nc'
+
+   if Args.outdir is not None and not os.path.isdir(Args.outdir):
+      os.makedirs(Args.outdir)
+
+   Start = time.time()
+   TotalBytes = 0
+   Failed = 0
+
+   with ProcessPoolExecutor(max_workers=min(Args.processes, len(Args.files))) as Pool:
+
+      Futures = dict( (Pool.submit(_process, Path, Names, Diagnostics, Args.outdir, Args.suffix, Args.workers,
+                                   Compression, Args.level, Extension), Path) for Path in Args.files )
+
+      for Future in as_completed(Futures):
+         Path = Futures[Future]
+         try:
+            Output, Elapsed, Bytes = Future.result()
+         except Exception as Error:
+            Failed += 1
+            print('{}: FAILED ({}: {})'.format(Path, type(Error).__name__, Error))
+            continue
+
+         TotalBytes += Bytes
+         print('{} -> {}: {:.2f} s, {:.1f} MB, {:.1f} MB/s'.format(Path, Output, Elapsed, Bytes/2**20, Bytes/2**20/max(Elapsed, 1e-9)))
+         sys.stdout.flush()
+
+   Elapsed = time.time() - Start
+   print('{} files ({} failed) in {:.2f} s, {:.1f} MB, {:.1f} MB/s'.format(len(Args.files), Failed, Elapsed, TotalBytes/2**20, TotalBytes/2**20/max(Elapsed, 1e-9)))
+
+   return 1 if Failed > 0 else 0
+
+
+if __name__ == '__main__':
+   sys.exit(main())
+
+#-----------------------------------------------------------------------------------------------------------------------------------
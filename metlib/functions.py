@@ -7,11 +7,437 @@ E-mail: joaohenry23@gmail.com
 Created date: Apr 17, 2022
 '''
 #-----------------------------------------------------------------------------------------------------------------------------------
+import hashlib
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
-import xarray as xr
+from .options import _Options
+from .backends import register_backend, _load, _resolve
+from .profiling import _stage, _profiled
+#-----------------------------------------------------------------------------------------------------------------------------------
+# xarray is imported only when a Xarray object is received, so the calcs of
+# Numpy arrays do not pay the import of xarray and pandas
+def _is_xarray(Object, Class='DataArray'):
+   # True if Object is a Xarray.DataArray (or Class). If xarray has not been
+   # imported, Object can not be a Xarray object.
+   Module = sys.modules.get('xarray')
+   if Module is None or type(Object) != getattr(Module, Class):
+      return False
+   # the accessor .metlib is registered with the first Xarray object
+   if 'metlib.accessor' not in sys.modules:
+      from . import accessor
+   return True
+
+
+def _xr():
+   import xarray
+   return xarray
+
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# numpy and dask arrays
+def _is_numpy(Array):
+   # Numpy array or a subclass of it, e.g. np.memmap
+   return isinstance(Array, np.ndarray)
+
+
+def _is_dask(Array):
+   return type(Array).__module__.split('.')[0] == 'dask'
+
+
+def _wrap(Template, Data, Name=None):
+   # Xarray.DataArray of Data with the dimensions and coordinates of Template. It is a
+   # shallow copy of Template, so the coordinates and indexes are shared instead of
+   # being built again, without its name, attributes and encoding.
+   Result = Template.copy(deep=False, data=Data)
+   Result.name = Name
+   Result.attrs = {}
+   Result.encoding = {}
+   return Result
+
+
+def _data(DataArray):
+   # data of a Xarray.DataArray, keeping it lazy when it is backed by Dask
+   if _is_dask(DataArray.data):
+      return DataArray.data
+   return DataArray.values
+
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# precision
+def _result_dtype(*dtypes):
+   # dtype of the results: the one of the dtype option, or by default the
+   # promotion of the inputs to float64
+   if _Options['dtype'] is not None:
+      return _Options['dtype']
+   return np.result_type(*(dtypes + (np.float64,)))
+
+
+def _grid_fits(Grid, Field):
+   # if Grid is not a GridMetrics, or it has the longitudes and latitudes of the last
+   # two axes of Field (the compiled kernels do not check the bounds of the metrics)
+   return type(Grid) != GridMetrics or tuple(Grid.shape) == tuple(np.shape(Field)[-2:])
+
+
+def _cast(Array):
+   # Array in the dtype of the dtype option (without copy if it already is)
+   if _Options['dtype'] is None or Array.dtype == _Options['dtype']:
+      return Array
+   return Array.astype(_Options['dtype'])
+
+
+def _metrics(Grid):
+   # GridMetrics in the dtype of the dtype option
+   if _Options['dtype'] is None:
+      return Grid
+   return Grid.astype(_Options['dtype'])
+
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# compute backends
+def _kernel(Name, *Arrays, **kwargs):
+   # kernel Name of the backend selected by the backend option. The compiled backends
+   # only get C-contiguous Numpy arrays in the dtype of the result and grids of 2nd
+   # order with the shape of the last two axes of the arrays (their metrics are read
+   # without bounds checks), the other inputs (e.g. Dask blocks or views) use the
+   # kernel of the 'numpy' backend.
+   Backend = _resolve(_Options['backend'])
+   Grid = kwargs.get('Grid')
+
+   if Backend != 'numpy' and (Grid is None or (Grid.order == 2 and False not in [ _grid_fits(Grid, Array) for Array in Arrays ])):
+      dtype = _result_dtype(*[ Array.dtype for Array in Arrays ])
+      if False not in [ type(Array) == np.ndarray and Array.dtype == dtype and Array.flags.c_contiguous for Array in Arrays ]:
+         Kernels = _load(Backend)
+         if Kernels is not None and Name in Kernels:
+            return Kernels[Name]
+
+   return _load('numpy')[Name]
+
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# parallel calcs over the leading (time and level) axes
+def _lead_slabs(Shape, nlead, Workers):
+   # splits the nlead leading axes of Shape in slabs for Workers threads
+   n0 = Shape[0]
+   if nlead == 1 or n0 >= Workers:
+      return [ (slice(i[0], i[-1]+1),) for i in np.array_split(np.arange(n0), min(n0, Workers)) ]
+
+   n1 = Shape[1]
+   Parts = min(n1, -(-Workers//n0))
+   return [ (slice(t, t+1), slice(i[0], i[-1]+1)) for t in range(n0) for i in np.array_split(np.arange(n1), Parts) ]
+
+
+def _slab(Arg, Slab, ndim):
+   # slab of an argument with the full dimensions; the 2D grid metrics, the
+   # scalars and the axes of size 1 (broadcasted) are not sliced
+   if not _is_numpy(Arg) or Arg.ndim != ndim:
+      return Arg
+   return Arg[tuple( slice(None) if Arg.shape[i] == 1 else s for i, s in enumerate(Slab) )]
+
+
+def _run(Kernel, Args, Shape, out=None):
+   # runs Kernel(*Args) over the slabs of the leading axes in a pool of threads.
+   # Kernel must be pointwise in the leading axes and return a Numpy array or a
+   # dictionary of Numpy arrays with the given Shape. With np.memmap inputs or
+   # an out array (or dictionary of arrays), the slabs are bounded in size and
+   # written in out as they are computed. With the max_memory option, the slabs
+   # are the blocks of the MemoryPlan of the kernel when it does not fit at once.
+   with _stage('kernel'):
+      Slabs = None
+      if _Options['max_memory'] is not None:
+         from .memory import _run_plan
+         Plan = _run_plan(Kernel, Args, Shape, out)
+         if Plan is not None and len(Plan.blocks) > 1:
+            Slabs = Plan.blocks
+      if Slabs is not None or out is not None or True in [ type(Arg) == np.memmap for Arg in Args ]:
+         return _run_bounded(Kernel, Args, Shape, out, Slabs)
+      return _run_slabs(Kernel, Args, Shape)
+
+
+def _run_slabs(Kernel, Args, Shape):
+   Workers = _Options['workers']
+   ndim = len(Shape)
+
+   if Workers == 1 or ndim < 3 or True in [ _is_dask(Arg) for Arg in Args ]:
+      return Kernel(*Args)
+
+   Slabs = _lead_slabs(Shape, ndim-2, Workers)
+   Out = None
+
+   with ThreadPoolExecutor(max_workers=Workers) as Pool:
+
+      Futures = dict( (Pool.submit(Kernel, *[ _slab(Arg, Slab, ndim) for Arg in Args ]), Slab) for Slab in Slabs )
+
+      for Future in as_completed(Futures):
+         Slab = Futures.pop(Future)
+         Result = Future.result()
+
+         if type(Result) == dict:
+            if Out is None:
+               Out = dict( (Name, np.empty(Shape, dtype=Result[Name].dtype)) for Name in Result )
+            for Name in Result:
+               Out[Name][Slab] = Result[Name]
+         else:
+            if Out is None:
+               Out = np.empty(Shape, dtype=Result.dtype)
+            Out[Slab] = Result
+
+         del Result
+
+   return Out
+
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# out-of-core calcs, e.g. of np.memmap arrays larger than the memory
+def _bounded_slabs(Shape, nlead, Bytes, Limit):
+   # slabs of the nlead leading axes of Shape with about Limit bytes of the inputs,
+   # that take Bytes for the whole Shape. If one index of the first axis is larger
+   # than Limit, the second axis is split too.
+   if nlead == 0:
+      return [()]
+
+   n0 = Shape[0]
+   Plane = max(Bytes/max(n0, 1), 1.0)
+   if Plane <= Limit or nlead == 1:
+      Step = max(1, int(Limit//Plane))
+      return [ (slice(i, min(i+Step, n0)),) for i in range(0, n0, Step) ]
+
+   n1 = Shape[1]
+   Step = max(1, int(Limit//max(Plane/max(n1, 1), 1.0)))
+   return [ (slice(t, t+1), slice(i, min(i+Step, n1))) for t in range(n0) for i in range(0, n1, Step) ]
+
+
+def _run_bounded(Kernel, Args, Shape, out=None, Slabs=None):
+   # Kernel over slabs of the leading axes of slab_size bytes of inputs (or the given
+   # Slabs), Workers slabs at a time, so the peak memory is set by the slabs and not by
+   # the inputs. The slabs of np.memmap are read as Numpy arrays (without copy) and the
+   # results are written in out (allocated if it is None).
+   ndim = len(Shape)
+   Workers = _Options['workers']
+   if Slabs is None:
+      Bytes = sum([ Arg.nbytes for Arg in Args if _is_numpy(Arg) and Arg.ndim == ndim ])
+      Slabs = _bounded_slabs(Shape, max(ndim-2, 0), Bytes, _Options['slab_size'])
+
+   def slab(Slab):
+      return Kernel(*[ np.asarray(_slab(Arg, Slab, ndim)) if _is_numpy(Arg) else Arg for Arg in Args ])
+
+   def write(Slab, Result):
+      if type(Result) == dict:
+         for Name in Result:
+            if Name not in out:
+               out[Name] = np.empty(Shape, dtype=Result[Name].dtype)
+            out[Name][Slab] = Result[Name]
+      else:
+         out[Slab] = Result
+
+   if type(out) == dict:
+      out = dict(out)
+
+   Pool = ThreadPoolExecutor(max_workers=Workers) if Workers > 1 and len(Slabs) > 1 else None
+   try:
+      for i in range(0, len(Slabs), Workers):
+         Group = Slabs[i:i+Workers]
+         Results = [ slab(Slab) for Slab in Group ] if Pool is None else [ Future.result() for Future in [ Pool.submit(slab, Slab) for Slab in Group ] ]
+         if out is None:
+            out = {} if type(Results[0]) == dict else np.empty(Shape, dtype=Results[0].dtype)
+         for Slab, Result in zip(Group, Results):
+            write(Slab, Result)
+         del Results, Result
+   finally:
+      if Pool is not None:
+         Pool.shutdown(wait=True)
+
+   return out
+
+
+def _cdiff_bounded(Field, axis, out, Periodic=False, Order=2):
+   # centered difference in slabs of the first axis of slab_size bytes of Field. When
+   # the difference is along the first axis (e.g. Z or T), each slab carries a halo
+   # of Order/2 planes, so the result is identical to the one of the whole Field.
+   n = Field.shape[0]
+   h = Order//2 if axis == 0 else 0
+   Step = max(1, int(_Options['slab_size']//max(Field.nbytes//max(n, 1), 1)))
+
+   for Start in range(0, n, Step):
+      Stop = min(Start+Step, n)
+      Lo, Hi = max(Start-h, 0), min(Stop+h, n)
+      Block = np.asarray(Field[Lo:Hi])
+      Result = _cdiff_parallel(Block, axis, np.empty(Block.shape, dtype=_result_dtype(Field.dtype)), Periodic, Order)
+      out[Start:Stop] = Result[Start-Lo:Stop-Lo]
+      del Block, Result
+
+   return out
+
+
 #-----------------------------------------------------------------------------------------------------------------------------------
 # finite differences centered
-def cdiff(Field, Dim):
+def _cdiff_axis(ndim, Dim):
+   # axis of Field that corresponds to Dim
+   if Dim=='X' or Dim=='x':
+      return ndim-1
+   elif Dim=='Y' or Dim=='y':
+      return ndim-2
+   elif (Dim=='Z' or Dim=='z') and ndim==4:
+      return 1
+   elif ndim>=3:
+      return 0
+   return None
+
+
+def _cdiff_kernel(Field, axis, out):
+   # writes Field[i+1]-Field[i-1] into out along axis, and NaN in the
+   # first and last planes, without building a padded copy of Field
+   n = Field.shape[axis]
+   if n == 0:
+      return out
+
+   Hi = [slice(None)]*Field.ndim
+   Lo = [slice(None)]*Field.ndim
+   Mid = [slice(None)]*Field.ndim
+   Hi[axis] = slice(2, None)
+   Lo[axis] = slice(None, n-2)
+   Mid[axis] = slice(1, n-1)
+   np.subtract(Field[tuple(Hi)], Field[tuple(Lo)], out=out[tuple(Mid)], dtype=out.dtype)
+
+   Edge = [slice(None)]*Field.ndim
+   Edge[axis] = 0
+   out[tuple(Edge)] = np.nan
+   Edge[axis] = n-1
+   out[tuple(Edge)] = np.nan
+
+   return out
+
+
+def _cdiff_wrap(Field, axis, out, Order=2, Period=0.0):
+   # replaces the planes of out near the edges (NaN or lower order) by the differences
+   # of Order with the opposite side of Field (periodic axis), without a wrapped copy
+   # of Field. Period is added once per turn, e.g. 360 for the longitudes.
+   n = Field.shape[axis]
+   h = Order//2
+   if n < 2*h+1:
+      return out
+
+   Lead = (slice(None),)*axis
+
+   def difference(i, k, Plane):
+      Hi, Lo = Field[Lead+((i+k)%n,)], Field[Lead+((i-k)%n,)]
+      if Period != 0.0:
+         Hi, Lo = Hi + Period*((i+k)//n), Lo + Period*((i-k)//n)
+      return np.subtract(Hi, Lo, out=Plane, dtype=Plane.dtype)
+
+   for i in list(range(h)) + list(range(n-h, n)):
+      Plane = out[Lead+(i,)]
+      difference(i, 1, Plane)
+      _stencil(Plane, *[ difference(i, k, np.empty(Plane.shape, dtype=out.dtype)) for k in range(2, h+1) ])
+
+   return out
+
+
+def _stencil(out, D2=None, D3=None):
+   # turns out, that holds Field[i+1]-Field[i-1], in the difference of 4th order
+   # (8*D1-D2)/6 or 6th order (45*D1-9*D2+D3)/30, where Dk = Field[i+k]-Field[i-k].
+   # All of them are 2*h times the derivative, as the difference of 2nd order.
+   if D2 is None:
+      return out
+   if D3 is None:
+      np.multiply(out, 8, out=out)
+      np.subtract(out, D2, out=out)
+      np.divide(out, 6, out=out)
+   else:
+      np.multiply(out, 45, out=out)
+      np.multiply(D2, 9, out=D2)
+      np.subtract(out, D2, out=out)
+      np.add(out, D3, out=out)
+      np.divide(out, 30, out=out)
+   return out
+
+
+def _cdiff_stencil(Field, axis, out, Order=2, Periodic=False):
+   # centered difference of Order (2, 4 or 6) of Field along axis in out. The planes
+   # near the edges use the highest order that fits in the axis and the first and
+   # last planes are NaN, unless the axis is Periodic.
+   _kernel('cdiff', Field, out)(Field, axis, out)
+
+   n = Field.shape[axis]
+   Lead = (slice(None),)*axis
+
+   if Order >= 4 and n >= 5:
+      D2 = np.subtract(Field[Lead+(slice(4,None),)], Field[Lead+(slice(None,n-4),)], dtype=out.dtype)
+      if Order == 6 and n >= 7:
+         D3 = np.subtract(Field[Lead+(slice(6,None),)], Field[Lead+(slice(None,n-6),)], dtype=out.dtype)
+         for i in [2, n-3]:
+            _stencil(out[Lead+(i,)], D2[Lead+(i-2,)])
+         _stencil(out[Lead+(slice(3,n-3),)], D2[Lead+(slice(1,n-5),)], D3)
+      else:
+         _stencil(out[Lead+(slice(2,n-2),)], D2)
+
+   if Periodic:
+      _cdiff_wrap(Field, axis, out, Order)
+
+   return out
+
+
+def _periodic_lon(Lon):
+   # True if the longitudes (1D, or 2D [y,x]) have a constant step and the point
+   # after the last one is the first one, i.e. they cover the globe in X
+   Lon = np.asarray(Lon, dtype=np.float64)
+   if Lon.ndim == 0 or Lon.shape[-1] < 3:
+      return False
+
+   Step = _wrap_lon(np.diff(Lon, axis=-1))
+   Wrap = _wrap_lon(Lon[...,:1] - Lon[...,-1:])
+   Tolerance = 1e-3*np.abs(Step[...,:1])
+   return bool(np.all(Tolerance > 0) and np.all(np.abs(Step-Step[...,:1]) <= Tolerance) and np.all(np.abs(Wrap-Step[...,:1]) <= Tolerance))
+
+
+def _wrap_lon(dLon):
+   # longitude differences across the dateline (e.g. -179-179) to [-180,180]
+   return np.where(np.abs(dLon) > 180.0, (dLon+180.0) % 360.0 - 180.0, dLon)
+
+
+def _cdiff_parallel(Field, axis, out, Periodic=False, Order=2):
+   # splits Field in slabs over an axis different of the derivative axis
+   Workers = _Options['workers']
+
+   if Workers == 1 or Field.ndim < 3:
+      return _cdiff_stencil(Field, axis, out, Order, Periodic)
+
+   SplitAxis = 0 if axis != 0 else 1
+   n = Field.shape[SplitAxis]
+   Slabs = []
+   for i in np.array_split(np.arange(n), min(n, Workers)):
+      Slab = [slice(None)]*Field.ndim
+      Slab[SplitAxis] = slice(i[0], i[-1]+1)
+      Slabs.append(tuple(Slab))
+
+   with ThreadPoolExecutor(max_workers=Workers) as Pool:
+      for Future in [ Pool.submit(_cdiff_stencil, Field[Slab], axis, out[Slab], Order, Periodic) for Slab in Slabs ]:
+         Future.result()
+
+   return out
+
+
+def _cdiff_block(Field, axis, Periodic=False, Order=2):
+   return _cdiff_stencil(Field, axis, np.empty(Field.shape, dtype=_result_dtype(Field.dtype)), Order, Periodic)
+
+
+def _cdiff(Field, Dim, Periodic=False, Order=2):
+   # centered finite difference of a Numpy or Dask array, without validation.
+   # Each Dask block gets a halo of Order/2 cells along the derivative axis, so
+   # the result is lazy and identical to the one of the whole array. If Periodic,
+   # the halo of the first and last blocks is taken from the opposite side.
+   axis = _cdiff_axis(Field.ndim, Dim)
+
+   if _is_dask(Field):
+      return Field.map_overlap(_cdiff_block, depth={axis:Order//2}, boundary={axis:'periodic'} if Periodic else 'none',
+                               dtype=_result_dtype(Field.dtype), axis=axis, Order=Order)
+
+   return _cdiff_block(Field, axis, Periodic, Order)
+
+
+@_profiled
+def cdiff(Field, Dim, out=None, periodic_x=False, order=2):
    """
    Calculates a centered finite difference of Numpy array or Xarray.DataArray.
 
@@ -24,10 +450,33 @@ def cdiff(Field, Dim):
           - 2D [y,x]
           - 3D [z,y,x]
           - 4D [t,z,y,x]
+          If it is a Xarray.DataArray backed by Dask, the result is lazy.
 
    Dim: String (str)
         Defines axis of derivative and can be 'X', 'Y', 'Z', 'T'.
 
+   out: Numpy array
+        Optional array with the same shape of Field where the result is written.
+        It can be reused between calls to avoid allocating a new array each time.
+        It must not share memory with Field. It is not used with Dask arrays.
+        If Field or out are np.memmap, Field is processed in slabs of the first
+        axis (see the option slab_size of set_options), with a halo of order/2
+        planes when Dim is the first axis.
+
+   periodic_x: Boolean or String (str)
+               If True, the X axis is periodic (global grid) and the first and last
+               longitudes are differenced with the opposite side instead of being NaN.
+               If 'auto', it is True when the longitudes of the Xarray.DataArray cover
+               the globe with a constant step (with Numpy arrays 'auto' is False).
+               Only used when Dim is 'X'. Default is False.
+
+   order: Integer
+          Order of accuracy of the difference: 2 (Field[i+1]-Field[i-1]), 4 or 6.
+          The differences of 4th and 6th order are scaled in the same way, i.e.
+          (8*D1-D2)/6 and (45*D1-9*D2+D3)/30 with Dk = Field[i+k]-Field[i-k], so
+          all of them are 2 times the grid step times the derivative. Near the
+          edges the order is reduced to the largest that fits. Default is 2.
+
 
    Returns
    -------
@@ -38,7 +487,7 @@ def cdiff(Field, Dim):
 
 
    try:
-      assert type(Field) == np.ndarray or type(Field) == xr.DataArray
+      assert _is_numpy(Field) or _is_xarray(Field)
    except AssertionError:
       print('\nThe Field must be Numpy array or Xarray\n')
       return
@@ -58,11 +507,36 @@ def cdiff(Field, Dim):
       return
 
 
-   if type(Field) == np.ndarray:
-      FieldType = np.ndarray
-   elif type(Field) == xr.DataArray:
-      CoordsData = Field.coords
-      DimsData = Field.dims
+   try:
+      assert _cdiff_axis(Field.ndim, Dim) is not None
+   except AssertionError:
+      print('\nThe Field of 2 dimensions only can be derived in X or Y\n')
+      return
+
+
+   try:
+      assert periodic_x is True or periodic_x is False or periodic_x == 'auto'
+   except AssertionError:
+      print("\nThe periodic_x must be True, False or 'auto'\n")
+      return
+
+
+   try:
+      assert order in [2, 4, 6]
+   except AssertionError:
+      print('\nThe order must be 2, 4 or 6\n')
+      return
+
+
+   if periodic_x == 'auto':
+      periodic_x = _is_xarray(Field) and (Field.dims)[-1] in Field.coords and _periodic_lon(Field.coords[(Field.dims)[-1]].values)
+   Periodic = periodic_x and (Dim=='X' or Dim=='x')
+
+
+   if _is_numpy(Field):
+      FieldType = 'ndarray'
+   elif _is_xarray(Field):
+      Template = Field
 
 
       try:
@@ -77,104 +551,414 @@ def cdiff(Field, Dim):
          FieldLongName = 'Field_Name'
 
 
-      FieldType = xr.DataArray
-      Field = Field.values
+      FieldType = 'DataArray'
+      Field = _data(Field)
+
+
+   if _is_dask(Field):
+      with _stage('kernel'):
+         CDIFF = _cdiff(Field, Dim, Periodic, order)
 
+   else:
 
+      if out is None:
+         out = np.empty(Field.shape, dtype=_result_dtype(Field.dtype))
+      else:
+         try:
+            assert _is_numpy(out) and out.shape == Field.shape
+            assert not np.may_share_memory(out, Field)
+         except AssertionError:
+            print('\nThe out must be Numpy array with the same shape of Field and must not share memory with it\n')
+            return
 
-   if Field.ndim==2:
+      with _stage('kernel'):
+         if type(Field) == np.memmap or type(out) == np.memmap:
+            CDIFF = _cdiff_bounded(Field, _cdiff_axis(Field.ndim, Dim), out, Periodic, order)
+         else:
+            CDIFF = _cdiff_parallel(Field, _cdiff_axis(Field.ndim, Dim), out, Periodic, order)
 
-      ny, nx = Field.shape
-      dy = dx = 0
 
-      if Dim=='X' or Dim=='x':
-         axis = 1
-         nx = 1
-         dx = 2
 
-      elif Dim=='Y' or Dim=='y':
-         axis = 0
-         ny = 1
-         dy = 2
+   if FieldType == 'DataArray':
+      with _stage('output'):
+         CDIFF = _wrap(Template, CDIFF)
+      CDIFF.name = 'cdiff'
+      CDIFF.attrs['units'] = FieldUnits
+      CDIFF.attrs['long_name'] = 'CDIFF_'+FieldLongName+'_in_'+Dim
+      CDIFF.attrs['standard_name'] = 'Centered_finite_difference_of_'+FieldLongName+'_in_'+Dim
 
-      Nans = np.full((ny,nx), np.nan)
-      Field = np.concatenate((Nans,Field,Nans), axis=axis)
-      ny, nx = Field.shape
-      CDIFF = Field[dy:,dx:] - Field[:ny-dy,:nx-dx]
 
+   return CDIFF;
 
-   elif Field.ndim==3:
 
-      nz, ny, nx = Field.shape
-      dz = dy = dx = 0
+#-----------------------------------------------------------------------------------------------------------------------------------
+# grid metrics
+class GridMetrics(object):
+   '''
+   Horizontal metrics of a longitude-latitude grid used by the dynamic calcs.
 
-      if Dim=='X' or Dim=='x':
-         axis = 2
-         nx = 1
-         dx = 2
 
-      elif Dim=='Y' or Dim=='y':
-         axis = 1
-         ny = 1
-         dy = 2
+   Parameters
+   ----------
+   Lon: Numpy array
+        1D or 2D array with the longitudes of the grid.
 
-      elif Dim=='Z' or Dim=='z' or Dim=='T' or Dim=='t':
-         axis = 0
-         nz = 1
-         dz = 2
+   Lat: Numpy array
+        1D or 2D array with the latitudes of the grid.
 
-      Nans = np.full((nz,ny,nx), np.nan)
-      Field = np.concatenate((Nans,Field,Nans), axis=axis)
-      nz, ny, nx = Field.shape
-      CDIFF = Field[dz:,dy:,dx:] - Field[:nz-dz,:ny-dy,:nx-dx]
+   periodic_x: Boolean or String (str)
+               If True, the grid is global and periodic in X, so the metrics of the first
+               and last longitudes are computed with the opposite side instead of being NaN.
+               If 'auto', it is True when the longitudes cover the globe with a constant step.
+               Default is False.
 
+   order: Integer
+          Order of the differences of the grid (2, 4 or 6, see cdiff). The dx and dy
+          of higher order give the derivatives of higher order on non-uniform grids
+          (e.g. Gaussian latitudes). Default is 2.
 
-   elif Field.ndim==4:
 
-      nt, nz, ny, nx = Field.shape
-      dt = dz = dy = dx = 0
+   Attributes
+   ----------
+   Lon, Lat: Numpy array
+             2D arrays [y,x] with the longitudes and latitudes.
 
-      if Dim=='X' or Dim=='x':
-         axis = 3
-         nx = 1
-         dx = 2
+   periodic_x: Boolean
+               True if the grid is periodic in X.
 
-      elif Dim=='Y' or Dim=='y':
-         axis = 2
-         ny = 1
-         dy = 2
+   order: Integer
+          Order of the differences of the grid.
 
-      elif Dim=='Z' or Dim=='z':
-         axis = 1
-         nz = 1
-         dz = 2
+   dx, dy: Numpy array
+           Centered finite difference of Lon in X and of Lat in Y [radians].
 
-      elif Dim=='T' or Dim=='t':
-         axis = 0
-         nt = 1
-         dt = 2
+   dxm, dym: Numpy array
+             Centered finite difference of Lon in X and of Lat in Y [m].
 
-      Nans = np.full((nt,nz,ny,nx), np.nan)
-      Field = np.concatenate((Nans,Field,Nans), axis=axis)
-      nt, nz, ny, nx = Field.shape
-      CDIFF = Field[dt:,dz:,dy:,dx:] - Field[:nt-dt,:nz-dz,:ny-dy,:nx-dx]
+   coslat, tanlat: Numpy array
+                   Cosine and tangent of latitude.
 
+   acoslat: Numpy array
+            Earth radius times cosine of latitude [m].
 
+   fc: Numpy array
+       Coriolis parameter [s**-1].
 
-   if FieldType == xr.DataArray:
-      CDIFF = xr.DataArray(CDIFF, coords=CoordsData, dims=DimsData)
-      CDIFF.name = 'cdiff'
-      CDIFF.attrs['units'] = FieldUnits
-      CDIFF.attrs['long_name'] = 'CDIFF_'+FieldLongName+'_in_'+Dim
-      CDIFF.attrs['standard_name'] = 'Centered_finite_difference_of_'+FieldLongName+'_in_'+Dim
+   '''
 
+   def __init__(self, Lon, Lat, periodic_x=False, order=2):
 
-   return CDIFF;
+      Lon = np.array(Lon)
+      Lat = np.array(Lat)
+
+      if periodic_x == 'auto':
+         periodic_x = _periodic_lon(Lon)
+      self.periodic_x = bool(periodic_x)
+      self.order = order
+
+      if Lon.ndim == 1 and Lat.ndim == 1:
+         Lon, Lat = np.meshgrid(Lon, Lat)
+
+      self.Lon = Lon
+      self.Lat = Lat
+      self.shape = Lon.shape
+
+      self.coslat = np.cos(Lat*np.pi/180.0)
+      self.tanlat = np.tan(Lat*np.pi/180.0)
+      self.acoslat = 6.37e6*self.coslat
+      # the differences are always float64, as the dtype option is applied by astype
+      if order == 2:
+         dLon = _cdiff_kernel(Lon, 1, np.empty(Lon.shape, dtype=np.result_type(Lon.dtype, np.float64)))
+         if self.periodic_x:
+            _cdiff_wrap(Lon, 1, dLon)
+         dLon = _wrap_lon(dLon)
+         dLat = _cdiff_kernel(Lat, 0, np.empty(Lat.shape, dtype=np.result_type(Lat.dtype, np.float64)))
+      else:
+         # the wider stencils on the longitudes unwrapped across the dateline, plus
+         # one turn on the opposite side of periodic grids
+         LonUnwrap = np.unwrap(Lon, period=360.0, axis=1) if np.any(np.abs(np.diff(Lon, axis=1)) > 180.0) else Lon
+         dLon = _cdiff_stencil(LonUnwrap, 1, np.empty(Lon.shape, dtype=np.result_type(Lon.dtype, np.float64)), order)
+         if self.periodic_x:
+            _cdiff_wrap(LonUnwrap, 1, dLon, order, 360.0 if LonUnwrap[0,-1] >= LonUnwrap[0,0] else -360.0)
+         dLat = _cdiff_stencil(Lat, 0, np.empty(Lat.shape, dtype=np.result_type(Lat.dtype, np.float64)), order)
+      self.dx = dLon * np.pi/180.0
+      self.dy = dLat * np.pi/180.0
+      self.dxm = 6.37e6 * dLon * np.pi/180.0 * self.coslat
+      self.dym = 6.37e6 * dLat * np.pi/180.0
+      omega = 2.0*np.pi/86400.0
+      self.fc = 2*omega*np.sin(Lat*np.pi/180.0)
+
+      # the metrics are shared between calls through the cache
+      self.Lon.setflags(write=False)
+      self.Lat.setflags(write=False)
+      for Name in self._Metrics:
+         getattr(self, Name).setflags(write=False)
+
+      self._Casts = {}
+
+
+   _Metrics = ['coslat', 'tanlat', 'acoslat', 'dx', 'dy', 'dxm', 'dym', 'fc']
+
+
+   def astype(self, dtype):
+      '''
+      Returns the GridMetrics with the metrics in dtype (e.g. numpy.float32).
+      The converted metrics are kept, so they are computed only once.
+      '''
+      dtype = np.dtype(dtype)
+      if False not in [ getattr(self, Name).dtype == dtype for Name in self._Metrics ]:
+         return self
+
+      if dtype not in self._Casts:
+         Grid = object.__new__(GridMetrics)
+         Grid.Lon, Grid.Lat, Grid.shape = self.Lon, self.Lat, self.shape
+         Grid.periodic_x, Grid.order = self.periodic_x, self.order
+         for Name in self._Metrics:
+            Metric = getattr(self, Name).astype(dtype)
+            Metric.setflags(write=False)
+            setattr(Grid, Name, Metric)
+         Grid._Casts = {}
+         self._Casts[dtype] = Grid
+
+      return self._Casts[dtype]
+
+
+   def __repr__(self):
+      return 'GridMetrics(shape={}, periodic_x={}, order={})'.format(self.shape, self.periodic_x, self.order)
+
+
+
+_GridCache = OrderedDict()
+_GridCacheSize = 16
+
+
+def _fingerprint(Array):
+   Array = np.ascontiguousarray(Array)
+   return (Array.shape, Array.dtype.str, hashlib.sha1(Array.view(np.uint8)).hexdigest())
+
+
+@_profiled
+def grid_metrics(Lon, Lat=None, periodic_x=False, order=2):
+   '''
+   Returns the GridMetrics of a longitude-latitude grid. The metrics are kept in a
+   least recently used cache, so repeated calls with the same coordinates do not
+   recompute them.
+
+
+   Parameters
+   ----------
+   Lon: Numpy array or Xarray.DataArray
+        1D or 2D array with the longitudes of the grid.
+        If it is a Xarray.DataArray with [..., latitude, longitude] dimensions, the
+        grid is taken from its coordinates and is not necessary define Lat.
+
+   Lat: Numpy array
+        1D or 2D array with the latitudes of the grid.
+
+   periodic_x: Boolean or String (str)
+               True if the grid is global and periodic in X, or 'auto' to detect it
+               from the longitudes (see GridMetrics). Default is False.
+
+   order: Integer
+          Order of the differences of the grid: 2, 4 or 6 (see GridMetrics). Default is 2.
+
+
+   Returns
+   -------
+   Grid: GridMetrics
+         Horizontal metrics of the grid.
+
+   '''
+
+   if _is_xarray(Lon):
+
+      try:
+         assert Lon.ndim >= 2
+      except AssertionError:
+         print('\nThe data input is Xarray.DataArray and must have unless two dimensions [latitude, longitude]\n')
+         return
+      else:
+         Lat = Lon.coords[(Lon.dims)[-2]].values
+         Lon = Lon.coords[(Lon.dims)[-1]].values
+
+   try:
+      assert _is_numpy(Lon) and _is_numpy(Lat)
+   except AssertionError:
+      print('\nYou need pass 1D or 2D array of Lon and Lat, e.g.:')
+      print('grid_metrics(Lon, Lat)\n')
+      return
+
+
+   try:
+      assert periodic_x is True or periodic_x is False or periodic_x == 'auto'
+   except AssertionError:
+      print("\nThe periodic_x must be True, False or 'auto'\n")
+      return
+
+   try:
+      assert order in [2, 4, 6]
+   except AssertionError:
+      print('\nThe order must be 2, 4 or 6\n')
+      return
+
+   if periodic_x == 'auto':
+      periodic_x = _periodic_lon(Lon)
+
+
+   Key = (_fingerprint(Lon), _fingerprint(Lat), bool(periodic_x), order)
+
+   if Key in _GridCache:
+      _GridCache.move_to_end(Key)
+      return _GridCache[Key]
+
+   with _stage('build'):
+      Grid = GridMetrics(Lon, Lat, periodic_x, order)
+   _GridCache[Key] = Grid
+   while len(_GridCache) > _GridCacheSize:
+      _GridCache.popitem(last=False)
+
+   return Grid;
+
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# regions
+def _region_columns(Lon, LonMin, LonMax, Periodic, Halo):
+   # index of the columns of the window plus the halo (a slice, or an array when it
+   # wraps around a periodic grid), the slice of the window inside them and if they
+   # are still periodic (the window is the whole globe)
+   nx = len(Lon)
+   Width = (LonMax - LonMin) % 360.0
+   if LonMax - LonMin >= 360.0 or (Width == 0.0 and LonMax != LonMin):
+      Inside = np.ones(nx, dtype=bool)
+   else:
+      Inside = (Lon - LonMin) % 360.0 <= Width
+
+   Columns = np.flatnonzero(Inside)
+   if len(Columns) == 0:
+      return None
+   if len(Columns) == nx:
+      return slice(None), slice(None), Periodic
+
+   n = len(Columns)
+   if Periodic:
+      # the first column of the window is the one after an outside column, and the
+      # halo is taken from the opposite side of the grid across its edges
+      Start = Columns[np.flatnonzero(~Inside[Columns-1])[0]]
+      Index = (Start - Halo + np.arange(n+2*Halo)) % nx
+      if Index[-1] - Index[0] == len(Index) - 1:
+         Index = slice(Index[0], Index[-1]+1)
+      return Index, slice(Halo, Halo+n), False
+
+   if Columns[-1] - Columns[0] != n - 1:
+      return None
+   Start, Stop = max(Columns[0]-Halo, 0), min(Columns[-1]+1+Halo, nx)
+   return slice(Start, Stop), slice(Columns[0]-Start, Columns[0]-Start+n), False
+
+
+def _region_rows(Lat, LatMin, LatMax, Halo):
+   # slice of the rows of the window plus the halo and the slice of the window inside them
+   Rows = np.flatnonzero((Lat >= min(LatMin, LatMax)) & (Lat <= max(LatMin, LatMax)))
+   if len(Rows) == 0 or Rows[-1] - Rows[0] != len(Rows) - 1:
+      return None
+   Start, Stop = max(Rows[0]-Halo, 0), min(Rows[-1]+1+Halo, len(Lat))
+   return slice(Start, Stop), slice(Rows[0]-Start, Rows[-1]+1-Start)
+
+
+def _region_take(Array, Rows, Columns):
+   # rows and columns of the last two axes of a Numpy array (views when they are slices)
+   return Array[..., Rows, :][..., Columns]
+
+
+def _region(Function, Fields, Lon, Lat, Grid, periodic_x, order, region, out, **kwargs):
+   # calls Function over the window region of the grid plus a halo of the width of the
+   # stencils and returns the window, so only the region is computed. Inside the window
+   # the differences and grid metrics have the same neighbours as in the whole grid,
+   # so the result is the same that the one of the whole grid over the window.
+
+   try:
+      LonMin, LonMax, LatMin, LatMax = [ float(Value) for Value in region ]
+   except (TypeError, ValueError):
+      print('\nThe region must be (lon_min, lon_max, lat_min, lat_max), e.g. region=(-90.0, -30.0, -60.0, 15.0)\n')
+      return
+
+   Xarray = _is_xarray(Fields[0])
+
+   if Grid is not None:
+      Lon, Lat, periodic_x, order = Grid.Lon, Grid.Lat, Grid.periodic_x, Grid.order
+   elif Xarray:
+      Lon, Lat = Fields[0].coords[Fields[0].dims[-1]].values, Fields[0].coords[Fields[0].dims[-2]].values
+
+   try:
+      assert _is_numpy(Lon) and _is_numpy(Lat)
+   except AssertionError:
+      print('\nYou need pass 1D or 2D array of Lon and Lat (or their GridMetrics) to select the region\n')
+      return
+
+   if periodic_x == 'auto':
+      periodic_x = _periodic_lon(Lon)
+
+   Halo = order//2
+   Lon1 = Lon[0,:] if Lon.ndim == 2 else Lon
+   Lat1 = Lat[:,0] if Lat.ndim == 2 else Lat
+   Columns = _region_columns(np.asarray(Lon1, dtype=np.float64), LonMin, LonMax, bool(periodic_x), Halo)
+   Rows = _region_rows(np.asarray(Lat1, dtype=np.float64), LatMin, LatMax, Halo)
+
+   try:
+      assert Columns is not None and Rows is not None
+   except AssertionError:
+      print('\nThe region {} does not have a contiguous window of points of the grid\n'.format(tuple(region)))
+      return
+
+   Columns, WindowColumns, Periodic = Columns
+   Rows, WindowRows = Rows
+
+   with _stage('region'):
+      if Xarray:
+         Dims = Fields[0].dims
+         Fields = [ Field.isel({Dims[-2]: Rows, Dims[-1]: Columns}) for Field in Fields ]
+         Result = Function(*Fields, periodic_x=Periodic, order=order, **kwargs)
+      else:
+         Fields = [ _region_take(Field, Rows, Columns) for Field in Fields ]
+         if Lon.ndim == 2:
+            Lon, Lat = _region_take(Lon, Rows, Columns), _region_take(Lat, Rows, Columns)
+         else:
+            Lon, Lat = Lon[Columns], Lat[Rows]
+         Result = Function(*Fields, Lon=Lon, Lat=Lat, periodic_x=Periodic, order=order, **kwargs)
+
+   if Result is None:
+      return
+
+   if Xarray:
+      return Result.isel({Dims[-2]: WindowRows, Dims[-1]: WindowColumns})
+
+   Result = Result[..., WindowRows, WindowColumns]
+   if out is None:
+      return Result
+
+   try:
+      assert _is_numpy(out) and out.shape == Result.shape
+   except AssertionError:
+      print('\nThe out must be Numpy array with the shape of the region {}\n'.format(Result.shape))
+      return
+   out[...] = Result
+   return out
 
 
 #-----------------------------------------------------------------------------------------------------------------------------------
 # dynamic calcs
-def relative_vorticity(UComp, VComp, Lon=None, Lat=None):
+def _relative_vorticity(UComp, VComp, Grid):
+   UComp, VComp, Grid = _cast(UComp), _cast(VComp), _metrics(Grid)
+   return _kernel('relative_vorticity', UComp, VComp, Grid=Grid)(UComp, VComp, Grid)
+
+
+def _relative_vorticity_numpy(UComp, VComp, Grid):
+   dvdx = _cdiff(VComp,'X',Grid.periodic_x,Grid.order)
+   dudy = _cdiff(UComp*Grid.coslat,'Y',False,Grid.order)
+   return (dvdx/Grid.dx-dudy/Grid.dy)/Grid.acoslat
+
+
+@_profiled
+def relative_vorticity(UComp, VComp, Lon=None, Lat=None, Grid=None, periodic_x=False, order=2, out=None, region=None):
 
    '''
    Calculates the relative vorticity of horizontal wind.
@@ -195,39 +979,420 @@ def relative_vorticity(UComp, VComp, Lon=None, Lat=None):
           - 4D [t,z,y,x]
 
    Lon: Numpy array
-        2D array with the longitudes of UComp and VComp.
+        1D or 2D array with the longitudes of UComp and VComp.
         If UComp and VComp are xarray.DataArray is not necessary define this parameter.
 
    Lat: Numpy array
-        2D array with the latitudes of UComp and VComp.
+        1D or 2D array with the latitudes of UComp and VComp.
         If UComp and VComp are xarray.DataArray is not necessary define this parameter.
 
+   Grid: GridMetrics
+         Horizontal metrics of the grid returned by grid_metrics(Lon, Lat).
+         If it is defined, Lon and Lat are not necessary.
+
+   periodic_x: Boolean or String (str)
+               If True, the grid is global and periodic in X, so the first and last
+               longitudes are computed with the opposite side instead of being NaN.
+               If 'auto', it is detected from the longitudes. If Grid is defined, its
+               own periodic_x is used (see grid_metrics). Default is False.
+
+   order: Integer
+          Order of the horizontal differences: 2, 4 or 6 (see cdiff). If Grid is
+          defined, its own order is used (see grid_metrics). Default is 2.
+
+   out: Numpy array
+        Optional array (e.g. a np.memmap) with the shape of UComp where the result is
+        written. It is only used with Numpy arrays.
+
+   region: Tuple
+           Window (lon_min, lon_max, lat_min, lat_max) in degrees where the result is
+           calculated, e.g. (-90.0, -30.0, -60.0, 15.0). Only the window plus a halo of
+           the width of the stencils is computed, and the result has the shape of the
+           window, with the same values of the whole grid over it (out must have the
+           shape of the window too). If lon_min is greater than lon_max the window
+           crosses the dateline, e.g. (170.0, -170.0, -30.0, 30.0). It needs a regular
+           longitude-latitude grid. Default is None (the whole grid).
+
 
    Returns
    -------
    vor: Numpy array or Xarray.DataArray
         Relative vorticity of Ucomp and Vcomp [s**-1]
+        If the inputs are Xarray.DataArray backed by Dask, the result is lazy.
+
+   '''
+
+   try:
+      assert periodic_x is True or periodic_x is False or periodic_x == 'auto'
+   except AssertionError:
+      print("\nThe periodic_x must be True, False or 'auto'\n")
+      return
+
+
+   try:
+      assert order in [2, 4, 6]
+   except AssertionError:
+      print('\nThe order must be 2, 4 or 6\n')
+      return
+
+
+   try:
+      assert _grid_fits(Grid, UComp)
+   except AssertionError:
+      print('\nThe Grid has the shape {} but the data input (UComp, VComp) has {} points [latitude, longitude]\n'.format(Grid.shape, np.shape(UComp)[-2:]))
+      return
+
+
+   if region is not None:
+      return _region(relative_vorticity, (UComp, VComp), Lon, Lat, Grid, periodic_x, order, region, out)
+
+
+   if _is_numpy(UComp) and _is_numpy(VComp):
+
+      try:
+         assert out is None or (_is_numpy(out) and out.shape == UComp.shape)
+      except AssertionError:
+         print('\nThe out must be Numpy array with the shape of UComp\n')
+         return
+
+
+      try:
+         assert _is_numpy(Lon) and _is_numpy(Lat) or type(Grid) == GridMetrics
+      except AssertionError:
+         print('\nThe data input (UComp, VComp) is Numpy array, so you need pass 2D array of Lon and Lat (or their GridMetrics), e.g.:')
+         print('hcurl(UComp, VComp, 2DLon, 2DLat)\n')
+         return
+      else:
+
+            if Grid is None:
+               Grid = grid_metrics(Lon, Lat, periodic_x=periodic_x, order=order)
+
+            vor = _run(_relative_vorticity, (UComp, VComp, Grid), UComp.shape, out)
+
+
+   elif _is_xarray(UComp) and _is_xarray(VComp):
+
+      try:
+         assert UComp.dims == VComp.dims
+      except AssertionError:
+         print('\nThe data input (UComp, VComp) is Xarray.DataArray but they do not have the same dimensions\n')
+         return
+      else:
+
+         try:
+            assert True in [ True if word in (UComp.dims)[-1] else False for word in ['lon','LON','Lon'] ]   and   True in [ True if word in (UComp.dims)[-2] else False for word in ['lat','LAT','Lat'] ]
+         except AssertionError:
+            print('\nThe data input (UComp, VComp) is Xarray.DataArray and must have unless two dimensions [latitude, longitude]')
+            print('If data input have three dimensions their structure must be [level, latitude, longitude] or [time, latitude, longitude]')
+            print('If data input have four dimensions their structure must be [time, level, latitude, longitude] or [level, time, latitude, longitude]\n')
+            return
+         else:
+
+            Template = UComp
+
+            if Grid is None:
+               Grid = grid_metrics(UComp, periodic_x=periodic_x, order=order)
+
+            vor = _run(_relative_vorticity, (_data(UComp), _data(VComp), Grid), UComp.shape)
+
+            with _stage('output'):
+               vor = _wrap(Template, vor)
+            vor.name = 'vor'
+            vor.attrs['units'] = 's**-1'
+            vor.attrs['long_name'] = 'Vorticity'
+            vor.attrs['standard_name'] = 'Relative_vorticity_of_wind'
+
+
+   return vor;
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+# dynamic calcs
+def _absolute_vorticity(UComp, VComp, Grid):
+   UComp, VComp, Grid = _cast(UComp), _cast(VComp), _metrics(Grid)
+   return _kernel('absolute_vorticity', UComp, VComp, Grid=Grid)(UComp, VComp, Grid)
+
+
+def _absolute_vorticity_numpy(UComp, VComp, Grid):
+   dvdx = _cdiff(VComp,'X',Grid.periodic_x,Grid.order)
+   dudy = _cdiff(UComp*Grid.coslat,'Y',False,Grid.order)
+   return (dvdx/Grid.dx-dudy/Grid.dy)/Grid.acoslat + Grid.fc
+
+
+@_profiled
+def absolute_vorticity(UComp, VComp, Lon=None, Lat=None, Grid=None, periodic_x=False, order=2, out=None, region=None):
+
+   '''
+   Calculates the absolute vorticity of horizontal wind.
+
+
+   Parameters
+   ----------
+   UComp: Numpy array or Xarray.DataArray
+          Zonal component of wind. Their structure can be:
+          - 2D [y,x]
+          - 3D [z,y,x] or [t,y,x]
+          - 4D [t,z,y,x]
+
+   VComp: Numpy array or Xarray.DataArray
+          Meridional component of wind. Their structure can be:
+          - 2D [y,x]
+          - 3D [z,y,x] or [t,y,x]
+          - 4D [t,z,y,x]
+
+   Lon: Numpy array
+        1D or 2D array with the longitudes of UComp and VComp.
+        If UComp and VComp are xarray.DataArray is not necessary define this parameter.
+
+   Lat: Numpy array
+        1D or 2D array with the latitudes of UComp and VComp.
+        If UComp and VComp are xarray.DataArray is not necessary define this parameter.
+
+   Grid: GridMetrics
+         Horizontal metrics of the grid returned by grid_metrics(Lon, Lat).
+         If it is defined, Lon and Lat are not necessary.
+
+   periodic_x: Boolean or String (str)
+               If True, the grid is global and periodic in X, so the first and last
+               longitudes are computed with the opposite side instead of being NaN.
+               If 'auto', it is detected from the longitudes. If Grid is defined, its
+               own periodic_x is used (see grid_metrics). Default is False.
+
+   order: Integer
+          Order of the horizontal differences: 2, 4 or 6 (see cdiff). If Grid is
+          defined, its own order is used (see grid_metrics). Default is 2.
+
+   out: Numpy array
+        Optional array (e.g. a np.memmap) with the shape of UComp where the result is
+        written. It is only used with Numpy arrays.
+
+   region: Tuple
+           Window (lon_min, lon_max, lat_min, lat_max) in degrees where the result is
+           calculated, e.g. (-90.0, -30.0, -60.0, 15.0). Only the window plus a halo of
+           the width of the stencils is computed, and the result has the shape of the
+           window, with the same values of the whole grid over it (out must have the
+           shape of the window too). If lon_min is greater than lon_max the window
+           crosses the dateline, e.g. (170.0, -170.0, -30.0, 30.0). It needs a regular
+           longitude-latitude grid. Default is None (the whole grid).
+
+
+   Returns
+   -------
+   avor: Numpy array or Xarray.DataArray
+         Absolute relative vorticity of Ucomp and Vcomp [s**-1]
+         If the inputs are Xarray.DataArray backed by Dask, the result is lazy.
+
+   '''
+
+   try:
+      assert periodic_x is True or periodic_x is False or periodic_x == 'auto'
+   except AssertionError:
+      print("\nThe periodic_x must be True, False or 'auto'\n")
+      return
+
+
+   try:
+      assert order in [2, 4, 6]
+   except AssertionError:
+      print('\nThe order must be 2, 4 or 6\n')
+      return
+
+
+   try:
+      assert _grid_fits(Grid, UComp)
+   except AssertionError:
+      print('\nThe Grid has the shape {} but the data input (UComp, VComp) has {} points [latitude, longitude]\n'.format(Grid.shape, np.shape(UComp)[-2:]))
+      return
+
+
+   if region is not None:
+      return _region(absolute_vorticity, (UComp, VComp), Lon, Lat, Grid, periodic_x, order, region, out)
+
+
+   if _is_numpy(UComp) and _is_numpy(VComp):
+
+      try:
+         assert out is None or (_is_numpy(out) and out.shape == UComp.shape)
+      except AssertionError:
+         print('\nThe out must be Numpy array with the shape of UComp\n')
+         return
+
+
+      try:
+         assert _is_numpy(Lon) and _is_numpy(Lat) or type(Grid) == GridMetrics
+      except AssertionError:
+         print('\nThe data input (UComp, VComp) is Numpy array, so you need pass 2D array of Lon and Lat (or their GridMetrics), e.g.:')
+         print('hcurl(UComp, VComp, 2DLon, 2DLat)\n')
+         return
+      else:
+
+            if Grid is None:
+               Grid = grid_metrics(Lon, Lat, periodic_x=periodic_x, order=order)
+
+            avor = _run(_absolute_vorticity, (UComp, VComp, Grid), UComp.shape, out)
+
+
+   elif _is_xarray(UComp) and _is_xarray(VComp):
+
+      try:
+         assert UComp.dims == VComp.dims
+      except AssertionError:
+         print('\nThe data input (UComp, VComp) is Xarray.DataArray but they do not have the same dimensions\n')
+         return
+      else:
+
+         try:
+            assert True in [ True if word in (UComp.dims)[-1] else False for word in ['lon','LON','Lon'] ]   and   True in [ True if word in (UComp.dims)[-2] else False for word in ['lat','LAT','Lat'] ]
+         except AssertionError:
+            print('\nThe data input (UComp, VComp) is Xarray.DataArray and must have unless two dimensions [latitude, longitude]')
+            print('If data input have three dimensions their structure must be [level, latitude, longitude] or [time, latitude, longitude]')
+            print('If data input have four dimensions their structure must be [time, level, latitude, longitude] or [level, time, latitude, longitude]\n')
+            return
+         else:
+
+            Template = UComp
+
+            if Grid is None:
+               Grid = grid_metrics(UComp, periodic_x=periodic_x, order=order)
+
+            avor = _run(_absolute_vorticity, (_data(UComp), _data(VComp), Grid), UComp.shape)
+
+            with _stage('output'):
+               avor = _wrap(Template, avor)
+            avor.name = 'avor'
+            avor.attrs['units'] = 's**-1'
+            avor.attrs['long_name'] = 'Absolute_vorticity'
+            avor.attrs['standard_name'] = 'Absolute_relative_vorticity_of_wind'
+
+
+   return avor;
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _divergence(UComp, VComp, Grid):
+   UComp, VComp, Grid = _cast(UComp), _cast(VComp), _metrics(Grid)
+   return _kernel('divergence', UComp, VComp, Grid=Grid)(UComp, VComp, Grid)
+
+
+def _divergence_numpy(UComp, VComp, Grid):
+   dudx = _cdiff(UComp,'X',Grid.periodic_x,Grid.order)
+   dvdy = _cdiff(VComp*Grid.coslat,'Y',False,Grid.order)
+   return (dudx/Grid.dx+dvdy/Grid.dy)/Grid.acoslat
+
+
+@_profiled
+def divergence(UComp, VComp, Lon=None, Lat=None, Grid=None, periodic_x=False, order=2, out=None, region=None):
+
+   '''
+   Calculates the divergence of horizontal wind or some vector field.
+
+
+   Parameters
+   ----------
+   UComp: Numpy array or Xarray.DataArray
+          Zonal component of wind. Their structure can be:
+          - 2D [y,x]
+          - 3D [z,y,x] or [t,y,x]
+          - 4D [t,z,y,x]
+
+   VComp: Numpy array or Xarray.DataArray
+          Meridional component of wind. Their structure can be:
+          - 2D [y,x]
+          - 3D [z,y,x] or [t,y,x]
+          - 4D [t,z,y,x]
+
+   Lon: Numpy array
+        1D or 2D array with the longitudes of UComp and VComp.
+        If UComp and VComp are xarray.DataArray is not necessary define this parameter.
+
+   Lat: Numpy array
+        1D or 2D array with the latitudes of UComp and VComp.
+        If UComp and VComp are xarray.DataArray is not necessary define this parameter.
+
+   Grid: GridMetrics
+         Horizontal metrics of the grid returned by grid_metrics(Lon, Lat).
+         If it is defined, Lon and Lat are not necessary.
+
+   periodic_x: Boolean or String (str)
+               If True, the grid is global and periodic in X, so the first and last
+               longitudes are computed with the opposite side instead of being NaN.
+               If 'auto', it is detected from the longitudes. If Grid is defined, its
+               own periodic_x is used (see grid_metrics). Default is False.
+
+   order: Integer
+          Order of the horizontal differences: 2, 4 or 6 (see cdiff). If Grid is
+          defined, its own order is used (see grid_metrics). Default is 2.
+
+   out: Numpy array
+        Optional array (e.g. a np.memmap) with the shape of UComp where the result is
+        written. It is only used with Numpy arrays.
+
+   region: Tuple
+           Window (lon_min, lon_max, lat_min, lat_max) in degrees where the result is
+           calculated, e.g. (-90.0, -30.0, -60.0, 15.0). Only the window plus a halo of
+           the width of the stencils is computed, and the result has the shape of the
+           window, with the same values of the whole grid over it (out must have the
+           shape of the window too). If lon_min is greater than lon_max the window
+           crosses the dateline, e.g. (170.0, -170.0, -30.0, 30.0). It needs a regular
+           longitude-latitude grid. Default is None (the whole grid).
+
+
+   Returns
+   -------
+   div: Numpy array or Xarray.DataArray
+        Horizontal divergence of Ucomp and Vcomp [1/s]
+        Negative divergence is also known as convergence.
+        If the inputs are Xarray.DataArray backed by Dask, the result is lazy.
+
+   '''
+
+   try:
+      assert periodic_x is True or periodic_x is False or periodic_x == 'auto'
+   except AssertionError:
+      print("\nThe periodic_x must be True, False or 'auto'\n")
+      return
+
+
+   try:
+      assert order in [2, 4, 6]
+   except AssertionError:
+      print('\nThe order must be 2, 4 or 6\n')
+      return
+
+
+   try:
+      assert _grid_fits(Grid, UComp)
+   except AssertionError:
+      print('\nThe Grid has the shape {} but the data input (UComp, VComp) has {} points [latitude, longitude]\n'.format(Grid.shape, np.shape(UComp)[-2:]))
+      return
+
+
+   if region is not None:
+      return _region(divergence, (UComp, VComp), Lon, Lat, Grid, periodic_x, order, region, out)
 
-   '''
 
-   if type(UComp) == type(VComp) == np.ndarray:
+   if _is_numpy(UComp) and _is_numpy(VComp):
 
       try:
-         assert type(Lon) == type(Lat) == np.ndarray
+         assert out is None or (_is_numpy(out) and out.shape == UComp.shape)
       except AssertionError:
-         print('\nThe data input (UComp, VComp) is Numpy array, so you need pass 2D array of Lon and Lat, e.g.:')
-         print('hcurl(UComp, VComp, 2DLon, 2DLat)\n')
+         print('\nThe out must be Numpy array with the shape of UComp\n')
+         return
+
+
+      try:
+         assert _is_numpy(Lon) and _is_numpy(Lat) or type(Grid) == GridMetrics
+      except AssertionError:
+         print('\nThe data input (UComp, VComp) is Numpy array, so you need pass 2D array of Lon and Lat (or their GridMetrics), e.g.:')
+         print('hdivg(UComp, VComp, 2DLon, 2DLat)\n')
          return
       else:
 
-            dvdx = cdiff(VComp,'X')
-            dudy = cdiff(UComp*np.cos(Lat*np.pi/180.0),'Y')
-            dx = cdiff(Lon,'X') * np.pi/180.0
-            dy = cdiff(Lat,'Y') * np.pi/180.0
-            vor = (dvdx/dx-dudy/dy)/(6.37e6*np.cos(Lat*np.pi/180.0))
+            if Grid is None:
+               Grid = grid_metrics(Lon, Lat, periodic_x=periodic_x, order=order)
+
+            div = _run(_divergence, (UComp, VComp, Grid), UComp.shape, out)
 
 
-   elif type(UComp) == type(VComp) == xr.DataArray:
+   elif _is_xarray(UComp) and _is_xarray(VComp):
 
       try:
          assert UComp.dims == VComp.dims
@@ -245,34 +1410,65 @@ def relative_vorticity(UComp, VComp, Lon=None, Lat=None):
             return
          else:
 
-            CoordsData = UComp.coords
-            DimsData = UComp.dims
+            Template = UComp
 
-            Lon = UComp.coords[(UComp.dims)[-1]].values
-            Lat = UComp.coords[(UComp.dims)[-2]].values
-            Lon, Lat = np.meshgrid(Lon, Lat)
+            if Grid is None:
+               Grid = grid_metrics(UComp, periodic_x=periodic_x, order=order)
 
-            dvdx = cdiff(VComp,'X').values
-            dudy = cdiff(UComp*np.cos(Lat*np.pi/180.0),'Y').values
-            dx = cdiff(Lon,'X') * np.pi/180.0
-            dy = cdiff(Lat,'Y') * np.pi/180.0
-            vor = (dvdx/dx-dudy/dy)/(6.37e6*np.cos(Lat*np.pi/180.0))
+            div = _run(_divergence, (_data(UComp), _data(VComp), Grid), UComp.shape)
 
-            vor = xr.DataArray(vor, coords=CoordsData, dims=DimsData)
-            vor.name = 'vor'
-            vor.attrs['units'] = 's**-1'
-            vor.attrs['long_name'] = 'Vorticity'
-            vor.attrs['standard_name'] = 'Relative_vorticity_of_wind'
+            with _stage('output'):
+               div = _wrap(Template, div)
+            div.name = 'div'
+            div.attrs['units'] = 's**-1'
+            div.attrs['long_name'] = 'Divergence'
+            div.attrs['standard_name'] = 'Horizontal_divergence_of_wind'
 
 
-   return vor;
+   return div;
 
 #-----------------------------------------------------------------------------------------------------------------------------------
-# dynamic calcs
-def absolute_vorticity(UComp, VComp, Lon=None, Lat=None):
+def _wind_gradients(UComp, VComp, Grid):
+   # du/dx, dv/dx, d(u*cos)/dy and d(v*cos)/dy are computed only once, and the
+   # kinematic diagnostics are combinations of them. The deformations use the
+   # flux form of the gradients, so they carry the metric terms 2*u*tan(lat)/a
+   # and 2*v*tan(lat)/a.
+   UComp, VComp, Grid = _cast(UComp), _cast(VComp), _metrics(Grid)
+   dudx = _cdiff(UComp,'X',Grid.periodic_x,Grid.order)
+   dudx /= Grid.dx
+   dvdx = _cdiff(VComp,'X',Grid.periodic_x,Grid.order)
+   dvdx /= Grid.dx
+   dudy = _cdiff(UComp*Grid.coslat,'Y',False,Grid.order)
+   dudy /= Grid.dy
+   dvdy = _cdiff(VComp*Grid.coslat,'Y',False,Grid.order)
+   dvdy /= Grid.dy
+
+   vor = (dvdx-dudy)/Grid.acoslat
+   avor = vor + Grid.fc
+   div = (dudx+dvdy)/Grid.acoslat
+   stdef = (dudx-dvdy)/Grid.acoslat - 2.0*VComp*Grid.tanlat/6.37e6
+   shdef = (dvdx+dudy)/Grid.acoslat + 2.0*UComp*Grid.tanlat/6.37e6
+   tdef = np.sqrt(stdef**2+shdef**2)
+
+   return {'vor':vor, 'avor':avor, 'div':div, 'stdef':stdef, 'shdef':shdef, 'tdef':tdef}
+
+
+_KinematicsAttrs = {
+   'vor': {'units':'s**-1', 'long_name':'Vorticity', 'standard_name':'Relative_vorticity_of_wind'},
+   'avor': {'units':'s**-1', 'long_name':'Absolute_vorticity', 'standard_name':'Absolute_relative_vorticity_of_wind'},
+   'div': {'units':'s**-1', 'long_name':'Divergence', 'standard_name':'Horizontal_divergence_of_wind'},
+   'stdef': {'units':'s**-1', 'long_name':'Stretching_deformation', 'standard_name':'Stretching_deformation_of_wind'},
+   'shdef': {'units':'s**-1', 'long_name':'Shearing_deformation', 'standard_name':'Shearing_deformation_of_wind'},
+   'tdef': {'units':'s**-1', 'long_name':'Total_deformation', 'standard_name':'Total_deformation_of_wind'},
+}
+
+
+@_profiled
+def wind_gradients(UComp, VComp, Lon=None, Lat=None, Grid=None, periodic_x=False, order=2, out=None):
 
    '''
-   Calculates the absolute vorticity of horizontal wind.
+   Calculates the relative vorticity, absolute vorticity, divergence and deformation
+   of horizontal wind from a single evaluation of its horizontal gradients.
 
 
    Parameters
@@ -290,41 +1486,93 @@ def absolute_vorticity(UComp, VComp, Lon=None, Lat=None):
           - 4D [t,z,y,x]
 
    Lon: Numpy array
-        2D array with the longitudes of UComp and VComp.
+        1D or 2D array with the longitudes of UComp and VComp.
         If UComp and VComp are xarray.DataArray is not necessary define this parameter.
 
    Lat: Numpy array
-        2D array with the latitudes of UComp and VComp.
+        1D or 2D array with the latitudes of UComp and VComp.
         If UComp and VComp are xarray.DataArray is not necessary define this parameter.
 
+   Grid: GridMetrics
+         Horizontal metrics of the grid returned by grid_metrics(Lon, Lat).
+         If it is defined, Lon and Lat are not necessary.
+
+   periodic_x: Boolean or String (str)
+               If True, the grid is global and periodic in X, so the first and last
+               longitudes are computed with the opposite side instead of being NaN.
+               If 'auto', it is detected from the longitudes. If Grid is defined, its
+               own periodic_x is used (see grid_metrics). Default is False.
+
+   order: Integer
+          Order of the horizontal differences: 2, 4 or 6 (see cdiff). If Grid is
+          defined, its own order is used (see grid_metrics). Default is 2.
+
+   out: Dictionary
+        Optional arrays (e.g. np.memmap) with the shape of UComp where the diagnostics
+        are written, with the names of the diagnostics as keys, e.g. {'vor': Array}.
+        The diagnostics that are not in out are allocated. It is only used with
+        Numpy arrays.
+
 
    Returns
    -------
-   avor: Numpy array or Xarray.DataArray
-         Absolute relative vorticity of Ucomp and Vcomp [s**-1]
+   Kinematics: Dictionary of Numpy arrays or Xarray.Dataset
+               Contains the following fields [s**-1]:
+               - vor: relative vorticity
+               - avor: absolute vorticity
+               - div: horizontal divergence
+               - stdef: stretching deformation
+               - shdef: shearing deformation
+               - tdef: total deformation
+               If the inputs are Xarray.DataArray backed by Dask, the result is lazy.
 
    '''
 
-   if type(UComp) == type(VComp) == np.ndarray:
+   try:
+      assert periodic_x is True or periodic_x is False or periodic_x == 'auto'
+   except AssertionError:
+      print("\nThe periodic_x must be True, False or 'auto'\n")
+      return
+
+
+   try:
+      assert order in [2, 4, 6]
+   except AssertionError:
+      print('\nThe order must be 2, 4 or 6\n')
+      return
+
+
+   try:
+      assert _grid_fits(Grid, UComp)
+   except AssertionError:
+      print('\nThe Grid has the shape {} but the data input (UComp, VComp) has {} points [latitude, longitude]\n'.format(Grid.shape, np.shape(UComp)[-2:]))
+      return
+
+
+   if _is_numpy(UComp) and _is_numpy(VComp):
 
       try:
-         assert type(Lon) == type(Lat) == np.ndarray
+         assert out is None or (type(out) == dict and False not in [ Name in _KinematicsAttrs and _is_numpy(out[Name]) and out[Name].shape == UComp.shape for Name in out ])
       except AssertionError:
-         print('\nThe data input (UComp, VComp) is Numpy array, so you need pass 2D array of Lon and Lat, e.g.:')
-         print('hcurl(UComp, VComp, 2DLon, 2DLat)\n')
+         print('\nThe out must be a dictionary of Numpy arrays with the shape of UComp, e.g. {\'vor\': Array}\n')
+         return
+
+
+      try:
+         assert _is_numpy(Lon) and _is_numpy(Lat) or type(Grid) == GridMetrics
+      except AssertionError:
+         print('\nThe data input (UComp, VComp) is Numpy array, so you need pass 2D array of Lon and Lat (or their GridMetrics), e.g.:')
+         print('wind_gradients(UComp, VComp, 2DLon, 2DLat)\n')
          return
       else:
 
-            dvdx = cdiff(VComp,'X')
-            dudy = cdiff(UComp*np.cos(Lat*np.pi/180.0),'Y')
-            dx = cdiff(Lon,'X') * np.pi/180.0
-            dy = cdiff(Lat,'Y') * np.pi/180.0
-            omega = 2.0*np.pi/86400.0
-            fc = 2*omega*np.sin(Lat*np.pi/180.0)
-            avor = (dvdx/dx-dudy/dy)/(6.37e6*np.cos(Lat*np.pi/180.0)) + fc
+            if Grid is None:
+               Grid = grid_metrics(Lon, Lat, periodic_x=periodic_x, order=order)
+
+            Kinematics = _run(_wind_gradients, (UComp, VComp, Grid), UComp.shape, out)
 
 
-   elif type(UComp) == type(VComp) == xr.DataArray:
+   elif _is_xarray(UComp) and _is_xarray(VComp):
 
       try:
          assert UComp.dims == VComp.dims
@@ -342,39 +1590,51 @@ def absolute_vorticity(UComp, VComp, Lon=None, Lat=None):
             return
          else:
 
-            CoordsData = UComp.coords
-            DimsData = UComp.dims
+            Template = UComp
 
-            Lon = UComp.coords[(UComp.dims)[-1]].values
-            Lat = UComp.coords[(UComp.dims)[-2]].values
-            Lon, Lat = np.meshgrid(Lon, Lat)
+            if Grid is None:
+               Grid = grid_metrics(UComp, periodic_x=periodic_x, order=order)
 
-            dvdx = cdiff(VComp,'X').values
-            dudy = cdiff(UComp*np.cos(Lat*np.pi/180.0),'Y').values
-            dx = cdiff(Lon,'X') * np.pi/180.0
-            dy = cdiff(Lat,'Y') * np.pi/180.0
-            omega = 2.0*np.pi/86400.0
-            fc = 2*omega*np.sin(Lat*np.pi/180.0)
-            avor = (dvdx/dx-dudy/dy)/(6.37e6*np.cos(Lat*np.pi/180.0)) + fc
+            Kinematics = _run(_wind_gradients, (_data(UComp), _data(VComp), Grid), UComp.shape)
 
-            avor = xr.DataArray(avor, coords=CoordsData, dims=DimsData)
-            avor.name = 'avor'
-            avor.attrs['units'] = 's**-1'
-            avor.attrs['long_name'] = 'Absolute_vorticity'
-            avor.attrs['standard_name'] = 'Absolute_relative_vorticity_of_wind'
+            with _stage('output'):
+               for Name in Kinematics:
+                  Kinematics[Name] = _wrap(Template, Kinematics[Name])
+                  Kinematics[Name].name = Name
+                  Kinematics[Name].attrs.update(_KinematicsAttrs[Name])
 
+               Kinematics = _xr().Dataset(Kinematics)
 
-   return avor;
+
+   return Kinematics;
 
 #-----------------------------------------------------------------------------------------------------------------------------------
-def divergence(UComp, VComp, Lon=None, Lat=None):
+def _advection(Field, UComp, VComp, Grid):
+   Field, UComp, VComp, Grid = _cast(Field), _cast(UComp), _cast(VComp), _metrics(Grid)
+   return _kernel('advection', Field, UComp, VComp, Grid=Grid)(Field, UComp, VComp, Grid)
+
+
+def _advection_numpy(Field, UComp, VComp, Grid):
+   dfdx = _cdiff(Field,'X',Grid.periodic_x,Grid.order)
+   dfdy = _cdiff(Field,'Y',False,Grid.order)
+   return -1.0*( ((UComp*dfdx)/(Grid.coslat*Grid.dx)) + ((VComp*dfdy)/(Grid.dy)) )/6.37e6
+
+
+@_profiled
+def advection(Field, UComp, VComp, Lon=None, Lat=None, Grid=None, periodic_x=False, order=2, out=None, region=None):
 
    '''
-   Calculates the divergence of horizontal wind or some vector field.
+   Calculates the horizontal adveccion of Field. 
 
 
    Parameters
    ----------
+   Field: Numpy array or Xarray.DataArray
+          Their structure can be:
+          - 2D [y,x]
+          - 3D [z,y,x] or [t,y,x]
+          - 4D [t,z,y,x]
+
    UComp: Numpy array or Xarray.DataArray
           Zonal component of wind. Their structure can be:
           - 2D [y,x]
@@ -388,94 +1648,200 @@ def divergence(UComp, VComp, Lon=None, Lat=None):
           - 4D [t,z,y,x]
 
    Lon: Numpy array
-        2D array with the longitudes of UComp and VComp.
+        1D or 2D array with the longitudes of UComp and VComp.
         If UComp and VComp are xarray.DataArray is not necessary define this parameter.
 
    Lat: Numpy array
-        2D array with the latitudes of UComp and VComp.
+        1D or 2D array with the latitudes of UComp and VComp.
         If UComp and VComp are xarray.DataArray is not necessary define this parameter.
 
+   Grid: GridMetrics
+         Horizontal metrics of the grid returned by grid_metrics(Lon, Lat).
+         If it is defined, Lon and Lat are not necessary.
+
+   periodic_x: Boolean or String (str)
+               If True, the grid is global and periodic in X, so the first and last
+               longitudes are computed with the opposite side instead of being NaN.
+               If 'auto', it is detected from the longitudes. If Grid is defined, its
+               own periodic_x is used (see grid_metrics). Default is False.
+
+   order: Integer
+          Order of the horizontal differences: 2, 4 or 6 (see cdiff). If Grid is
+          defined, its own order is used (see grid_metrics). Default is 2.
+
+   out: Numpy array
+        Optional array (e.g. a np.memmap) with the shape of Field where the result is
+        written. It is only used with Numpy arrays.
+
+   region: Tuple
+           Window (lon_min, lon_max, lat_min, lat_max) in degrees where the result is
+           calculated, e.g. (-90.0, -30.0, -60.0, 15.0). Only the window plus a halo of
+           the width of the stencils is computed, and the result has the shape of the
+           window, with the same values of the whole grid over it (out must have the
+           shape of the window too). If lon_min is greater than lon_max the window
+           crosses the dateline, e.g. (170.0, -170.0, -30.0, 30.0). It needs a regular
+           longitude-latitude grid. Default is None (the whole grid).
+
 
    Returns
    -------
-   div: Numpy array or Xarray.DataArray
-        Horizontal divergence of Ucomp and Vcomp [1/s]
-        Negative divergence is also known as convergence.
+   adv: Numpy array or Xarray.DataArray
+        Horizontal advection of Field [Field_units/s]
+        If the inputs are Xarray.DataArray backed by Dask, the result is lazy.
 
    '''
 
-   if type(UComp) == type(VComp) == np.ndarray:
+   try:
+      assert periodic_x is True or periodic_x is False or periodic_x == 'auto'
+   except AssertionError:
+      print("\nThe periodic_x must be True, False or 'auto'\n")
+      return
+
+
+   try:
+      assert order in [2, 4, 6]
+   except AssertionError:
+      print('\nThe order must be 2, 4 or 6\n')
+      return
+
+
+   try:
+      assert _grid_fits(Grid, UComp)
+   except AssertionError:
+      print('\nThe Grid has the shape {} but the data input (Field, UComp, VComp) has {} points [latitude, longitude]\n'.format(Grid.shape, np.shape(UComp)[-2:]))
+      return
+
+
+   if region is not None:
+      return _region(advection, (Field, UComp, VComp), Lon, Lat, Grid, periodic_x, order, region, out)
+
+
+   if _is_numpy(Field) and _is_numpy(UComp) and _is_numpy(VComp):
+
+      try:
+         assert out is None or (_is_numpy(out) and out.shape == Field.shape)
+      except AssertionError:
+         print('\nThe out must be Numpy array with the shape of Field\n')
+         return
+
 
       try:
-         assert type(Lon) == type(Lat) == np.ndarray
+         assert _is_numpy(Lon) and _is_numpy(Lat) or type(Grid) == GridMetrics
       except AssertionError:
-         print('\nThe data input (UComp, VComp) is Numpy array, so you need pass 2D array of Lon and Lat, e.g.:')
+         print('\nThe data input (Field, UComp, VComp) are Numpy array, so you need pass 2D array of Lon and Lat (or their GridMetrics), e.g.:')
          print('hdivg(UComp, VComp, 2DLon, 2DLat)\n')
          return
       else:
 
-            dudx = cdiff(UComp,'X')
-            dvdy = cdiff(VComp*np.cos(Lat*np.pi/180.0),'Y')
-            dx = cdiff(Lon,'X') * np.pi/180.0
-            dy = cdiff(Lat,'Y') * np.pi/180.0
-            div = (dudx/dx+dvdy/dy)/(6.37e6*np.cos(Lat*np.pi/180.0))
+            if Grid is None:
+               Grid = grid_metrics(Lon, Lat, periodic_x=periodic_x, order=order)
 
+            adv = _run(_advection, (Field, UComp, VComp, Grid), Field.shape, out)
 
-   elif type(UComp) == type(VComp) == xr.DataArray:
+
+   elif _is_xarray(Field) and _is_xarray(UComp) and _is_xarray(VComp):
 
       try:
-         assert UComp.dims == VComp.dims
+         assert Field.dims == UComp.dims == VComp.dims
       except AssertionError:
-         print('\nThe data input (UComp, VComp) is Xarray.DataArray but they do not have the same dimensions\n')
+         print('\nThe data input (Field, UComp, VComp) are Xarray.DataArray but they do not have the same dimensions\n')
          return
       else:
 
          try:
-            assert True in [ True if word in (UComp.dims)[-1] else False for word in ['lon','LON','Lon'] ]   and   True in [ True if word in (UComp.dims)[-2] else False for word in ['lat','LAT','Lat'] ]
+            assert True in [ True if word in (Field.dims)[-1] else False for word in ['lon','LON','Lon'] ]   and   True in [ True if word in (Field.dims)[-2] else False for word in ['lat','LAT','Lat'] ]
          except AssertionError:
-            print('\nThe data input (UComp, VComp) is Xarray.DataArray and must have unless two dimensions [latitude, longitude]')
+            print('\nThe data input (Field, UComp, VComp) is Xarray.DataArray and must have unless two dimensions [latitude, longitude]')
             print('If data input have three dimensions their structure must be [level, latitude, longitude] or [time, latitude, longitude]')
             print('If data input have four dimensions their structure must be [time, level, latitude, longitude] or [level, time, latitude, longitude]\n')
             return
          else:
 
-            CoordsData = UComp.coords
-            DimsData = UComp.dims
+            Template = Field
+
+            try:
+               UnitsData = Field.units
+            except:
+               UnitsData = 'Field_units'
+
 
-            Lon = UComp.coords[(UComp.dims)[-1]].values
-            Lat = UComp.coords[(UComp.dims)[-2]].values
-            Lon, Lat = np.meshgrid(Lon, Lat)
+            try:
+               LongNameData = Field.long_name
+            except:
+               LongNameData = 'Field_Name'
 
-            dudx = cdiff(UComp,'X').values
-            dvdy = cdiff(VComp*np.cos(Lat*np.pi/180.0),'Y').values
-            dx = cdiff(Lon,'X') * np.pi/180.0
-            dy = cdiff(Lat,'Y') * np.pi/180.0
-            div = (dudx/dx+dvdy/dy)/(6.37e6*np.cos(Lat*np.pi/180.0))
 
-            div = xr.DataArray(div, coords=CoordsData, dims=DimsData)
-            div.name = 'div'
-            div.attrs['units'] = 's**-1'
-            div.attrs['long_name'] = 'Divergence'
-            div.attrs['standard_name'] = 'Horizontal_divergence_of_wind'
+            if Grid is None:
+               Grid = grid_metrics(Field, periodic_x=periodic_x, order=order)
 
+            adv = _run(_advection, (_data(Field), _data(UComp), _data(VComp), Grid), Field.shape)
 
-   return div;
+            with _stage('output'):
+               adv = _wrap(Template, adv)
+            adv.name = 'adv'
+            adv.attrs['units'] = UnitsData+'/s'
+            adv.attrs['long_name'] = LongNameData+'_advection'
+            adv.attrs['standard_name'] = 'Horizontal_advection_of_'+LongNameData
+
+
+   return adv;
 
 #-----------------------------------------------------------------------------------------------------------------------------------
+def _advection_factors(UComp, VComp, Grid):
+   # wind and metric terms of the advection, u/(cos(lat)*dx) and v/dy, shared by all the fields
+   UComp, VComp, Grid = _cast(UComp), _cast(VComp), _metrics(Grid)
+   return UComp/(Grid.coslat*Grid.dx), VComp/Grid.dy
+
+
+def _batch_advection(Fields, UFactor, VFactor, Grid):
+   Fields, Grid = _cast(Fields), _metrics(Grid)
+   return _kernel('batch_advection', Fields, UFactor, VFactor, Grid=Grid)(Fields, UFactor, VFactor, Grid)
+
+
+def _batch_advection_wind(Fields, UComp, VComp, Grid):
+   # the wind terms of a slab (or of the whole wind), shared by the fields of the stack
+   UFactor, VFactor = _advection_factors(UComp, VComp, Grid)
+   return _batch_advection(Fields, UFactor, VFactor, Grid)
+
 
-def advection(Field, UComp, VComp, Lon=None, Lat=None):
+def _batch_advection_numpy(Fields, UFactor, VFactor, Grid):
+   # advection of a stack of fields [n,...] (or one field) in one vectorized pass,
+   # with the differences updated in place
+   adv = _cdiff(Fields,'X',Grid.periodic_x,Grid.order)
+   adv *= UFactor
+   dfdy = _cdiff(Fields,'Y',False,Grid.order)
+   dfdy *= VFactor
+   adv += dfdy
+   del dfdy
+   adv /= -6.37e6
+   return adv
+
+
+def _advection_attrs(adv, Field):
+   adv.attrs['units'] = Field.attrs.get('units', 'Field_units')+'/s'
+   adv.attrs['long_name'] = Field.attrs.get('long_name', 'Field_Name')+'_advection'
+   adv.attrs['standard_name'] = 'Horizontal_advection_of_'+Field.attrs.get('long_name', 'Field_Name')
+   return adv
+
+
+@_profiled
+def batch_advection(Fields, UComp, VComp, Lon=None, Lat=None, Grid=None, periodic_x=False, order=2, out=None):
 
    '''
-   Calculates the horizontal adveccion of Field. 
+   Calculates the horizontal advection of many fields (e.g. temperature, humidity and
+   geopotential) by the same wind. The grid metrics and the wind terms u/(cos(lat)*dx)
+   and v/dy are computed only once, and the fields of a stack are advected in one
+   vectorized call. The results are the ones of advection within rounding (the wind
+   terms are divided before the product).
 
 
    Parameters
    ----------
-   Field: Numpy array or Xarray.DataArray
-          Their structure can be:
-          - 2D [y,x]
-          - 3D [z,y,x] or [t,y,x]
-          - 4D [t,z,y,x]
+   Fields: Numpy array, Xarray.DataArray or Xarray.Dataset
+           Fields to advect:
+           - Numpy array or Xarray.DataArray: stack of fields with one more leading axis
+             than UComp, e.g. [n,t,z,y,x] (see numpy.stack and Xarray.Dataset.to_array).
+           - Xarray.Dataset: each variable is a field with the dimensions of UComp.
 
    UComp: Numpy array or Xarray.DataArray
           Zonal component of wind. Their structure can be:
@@ -490,93 +1856,143 @@ def advection(Field, UComp, VComp, Lon=None, Lat=None):
           - 4D [t,z,y,x]
 
    Lon: Numpy array
-        2D array with the longitudes of UComp and VComp.
+        1D or 2D array with the longitudes of UComp and VComp.
         If UComp and VComp are xarray.DataArray is not necessary define this parameter.
 
    Lat: Numpy array
-        2D array with the latitudes of UComp and VComp.
+        1D or 2D array with the latitudes of UComp and VComp.
         If UComp and VComp are xarray.DataArray is not necessary define this parameter.
 
+   Grid: GridMetrics
+         Horizontal metrics of the grid returned by grid_metrics(Lon, Lat).
+         If it is defined, Lon and Lat are not necessary.
+
+   periodic_x: Boolean or String (str)
+               If True, the grid is global and periodic in X (see grid_metrics).
+               If Grid is defined, its own periodic_x is used. Default is False.
+
+   order: Integer
+          Order of the horizontal differences: 2, 4 or 6 (see cdiff). If Grid is
+          defined, its own order is used (see grid_metrics). Default is 2.
+
+   out: Numpy array
+        Optional array (e.g. a np.memmap) with the shape of Fields where the result is
+        written. It is only used with Numpy arrays.
+
 
    Returns
    -------
-   adv: Numpy array or Xarray.DataArray
-        Horizontal advection of Field [Field_units/s]
+   adv: Numpy array, Xarray.DataArray or Xarray.Dataset
+        Horizontal advection of each field [Field_units/s], in the structure of Fields.
+        If the inputs are Xarray.DataArray backed by Dask, the result is lazy.
 
    '''
 
-   if type(Field) == type(UComp) == type(VComp) == np.ndarray:
+   try:
+      assert periodic_x is True or periodic_x is False or periodic_x == 'auto'
+   except AssertionError:
+      print("\nThe periodic_x must be True, False or 'auto'\n")
+      return
+
+
+   try:
+      assert order in [2, 4, 6]
+   except AssertionError:
+      print('\nThe order must be 2, 4 or 6\n')
+      return
+
+
+   try:
+      assert _grid_fits(Grid, UComp)
+   except AssertionError:
+      print('\nThe Grid has the shape {} but the data input (Fields, UComp, VComp) has {} points [latitude, longitude]\n'.format(Grid.shape, np.shape(UComp)[-2:]))
+      return
+
+
+   if _is_numpy(Fields) and _is_numpy(UComp) and _is_numpy(VComp):
 
       try:
-         assert type(Lon) == type(Lat) == np.ndarray
+         assert out is None or (_is_numpy(out) and out.shape == Fields.shape)
       except AssertionError:
-         print('\nThe data input (Field, UComp, VComp) are Numpy array, so you need pass 2D array of Lon and Lat, e.g.:')
-         print('hdivg(UComp, VComp, 2DLon, 2DLat)\n')
+         print('\nThe out must be Numpy array with the shape of Fields\n')
+         return
+
+
+      try:
+         assert Fields.ndim == UComp.ndim+1 and Fields.shape[1:] == UComp.shape == VComp.shape
+      except AssertionError:
+         print('\nFields must be a stack of fields [n,...] with the shape of UComp and VComp in the other axes, e.g.:')
+         print('batch_advection(np.stack([Temperature, Humidity]), UComp, VComp, 2DLon, 2DLat)\n')
+         return
+
+
+      try:
+         assert _is_numpy(Lon) and _is_numpy(Lat) or type(Grid) == GridMetrics
+      except AssertionError:
+         print('\nThe data input (Fields, UComp, VComp) are Numpy array, so you need pass 2D array of Lon and Lat (or their GridMetrics), e.g.:')
+         print('batch_advection(Fields, UComp, VComp, 2DLon, 2DLat)\n')
          return
       else:
 
-            dfdx = cdiff(Field,'X')
-            dfdy = cdiff(Field,'Y')
-            dx = cdiff(Lon,'X') * np.pi/180.0
-            dy = cdiff(Lat,'Y') * np.pi/180.0
-            adv = -1.0*( ((UComp*dfdx)/(np.cos(Lat*np.pi/180.0)*dx)) + ((VComp*dfdy)/(dy)) )/6.37e6
+            if Grid is None:
+               Grid = grid_metrics(Lon, Lat, periodic_x=periodic_x, order=order)
 
+            adv = _run(_batch_advection_wind, (Fields, UComp[None], VComp[None], Grid), Fields.shape, out)
 
-   elif type(Field) == type(UComp) == type(VComp) == xr.DataArray:
+
+   elif (_is_xarray(Fields) or _is_xarray(Fields, 'Dataset')) and _is_xarray(UComp) and _is_xarray(VComp):
 
       try:
-         assert Field.dims == UComp.dims == VComp.dims
+         assert UComp.dims == VComp.dims
+         if _is_xarray(Fields):
+            assert Fields.dims[1:] == UComp.dims
+         else:
+            assert False not in [ Fields[Name].dims == UComp.dims for Name in Fields.data_vars ]
       except AssertionError:
-         print('\nThe data input (Field, UComp, VComp) are Xarray.DataArray but they do not have the same dimensions\n')
+         print('\nFields must be a Xarray.DataArray with a leading dimension of fields and the dimensions of UComp and VComp,')
+         print('or a Xarray.Dataset whose variables have the dimensions of UComp and VComp\n')
          return
       else:
 
          try:
-            assert True in [ True if word in (Field.dims)[-1] else False for word in ['lon','LON','Lon'] ]   and   True in [ True if word in (Field.dims)[-2] else False for word in ['lat','LAT','Lat'] ]
+            assert True in [ True if word in (UComp.dims)[-1] else False for word in ['lon','LON','Lon'] ]   and   True in [ True if word in (UComp.dims)[-2] else False for word in ['lat','LAT','Lat'] ]
          except AssertionError:
-            print('\nThe data input (Field, UComp, VComp) is Xarray.DataArray and must have unless two dimensions [latitude, longitude]')
+            print('\nThe data input (Fields, UComp, VComp) is Xarray and must have unless two dimensions [latitude, longitude]')
             print('If data input have three dimensions their structure must be [level, latitude, longitude] or [time, latitude, longitude]')
             print('If data input have four dimensions their structure must be [time, level, latitude, longitude] or [level, time, latitude, longitude]\n')
             return
          else:
 
-            CoordsData = Field.coords
-            DimsData = Field.dims
-
-            try:
-               UnitsData = Field.units
-            except:
-               UnitsData = 'Field_units'
-
+            if Grid is None:
+               Grid = grid_metrics(UComp, periodic_x=periodic_x, order=order)
 
-            try:
-               LongNameData = Field.long_name
-            except:
-               LongNameData = 'Field_Name'
+            UFactor, VFactor = _advection_factors(_data(UComp), _data(VComp), Grid)
 
-
-            Lon = Field.coords[(Field.dims)[-1]].values
-            Lat = Field.coords[(Field.dims)[-2]].values
-            Lon, Lat = np.meshgrid(Lon, Lat)
-
-            dfdx = cdiff(Field,'X').values
-            dfdy = cdiff(Field,'Y').values
-            dx = cdiff(Lon,'X') * np.pi/180.0
-            dy = cdiff(Lat,'Y') * np.pi/180.0
-            adv = -1.0*( ((UComp*dfdx)/(np.cos(Lat*np.pi/180.0)*dx)) + ((VComp*dfdy)/(dy)) )/6.37e6
-
-            adv = xr.DataArray(adv, coords=CoordsData, dims=DimsData)
-            adv.name = 'adv'
-            adv.attrs['units'] = UnitsData+'/s'
-            adv.attrs['long_name'] = LongNameData+'_advection'
-            adv.attrs['standard_name'] = 'Horizontal_advection_of_'+LongNameData
+            if _is_xarray(Fields):
+               adv = _run(_batch_advection, (_data(Fields), UFactor[None], VFactor[None], Grid), Fields.shape)
+               with _stage('output'):
+                  adv = _wrap(Fields, adv)
+               adv.name = 'adv'
+               _advection_attrs(adv, Fields)
+            else:
+               adv = {}
+               for Name in Fields.data_vars:
+                  adv[Name] = _run(_batch_advection, (_data(Fields[Name]), UFactor, VFactor, Grid), UComp.shape)
+               with _stage('output'):
+                  for Name in adv:
+                     adv[Name] = _advection_attrs(_wrap(Fields[Name], adv[Name], Name), Fields[Name])
+                  adv = _xr().Dataset(adv)
 
 
    return adv;
 
 #-----------------------------------------------------------------------------------------------------------------------------------
+def _potential_temperature(Temperature, Factor):
+   return _cast(Temperature)*_cast(Factor)
+
 
-def potential_temperature(Temperature, Levels=None):
+@_profiled
+def potential_temperature(Temperature, Levels=None, out=None):
    '''
    Calculates the potential temperature.
 
@@ -593,19 +2009,31 @@ def potential_temperature(Temperature, Levels=None):
    Levels: Numpy array
            1D array with pressure levels of Temperature.
 
+   out: Numpy array
+        Optional array (e.g. a np.memmap) with the shape of Temperature where the result is
+        written. It is only used with Numpy arrays.
+
 
    Returns
    -------
    PTemp: Numpy array or Xarray.DataArray
           Potential temperature [K].
+          If the inputs are Xarray.DataArray backed by Dask, the result is lazy.
 
    '''
 
-   if type(Temperature) == np.ndarray:
+   if _is_numpy(Temperature):
+
+      try:
+         assert out is None or (_is_numpy(out) and out.shape == Temperature.shape)
+      except AssertionError:
+         print('\nThe out must be Numpy array with the shape of Temperature\n')
+         return
+
 
       try:
          #assert Levels is not None
-         assert type(Levels) == np.ndarray #type(Levels) == list or
+         assert _is_numpy(Levels) #type(Levels) == list or
       except AssertionError:
          print('\nYou need pass 1D array of Levels')
          print('potential_temperature(Temperature, Levels)\n')
@@ -623,10 +2051,10 @@ def potential_temperature(Temperature, Levels=None):
             Levels = Levels[None,:,None,None]
 
 
-         PTemp = Temperature*np.power(1000.0/Levels,0.286)
+         PTemp = _run(_potential_temperature, (Temperature, np.power(1000.0/Levels,0.286)), Temperature.shape, out)
 
 
-   elif type(Temperature) == xr.DataArray:
+   elif _is_xarray(Temperature):
 
       try:
          assert True in [ True if word in (Temperature.dims)[-1] else False for word in ['lon','LON','Lon'] ]   and   True in [ True if word in (Temperature.dims)[-2] else False for word in ['lat','LAT','Lat'] ]
@@ -637,8 +2065,7 @@ def potential_temperature(Temperature, Levels=None):
          return
       else:
 
-         CoordsData = Temperature.coords
-         DimsData = Temperature.dims
+         Template = Temperature
 
          Levels = Temperature.coords[(Temperature.dims)[-3]].values
 
@@ -651,9 +2078,10 @@ def potential_temperature(Temperature, Levels=None):
             Levels = Levels[None,:,None,None]
 
 
-         PTemp = Temperature*np.power(1000.0/Levels,0.286)
+         PTemp = _run(_potential_temperature, (_data(Temperature), np.power(1000.0/Levels,0.286)), Temperature.shape)
 
-         PTemp = xr.DataArray(PTemp, coords=CoordsData, dims=DimsData)
+         with _stage('output'):
+            PTemp = _wrap(Template, PTemp)
          PTemp.name = 'PTemp'
          PTemp.attrs['units'] = 'K'
          PTemp.attrs['long_name'] = 'Potential_temperature'
@@ -664,7 +2092,155 @@ def potential_temperature(Temperature, Levels=None):
 
 #-----------------------------------------------------------------------------------------------------------------------------------
 
-def potential_vorticity(Temperature, UComp, VComp, Lon=None, Lat=None, Levels=None):
+_PVAttrs = {'units': 's**-1', 'long_name': 'Potential_vorticity', 'standard_name': 'Potential_vorticity'}
+
+
+def _pv_levels(Temperature, UComp, VComp, Levels, Grid, dtype, Start, Stop, out=None):
+   # Fused potential vorticity of 3D [z,y,x] fields in the interior levels
+   # Start to Stop-1, computed level by level. Only the potential temperature of
+   # three levels and three scratch planes are kept in memory, and the operations
+   # are the same (and in the same order) of the expression
+   # -9.8*(AVor*dPTempdp - dVCompdp*dPTempdx + dUCompdp*dPTempdy).
+   # Yields the level k, its potential vorticity (written in out[k], or in a scratch
+   # plane reused by the next level) and its potential temperature.
+   dtype = np.dtype(dtype)
+
+   Factor = np.power(1000.0/Levels,0.286)
+   Levels2 = Levels*100.0
+   Grid = Grid.astype(dtype)
+
+   Shape = Temperature.shape[1:]
+   PTemp = [np.empty(Shape, dtype=dtype) for i in range(3)]
+   A, B, C = [np.empty(Shape, dtype=dtype) for i in range(3)]
+
+   np.multiply(Temperature[Start-1], Factor[Start-1], out=PTemp[(Start-1)%3], dtype=dtype)
+   np.multiply(Temperature[Start], Factor[Start], out=PTemp[Start%3], dtype=dtype)
+
+   for k in range(Start, Stop):
+
+      Below, Center, Above = PTemp[(k-1)%3], PTemp[k%3], PTemp[(k+1)%3]
+      np.multiply(Temperature[k+1], Factor[k+1], out=Above, dtype=dtype)
+      dp = dtype.type(Levels2[k+1] - Levels2[k-1])
+
+      # absolute vorticity
+      np.multiply(UComp[k], Grid.coslat, out=B, dtype=dtype)
+      _cdiff_stencil(B, 0, C, Grid.order)
+      np.divide(C, Grid.dy, out=C)
+      _cdiff_stencil(VComp[k], 1, A, Grid.order, Grid.periodic_x)
+      np.divide(A, Grid.dx, out=A)
+      np.subtract(A, C, out=A)
+      np.divide(A, Grid.acoslat, out=A)
+      np.add(A, Grid.fc, out=A)
+
+      # AVor*dPTempdp
+      np.subtract(Above, Below, out=B)
+      np.divide(B, dp, out=B)
+      np.multiply(A, B, out=A)
+
+      # - dVCompdp*dPTempdx
+      _cdiff_stencil(Center, 1, B, Grid.order, Grid.periodic_x)
+      np.divide(B, Grid.dxm, out=B)
+      np.subtract(VComp[k+1], VComp[k-1], out=C, dtype=dtype)
+      np.divide(C, dp, out=C)
+      np.multiply(C, B, out=C)
+      np.subtract(A, C, out=A)
+
+      # + dUCompdp*dPTempdy
+      _cdiff_stencil(Center, 0, B, Grid.order)
+      np.divide(B, Grid.dym, out=B)
+      np.subtract(UComp[k+1], UComp[k-1], out=C, dtype=dtype)
+      np.divide(C, dp, out=C)
+      np.multiply(C, B, out=C)
+      np.add(A, C, out=A)
+
+      PVor = A if out is None else out[k]
+      np.multiply(A, -9.8, out=PVor)
+      yield k, PVor, Center
+
+
+def _pv_kernel(Temperature, UComp, VComp, Levels, Grid, out, Start, Stop):
+   # potential vorticity of the levels Start to Stop-1 written in out
+   for k, PVor, PTemp in _pv_levels(Temperature, UComp, VComp, Levels, Grid, out.dtype, Start, Stop, out):
+      pass
+   return out
+
+
+def _potential_vorticity(Temperature, UComp, VComp, Levels, Grid, out=None):
+   # 3D [z,y,x] or 4D [t,z,y,x] fields. The interior levels of each time are
+   # split in blocks that are computed in a pool of threads. The kernel reads three
+   # levels at a time, so np.memmap inputs and out keep the memory bounded.
+   dtype = _result_dtype(Temperature.dtype, UComp.dtype, VComp.dtype)
+
+   if out is not None and out.dtype != dtype:
+      # computed time by time in the dtype of the result, and then written in out
+      if Temperature.ndim == 3:
+         out[...] = _potential_vorticity(Temperature, UComp, VComp, Levels, Grid)
+      for t in range(Temperature.shape[0] if Temperature.ndim == 4 else 0):
+         out[t] = _potential_vorticity(Temperature[t], UComp[t], VComp[t], Levels, Grid)
+      return out
+
+   PVor = np.empty(Temperature.shape, dtype=dtype) if out is None else out
+
+   if Temperature.ndim == 3:
+      Temperature, UComp, VComp, PVor4 = Temperature[None], UComp[None], VComp[None], PVor[None]
+   else:
+      PVor4 = PVor
+
+   nt, nz = Temperature.shape[:2]
+   PVor4[:,0] = np.nan
+   PVor4[:,nz-1] = np.nan
+   if nz < 3:
+      return PVor
+
+   Workers = _Options['workers']
+   Parts = min(nz-2, max(1, -(-Workers//nt)))
+   Tasks = [ (t, i[0], i[-1]+1) for t in range(nt) for i in np.array_split(np.arange(1, nz-1), Parts) ]
+
+   if Workers == 1:
+      for t, Start, Stop in Tasks:
+         _pv_kernel(Temperature[t], UComp[t], VComp[t], Levels, Grid, PVor4[t], Start, Stop)
+   else:
+      with ThreadPoolExecutor(max_workers=Workers) as Pool:
+         Futures = [ Pool.submit(_pv_kernel, Temperature[t], UComp[t], VComp[t], Levels, Grid, PVor4[t], Start, Stop) for t, Start, Stop in Tasks ]
+         for Future in Futures:
+            Future.result()
+
+   return PVor
+
+
+def _pv_block(Temperature, UComp, VComp, Levels, Lat, Lon, Order=2):
+   # Levels, Lat and Lon are the coordinates broadcasted to the block, and the
+   # block carries a halo of one cell in z and Order/2 cells in y and x (wrapped
+   # in x on periodic grids, so the block is not periodic and its dx crosses the
+   # dateline)
+   Lead = (0,)*(Temperature.ndim-3)
+   Grid = grid_metrics(Lon[Lead+(0,)], Lat[Lead+(0,)], order=Order)
+   return _potential_vorticity(Temperature, UComp, VComp, Levels[Lead+(slice(None),0,0)], Grid)
+
+
+def _potential_vorticity_dask(Temperature, UComp, VComp, Levels, Grid):
+   import dask.array as da
+
+   Temperature = da.asarray(Temperature)
+   Chunks = Temperature.chunks
+   Shape = Temperature.shape
+   UComp = da.asarray(UComp).rechunk(Chunks)
+   VComp = da.asarray(VComp).rechunk(Chunks)
+
+   Levels = da.broadcast_to(da.from_array(Levels[:,None,None], chunks=(Chunks[-3],1,1)), Shape, chunks=Chunks)
+   Lat = da.broadcast_to(da.from_array(Grid.Lat, chunks=Chunks[-2:]), Shape, chunks=Chunks)
+   Lon = da.broadcast_to(da.from_array(Grid.Lon, chunks=Chunks[-2:]), Shape, chunks=Chunks)
+
+   n = Temperature.ndim
+   Depth = {n-3: 1, n-2: Grid.order//2, n-1: Grid.order//2}
+   Boundary = {n-1: 'periodic'} if Grid.periodic_x else 'none'
+   return da.map_overlap(_pv_block, Temperature, UComp, VComp, Levels, Lat, Lon, depth=Depth, boundary=Boundary,
+                         dtype=_result_dtype(Temperature.dtype, UComp.dtype, VComp.dtype), Order=Grid.order)
+
+
+@_profiled
+def potential_vorticity(Temperature, UComp, VComp, Lon=None, Lat=None, Levels=None, Grid=None, periodic_x=False, order=2, out=None, region=None,
+                        isentropes=None):
 
    '''
    Calculates the baroclinic potential vorticity.
@@ -688,57 +2264,137 @@ def potential_vorticity(Temperature, UComp, VComp, Lon=None, Lat=None, Levels=No
           - 4D [t,z,y,x]
 
    Lon: Numpy array
-        2D array with the longitudes of UComp and VComp.
+        1D or 2D array with the longitudes of UComp and VComp.
         If UComp and VComp are xarray.DataArray is not necessary define this parameter.
 
    Lat: Numpy array
-        2D array with the latitudes of UComp and VComp.
+        1D or 2D array with the latitudes of UComp and VComp.
         If UComp and VComp are xarray.DataArray is not necessary define this parameter.
 
+   Grid: GridMetrics
+         Horizontal metrics of the grid returned by grid_metrics(Lon, Lat).
+         If it is defined, Lon and Lat are not necessary.
+
+   periodic_x: Boolean or String (str)
+               If True, the grid is global and periodic in X, so the first and last
+               longitudes are computed with the opposite side instead of being NaN.
+               If 'auto', it is detected from the longitudes. If Grid is defined, its
+               own periodic_x is used (see grid_metrics). Default is False.
+
+   order: Integer
+          Order of the horizontal differences: 2, 4 or 6 (see cdiff). If Grid is
+          defined, its own order is used (see grid_metrics). Default is 2.
+
 
    Levels: Numpy array
            1D array with pressure levels of Temperature.
            If UComp and VComp are xarray.DataArray is not necessary define this parameter.
 
+   out: Numpy array
+        Optional array (e.g. a np.memmap) with the shape of Temperature where the result is
+        written. It is only used with Numpy arrays.
+
+   region: Tuple
+           Window (lon_min, lon_max, lat_min, lat_max) in degrees where the result is
+           calculated, e.g. (-90.0, -30.0, -60.0, 15.0). Only the window plus a halo of
+           the width of the stencils is computed, and the result has the shape of the
+           window, with the same values of the whole grid over it (out must have the
+           shape of the window too). If lon_min is greater than lon_max the window
+           crosses the dateline, e.g. (170.0, -170.0, -30.0, 30.0). It needs a regular
+           longitude-latitude grid. Default is None (the whole grid).
+
+   isentropes: Float or 1D array
+               Potential temperatures [K] of isentropic surfaces, e.g. 330.0 or [315.0, 330.0].
+               If it is defined, the potential vorticity is interpolated to them while it
+               is computed level by level (see isentropic_interpolate), so the potential
+               vorticity and potential temperature of all the levels are never in memory.
+               The result is [n,y,x] or [t,n,y,x] (n is the number of isentropes, without
+               that axis if it is a scalar), and out must have that shape.
+               Default is None (the potential vorticity on the pressure levels).
+
 
    Returns
    -------
    PVor: Numpy array or Xarray.DataArray
          Baroclinic potential voticity [1/s].
+         With isentropes, on the isentropic surfaces (with the dimension theta
+         instead of the levels with Xarray.DataArray).
+         If the inputs are Xarray.DataArray backed by Dask, the result is lazy.
    '''
 
-   if type(Temperature) == type(UComp) == type(VComp) == np.ndarray:
+   try:
+      assert periodic_x is True or periodic_x is False or periodic_x == 'auto'
+   except AssertionError:
+      print("\nThe periodic_x must be True, False or 'auto'\n")
+      return
+
+
+   try:
+      assert order in [2, 4, 6]
+   except AssertionError:
+      print('\nThe order must be 2, 4 or 6\n')
+      return
+
+
+   if isentropes is not None:
+      from .isentropic import _targets, _isentropic_shape, _isentropic_pv, _isentropic_dask, _isentropic_output
+      Isentropes = _targets(isentropes)
+      try:
+         assert Isentropes is not None
+      except AssertionError:
+         print('\nThe isentropes must be a number or 1D array of potential temperatures [K], e.g. 330.0 or [315.0, 330.0]\n')
+         return
+
+
+   try:
+      assert _grid_fits(Grid, Temperature)
+   except AssertionError:
+      print('\nThe Grid has the shape {} but the data input (Temperature, UComp, VComp) has {} points [latitude, longitude]\n'.format(Grid.shape, np.shape(Temperature)[-2:]))
+      return
+
+
+   if region is not None:
+      return _region(potential_vorticity, (Temperature, UComp, VComp), Lon, Lat, Grid, periodic_x, order, region, out, Levels=Levels,
+                     isentropes=isentropes)
+
+
+   if _is_numpy(Temperature) and _is_numpy(UComp) and _is_numpy(VComp):
+
+      Shape = Temperature.shape
+      if isentropes is not None:
+         Shape = _isentropic_shape(Temperature.shape, len(Isentropes[0]))
+         Shape = Temperature.shape[:-3] + Temperature.shape[-2:] if Isentropes[1] else Shape
+
+      try:
+         assert out is None or (_is_numpy(out) and out.shape == Shape)
+      except AssertionError:
+         print('\nThe out must be Numpy array with the shape {} of the result\n'.format(Shape))
+         return
+
 
       try:
-         assert type(Lon) == type(Lat) == type(Levels) == np.ndarray
+         assert (_is_numpy(Lon) and _is_numpy(Lat) or type(Grid) == GridMetrics) and _is_numpy(Levels)
       except AssertionError:
-         print('\nThe data input (Temperature, UComp, VComp) are Numpy array, so you need pass 2D array of Lon and Lat,')
+         print('\nThe data input (Temperature, UComp, VComp) are Numpy array, so you need pass 2D array of Lon and Lat (or their GridMetrics),')
          print('and 1D array of Levels, e.g.:')
          print('potential_vorticity(Temperature, UComp, VComp, 2DLon, 2DLat, 1DLevels)\n')
          return
       else:
 
-         if Temperature.ndim == 3:
-            Levels2 = Levels[:,None,None]*100.0
-         elif Temperature.ndim == 4:
-            Levels2 = Levels[None,:,None,None]*100.0
-
+         if Grid is None:
+            Grid = grid_metrics(Lon, Lat, periodic_x=periodic_x, order=order)
 
-         AVor = absolute_vorticity(UComp, VComp, Lon=Lon, Lat=Lat)
-         PTemp = potential_temperature(Temperature, Levels=Levels)
-         dx = 6.37e6 * cdiff(Lon,'X') * np.pi/180.0 * np.cos(Lat*np.pi/180.0)
-         dy = 6.37e6 * cdiff(Lat,'Y') * np.pi/180.0
-         dp = cdiff(Levels2,'Z')
-         dPTempdp = cdiff(PTemp,'Z')/dp
-         dUCompdp = cdiff(UComp,'Z')/dp
-         dVCompdp = cdiff(VComp,'Z')/dp
-         dPTempdx = cdiff(PTemp,'X')/dx
-         dPTempdy = cdiff(PTemp,'Y')/dy
+         with _stage('kernel'):
+            if isentropes is not None:
+               Out = None if out is None else (out[...,None,:,:] if Isentropes[1] else out)
+               PVor = _isentropic_pv(Temperature, UComp, VComp, Levels, Grid, Isentropes[0], Out)
+               if Isentropes[1]:
+                  PVor = PVor[...,0,:,:] if out is None else out
+            else:
+               PVor = _potential_vorticity(Temperature, UComp, VComp, Levels, Grid, out)
 
-         PVor = -9.8*(AVor*dPTempdp - dVCompdp*dPTempdx + dUCompdp*dPTempdy)
 
-
-   elif type(Temperature) == type(UComp) == type(VComp) == xr.DataArray:
+   elif _is_xarray(Temperature) and _is_xarray(UComp) and _is_xarray(VComp):
 
       try:
          assert True in [ True if word in (Temperature.dims)[-1] else False for word in ['lon','LON','Lon'] ]   and   True in [ True if word in (Temperature.dims)[-2] else False for word in ['lat','LAT','Lat'] ]
@@ -749,43 +2405,47 @@ def potential_vorticity(Temperature, UComp, VComp, Lon=None, Lat=None, Levels=No
          return
       else:
 
-         CoordsData = Temperature.coords
-         DimsData = Temperature.dims
+         Template = Temperature
 
-         Lon = Temperature.coords[(Temperature.dims)[-1]].values
-         Lat = Temperature.coords[(Temperature.dims)[-2]].values
          Levels = Temperature.coords[(Temperature.dims)[-3]].values
 
-         Lon, Lat = np.meshgrid(Lon, Lat)
-
-
-         if Temperature.ndim == 3:
-            Levels = Levels[:,None,None]*100.0
-         elif Temperature.ndim == 4:
-            Levels = Levels[None,:,None,None]*100.0
-
-
-         AVor = absolute_vorticity(UComp, VComp).values
-         PTemp = potential_temperature(Temperature).values
-         dx = 6.37e6 * cdiff(Lon,'X') * np.pi/180.0 * np.cos(Lat*np.pi/180.0)
-         dy = 6.37e6 * cdiff(Lat,'Y') * np.pi/180.0
-         dp = cdiff(Levels,'Z')
-         dPTempdp = cdiff(PTemp,'Z')/dp
-         dUCompdp = cdiff(UComp.values,'Z')/dp
-         dVCompdp = cdiff(VComp.values,'Z')/dp
-         dPTempdx = cdiff(PTemp,'X')/dx
-         dPTempdy = cdiff(PTemp,'Y')/dy
-
-         PVor = -9.8*(AVor*dPTempdp - dVCompdp*dPTempdx + dUCompdp*dPTempdy)
-
-         PVor = xr.DataArray(PVor, coords=CoordsData, dims=DimsData)
+         if Grid is None:
+            Grid = grid_metrics(Temperature, periodic_x=periodic_x, order=order)
+
+
+         with _stage('kernel'):
+            if _is_dask(Temperature.data) or _is_dask(UComp.data) or _is_dask(VComp.data):
+               PVor = _potential_vorticity_dask(_data(Temperature), _data(UComp), _data(VComp), Levels, Grid)
+               if isentropes is not None:
+                  Shape = (1,)*(Temperature.ndim-3) + (len(Levels), 1, 1)
+                  PTemp = _data(Temperature)*np.power(1000.0/Levels,0.286).reshape(Shape)
+                  PVor = _isentropic_dask(PVor, PTemp.astype(PVor.dtype), Isentropes[0])
+            elif isentropes is not None:
+               PVor = _isentropic_pv(Temperature.values, UComp.values, VComp.values, Levels, Grid, Isentropes[0])
+            else:
+               PVor = _potential_vorticity(Temperature.values, UComp.values, VComp.values, Levels, Grid)
+
+         if isentropes is not None:
+            with _stage('output'):
+               PVor = _isentropic_output(Template, PVor, Isentropes[0], Isentropes[1], 'PVor', dict(_PVAttrs))
+            return PVor
+
+         with _stage('output'):
+            PVor = _wrap(Template, PVor)
          PVor.name = 'PVor'
-         PVor.attrs['units'] = 's**-1'
-         PVor.attrs['long_name'] = 'Potential_vorticity'
-         PVor.attrs['standard_name'] = 'Potential_vorticity'
+         PVor.attrs.update(_PVAttrs)
 
 
    return PVor;
 
+
+#-----------------------------------------------------------------------------------------------------------------------------------
+register_backend('numpy', {'cdiff': _cdiff_kernel,
+                           'relative_vorticity': _relative_vorticity_numpy,
+                           'absolute_vorticity': _absolute_vorticity_numpy,
+                           'divergence': _divergence_numpy,
+                           'advection': _advection_numpy,
+                           'batch_advection': _batch_advection_numpy})
+
 #-----------------------------------------------------------------------------------------------------------------------------------
 
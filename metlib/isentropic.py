@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Interpolation of fields on pressure levels to isentropic surfaces
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .options import _Options
+from .functions import _is_numpy, _is_xarray, _is_dask, _xr, _data, _result_dtype, _pv_levels
+from .profiling import _stage, _profiled
+#-----------------------------------------------------------------------------------------------------------------------------------
+class _Isentropes(object):
+   # linear interpolation in potential temperature to the Targets [K] of a field
+   # received level by level, written in out [n,y,x]. Each target is interpolated
+   # between the two consecutive levels whose potential temperatures bracket it, and
+   # when a column brackets it more than once (e.g. an unstable layer near the ground)
+   # the highest bracket is kept: the last one if the levels are received from the
+   # ground up, or the first one if they are received from the top down (TopDown).
+   # Only the previous level and a few scratch planes are kept.
+
+   def __init__(self, Targets, out, TopDown=False):
+      self.Targets = Targets
+      self.out = out
+      self.TopDown = TopDown
+      self.Found = np.zeros(out.shape, dtype=bool) if TopDown else None
+      self.Field = None
+      self.Theta = None
+
+
+   def push(self, Field, Theta):
+      dtype = self.out.dtype
+      Field = np.asarray(Field, dtype=dtype)
+      Theta = np.asarray(Theta, dtype=dtype)
+
+      if self.Theta is None:
+         self.Field, self.Theta = Field.copy(), Theta.copy()
+         return
+
+      Low = np.fmin(self.Theta, Theta)
+      High = np.fmax(self.Theta, Theta)
+      Range = np.nanmin(Low), np.nanmax(High)
+      Targets = [ (i, Target) for i, Target in enumerate(self.Targets) if Range[0] <= Target <= Range[1] ]
+
+      if len(Targets) > 0:
+         with np.errstate(divide='ignore', invalid='ignore'):
+            Step = Theta - self.Theta
+            Change = Field - self.Field
+            for i, Target in Targets:
+               Bracket = (Low <= Target) & (High >= Target) & (Step != 0)
+               if self.TopDown:
+                  Bracket &= ~self.Found[i]
+                  self.Found[i] |= Bracket
+               Weight = Target - self.Theta
+               Weight /= Step
+               Weight *= Change
+               Weight += self.Field
+               np.copyto(self.out[i], Weight, where=Bracket)
+
+      np.copyto(self.Field, Field)
+      np.copyto(self.Theta, Theta)
+
+
+
+def _targets(Targets):
+   # 1D float64 array of the target potential temperatures and if they were a scalar,
+   # None if they are not valid
+   try:
+      Array = np.asarray(Targets, dtype=np.float64)
+      assert Array.ndim <= 1 and Array.size >= 1 and np.all(np.isfinite(Array))
+   except (TypeError, ValueError, AssertionError):
+      return None
+   return Array.reshape(-1), Array.ndim == 0
+
+
+def _isentropic_shape(Shape, nTargets):
+   # shape of the result of fields of Shape [...,z,y,x] on nTargets isentropic surfaces
+   return tuple(Shape[:-3]) + (nTargets,) + tuple(Shape[-2:])
+
+
+def _over_times(Function, nt):
+   # Function(t) for the times of 4D fields, in a pool of workers threads
+   Workers = _Options['workers']
+   if Workers == 1 or nt == 1:
+      for t in range(nt):
+         Function(t)
+      return
+   with ThreadPoolExecutor(max_workers=Workers) as Pool:
+      for Future in [ Pool.submit(Function, t) for t in range(nt) ]:
+         Future.result()
+
+
+def _isentropic(Field, Theta, Targets, out=None):
+   # Numpy fields [...,z,y,x] interpolated to the Targets: [...,n,y,x]
+   dtype = _result_dtype(Field.dtype, Theta.dtype)
+   Result = np.full(_isentropic_shape(Field.shape, len(Targets)), np.nan, dtype=dtype) if out is None else out
+   if out is not None:
+      Result[...] = np.nan
+
+   Field4 = Field.reshape((-1,)+Field.shape[-3:])
+   Theta4 = Theta.reshape((-1,)+Theta.shape[-3:])
+   Result4 = Result.reshape((-1,)+Result.shape[-3:])
+   nz = Field.shape[-3]
+
+   # the levels from the ground up, where the potential temperature is lower
+   Up = np.nanmean(Theta4[:,0]) <= np.nanmean(Theta4[:,-1])
+   Order = range(nz) if Up else range(nz-1, -1, -1)
+
+   def interpolate(t):
+      Interpolator = _Isentropes(Targets, Result4[t])
+      for k in Order:
+         Interpolator.push(Field4[t,k], Theta4[t,k])
+
+   _over_times(interpolate, Field4.shape[0])
+   return Result
+
+
+def _isentropic_pv(Temperature, UComp, VComp, Levels, Grid, Targets, out=None):
+   # potential vorticity of 3D [z,y,x] or 4D [t,z,y,x] fields interpolated to the
+   # Targets as it is computed level by level, so the potential vorticity and the
+   # potential temperature of the whole fields are never in memory
+   dtype = _result_dtype(Temperature.dtype, UComp.dtype, VComp.dtype)
+   Result = np.full(_isentropic_shape(Temperature.shape, len(Targets)), np.nan, dtype=dtype) if out is None else out
+   if out is not None:
+      Result[...] = np.nan
+
+   if Temperature.ndim == 3:
+      Temperature, UComp, VComp, Result4 = Temperature[None], UComp[None], VComp[None], Result[None]
+   else:
+      Result4 = Result
+
+   nz = Temperature.shape[1]
+   if nz < 3:
+      return Result
+
+   Factor = np.power(1000.0/Levels,0.286)
+   # the kernel gives the levels in their order, from the top down if the pressure increases
+   TopDown = Levels[0] < Levels[-1]
+
+   def interpolate(t):
+      Interpolator = _Isentropes(Targets, Result4[t], TopDown)
+      Missing = np.full(Temperature.shape[2:], np.nan, dtype=dtype)
+      Interpolator.push(Missing, np.multiply(Temperature[t,0], Factor[0], dtype=dtype))
+      for k, PVor, PTemp in _pv_levels(Temperature[t], UComp[t], VComp[t], Levels, Grid, dtype, 1, nz-1):
+         Interpolator.push(PVor, PTemp)
+      Interpolator.push(Missing, np.multiply(Temperature[t,nz-1], Factor[nz-1], dtype=dtype))
+
+   _over_times(interpolate, Temperature.shape[0])
+   return Result
+
+
+def _isentropic_dask(Field, Theta, Targets):
+   # lazy interpolation of Dask arrays, with the whole levels in each chunk
+   import dask.array as da
+   axis = Field.ndim-3
+   Field = da.asarray(Field).rechunk({axis: -1})
+   Theta = da.asarray(Theta).rechunk(Field.chunks)
+   Chunks = Field.chunks[:axis] + ((len(Targets),),) + Field.chunks[axis+1:]
+   return da.map_blocks(_isentropic, Field, Theta, Targets=Targets, chunks=Chunks, dtype=_result_dtype(Field.dtype, Theta.dtype))
+
+
+def _isentropic_output(Template, Data, Targets, Scalar, Name, Attrs):
+   # Xarray.DataArray of the result with the dimension of the levels of Template
+   # replaced by the dimension theta of the Targets (a coordinate if they are a scalar)
+   xr = _xr()
+   Level = Template.dims[-3]
+   Dims = Template.dims[:-3] + ('theta',) + Template.dims[-2:]
+   Coords = dict( (Coord, Template.coords[Coord]) for Coord in Template.coords if Level not in Template.coords[Coord].dims )
+   Coords['theta'] = xr.DataArray(Targets, dims=('theta',), attrs={'units': 'K', 'long_name': 'Potential_temperature'})
+   Result = xr.DataArray(Data, dims=Dims, coords=Coords, name=Name, attrs=Attrs)
+   if Scalar:
+      Result = Result.isel(theta=0)
+   return Result
+
+
+@_profiled
+def isentropic_interpolate(Field, Theta, Targets):
+
+   '''
+   Interpolates a field on pressure levels (e.g. potential vorticity) to isentropic
+   surfaces, i.e. where the potential temperature Theta is equal to the Targets.
+
+   All the columns are processed at once, level by level: each target is linearly
+   interpolated in Theta between the two consecutive levels whose potential
+   temperatures bracket it, so only the previous level and a few planes [y,x] are
+   kept in memory besides the result. When a column brackets a target more than once
+   (e.g. an unstable layer near the ground) the highest bracket is kept, and the
+   columns where the target is below the lowest level or above the highest one are
+   NaN. The potential vorticity can be interpolated while it is computed with the
+   option isentropes of potential_vorticity.
+
+
+   Parameters
+   ----------
+   Field: Numpy array or Xarray.DataArray
+          Field on pressure levels. Their structure can be:
+          - 3D [z,y,x]
+          - 4D [t,z,y,x]
+
+   Theta: Numpy array or Xarray.DataArray
+          Potential temperature [K] of the levels of Field, with its shape
+          (see potential_temperature).
+
+   Targets: Float or 1D array
+            Potential temperatures [K] of the isentropic surfaces, e.g. 330.0 or
+            [300.0, 315.0, 330.0, 350.0].
+
+
+   Returns
+   -------
+   Result: Numpy array or Xarray.DataArray
+           Field on the isentropic surfaces: [n,y,x] or [t,n,y,x], where n is the
+           number of Targets, or [y,x] and [t,y,x] if Targets is a scalar. With
+           Xarray.DataArray the dimension of the levels is replaced by theta.
+           If the inputs are Xarray.DataArray backed by Dask, the result is lazy.
+
+   '''
+
+   Valid = _targets(Targets)
+
+   try:
+      assert Valid is not None
+   except AssertionError:
+      print('\nThe Targets must be a number or 1D array of potential temperatures [K], e.g. 330.0 or [300.0, 330.0]\n')
+      return
+
+   Targets, Scalar = Valid
+
+   try:
+      assert (_is_numpy(Field) and _is_numpy(Theta)) or (_is_xarray(Field) and _is_xarray(Theta))
+      assert Field.ndim in [3, 4] and Field.shape == Theta.shape
+   except AssertionError:
+      print('\nField and Theta must be Numpy arrays or Xarray.DataArray with the same shape [z,y,x] or [t,z,y,x]\n')
+      return
+
+
+   if _is_numpy(Field):
+
+      with _stage('kernel'):
+         Result = _isentropic(Field, Theta, Targets)
+      return Result[...,0,:,:] if Scalar else Result
+
+
+   with _stage('kernel'):
+      if _is_dask(Field.data) or _is_dask(Theta.data):
+         Result = _isentropic_dask(_data(Field), _data(Theta), Targets)
+      else:
+         Result = _isentropic(Field.values, Theta.values, Targets)
+
+   with _stage('output'):
+      Result = _isentropic_output(Field, Result, Targets, Scalar, Field.name, dict(Field.attrs))
+   return Result
+
+#-----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Memory budget of the calculations of metlib: peak memory of the diagnostics
+             and blocks of the leading axes (time and level) that fit a budget
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import numpy as np
+from .options import _Options, _memory_bytes
+from .backends import _load, _resolve
+from .functions import _result_dtype, _bounded_slabs, _is_numpy, GridMetrics
+#-----------------------------------------------------------------------------------------------------------------------------------
+# temporaries of each diagnostic while it is computed, in fields of the size of the result
+# (measured with tracemalloc): with the 'numpy' backend and with the compiled ones. The
+# fused kernels of numba only allocate their result, but wind_gradients has no compiled
+# kernel. potential_vorticity is computed level by level, so its temporaries are scratch
+# planes [y,x] of each worker instead of fields.
+_Temporaries = {'relative_vorticity': (3, 0), 'absolute_vorticity': (3, 0), 'divergence': (3, 0),
+                'wind_gradients': (5, 5), 'advection': (4, 0), 'batch_advection': (3, 2),
+                'potential_temperature': (0, 0), 'potential_vorticity': (7, 7)}
+
+# number of result fields and input fields of each diagnostic
+_Outputs = {'wind_gradients': 6}
+_Inputs = {'advection': 3, 'batch_advection': 1, 'potential_temperature': 1, 'potential_vorticity': 3}
+
+# diagnostic and name of the kernel of the backends of the kernels run by _run
+_Kernels = {'_relative_vorticity': ('relative_vorticity', 'relative_vorticity'),
+            '_absolute_vorticity': ('absolute_vorticity', 'absolute_vorticity'),
+            '_divergence': ('divergence', 'divergence'),
+            '_wind_gradients': ('wind_gradients', None),
+            '_advection': ('advection', 'advection'),
+            '_batch_advection': ('batch_advection', 'batch_advection'),
+            '_batch_advection_wind': ('batch_advection', 'batch_advection'),
+            '_potential_temperature': ('potential_temperature', None)}
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _size(Bytes):
+   # size in bytes with the units of max_memory (powers of 1000)
+   for Unit in ['B', 'KB', 'MB', 'GB']:
+      if abs(Bytes) < 1000.0:
+         return '{:.1f} {}'.format(Bytes, Unit)
+      Bytes = Bytes/1000.0
+   return '{:.1f} TB'.format(Bytes)
+
+
+def _block_shape(Block, Shape):
+   # shape of a block (tuple of slices of the leading axes) of an array of Shape
+   return tuple( len(range(*Block[i].indices(n))) if i < len(Block) else n for i, n in enumerate(Shape) )
+
+
+def _compiled(Kernel, Order=2):
+   # True if the backend option has a compiled kernel Kernel for grids of order Order
+   Backend = _resolve(_Options['backend'])
+   if Kernel is None or Backend == 'numpy' or Order != 2:
+      return False
+   Kernels = _load(Backend)
+   return Kernels is not None and Kernel in Kernels
+
+
+
+class MemoryPlan(object):
+
+   '''
+   Plan of the calculation of a diagnostic within a memory budget, returned by
+   memory_plan. print(Plan) shows its report.
+
+
+   Attributes
+   ----------
+   diagnostic: String (str)
+               Name of the diagnostic.
+
+   shape: Tuple
+          Shape of the result.
+
+   dtype: Numpy dtype
+          dtype of the result.
+
+   max_memory: Integer
+               Memory budget in bytes (None if there is no budget).
+
+   blocks: List
+           Blocks of the leading axes (tuples of slices) computed one after other,
+           workers blocks at a time. [()] when the diagnostic is computed at once.
+
+   block_shape: Tuple
+                Shape of the largest block.
+
+   result: Integer
+           Bytes of the result (0 when it is written in an out array).
+
+   temporaries: Integer
+                Bytes of the temporaries at the peak (blocks of inputs, intermediate
+                fields and results of the blocks).
+
+   peak: Integer
+         Predicted peak memory in bytes, result plus temporaries.
+
+   fits: Boolean
+         True if peak is lower or equal than max_memory.
+
+   '''
+
+   def __init__(self, Diagnostic, Shape, dtype, Budget, Blocks, Result, Temporaries, Workers, Compiled):
+      self.diagnostic = Diagnostic
+      self.shape = tuple(Shape)
+      self.dtype = np.dtype(dtype)
+      self.max_memory = Budget
+      self.blocks = Blocks
+      self.block_shape = max([ _block_shape(Block, Shape) for Block in Blocks ], key=lambda Block: np.prod(Block))
+      self.result = int(Result)
+      self.temporaries = int(Temporaries)
+      self.peak = int(Result + Temporaries)
+      self.fits = Budget is None or self.peak <= Budget
+      self.workers = Workers
+      self.compiled = Compiled
+
+
+   def report(self):
+
+      '''
+      Returns a text with the plan: blocks, result, temporaries and predicted peak.
+      '''
+
+      Lines = ['{} {} {}, {} kernels, {} worker(s)'.format(self.diagnostic, 'x'.join([ str(n) for n in self.shape ]), self.dtype.name,
+                                                         'compiled' if self.compiled else 'numpy', self.workers),
+               '   max_memory:  {}'.format('None' if self.max_memory is None else _size(self.max_memory)),
+               '   blocks:      {} of {}'.format(len(self.blocks), 'x'.join([ str(n) for n in self.block_shape ])),
+               '   result:      {}'.format(_size(self.result)),
+               '   temporaries: {}'.format(_size(self.temporaries)),
+               '   peak:        {}{}'.format(_size(self.peak), '' if self.fits else ' (it does not fit in max_memory)')]
+      if not self.fits and self.result > self.max_memory:
+         Lines.append('   the result does not fit in max_memory, it can be written in an out array (e.g. a np.memmap)')
+      elif not self.fits:
+         Lines.append('   the blocks can not be smaller than one level, use less workers')
+      return '\n'.join(Lines)
+
+
+   def __repr__(self):
+      return self.report()
+
+
+
+def _plan(Diagnostic, Shape, dtype, Budget, Compiled=False, Casts=0, InputBytes=None, Bounded=False, Out=False):
+   # MemoryPlan of Diagnostic with a result of Shape and dtype. Casts is the number of
+   # inputs cast to the dtype option in each block, InputBytes the bytes of the inputs
+   # and Bounded if the calculation is done in blocks of slab_size anyway (np.memmap
+   # inputs or out array), and Out if the result is written in an out array.
+   Workers = _Options['workers']
+   Size = np.dtype(dtype).itemsize
+   N = int(np.prod(Shape))
+   ndim = len(Shape)
+   nlead = max(ndim-2, 0)
+   nOut = _Outputs.get(Diagnostic, 1)
+   Factor = _Temporaries[Diagnostic][1 if Compiled else 0]
+   Result = 0 if Out else nOut*N*Size
+
+   if Diagnostic == 'potential_vorticity':
+      # level by level with the scratch planes of each worker
+      Plane = int(np.prod(Shape[-2:]))
+      Blocks = _bounded_slabs(Shape, nlead, N, 1)
+      return MemoryPlan(Diagnostic, Shape, dtype, Budget, Blocks, Result, min(Workers, max(len(Blocks), 1))*Factor*Plane*Size,
+                        Workers, Compiled)
+
+   # bytes of each element of a block: temporaries, inputs cast and results of the block
+   Element = (Factor + Casts + nOut)*Size
+
+   if not Bounded:
+      # the whole calculation at once (in Workers slabs, whose results are copied in the result)
+      Whole = (Factor + Casts + (nOut if Workers > 1 and ndim >= 3 else 0))*N*Size
+      if Budget is None or Result + Whole <= Budget or nlead == 0:
+         return MemoryPlan(Diagnostic, Shape, dtype, Budget, [()], Result, Whole, Workers, Compiled)
+      Limit = float(N)
+   else:
+      # slabs of slab_size bytes of inputs
+      InputBytes = InputBytes if InputBytes is not None else _Inputs.get(Diagnostic, 2)*N*Size
+      Limit = _Options['slab_size']*N/float(max(InputBytes, 1))
+
+   if Budget is not None:
+      Limit = min(Limit, max(Budget - Result, 0)/float(Workers*Element))
+
+   Blocks = _bounded_slabs(Shape, nlead, N, max(Limit, 1.0))
+   Largest = max([ int(np.prod(_block_shape(Block, Shape))) for Block in Blocks ])
+   Temporaries = min(Workers, len(Blocks))*Element*Largest
+   if not Bounded and Temporaries >= Whole:
+      # the blocks do not lower the peak (e.g. the result alone does not fit)
+      return MemoryPlan(Diagnostic, Shape, dtype, Budget, [()], Result, Whole, Workers, Compiled)
+   return MemoryPlan(Diagnostic, Shape, dtype, Budget, Blocks, Result, Temporaries, Workers, Compiled)
+
+
+def _run_plan(Kernel, Args, Shape, out=None):
+   # MemoryPlan of a kernel run by _run with the max_memory option, or None if the
+   # kernel is not planned (e.g. Dask inputs)
+   if Kernel.__name__ not in _Kernels:
+      return None
+
+   ndim = len(Shape)
+   Arrays = [ Arg for Arg in Args if hasattr(Arg, 'ndim') and Arg.ndim == ndim ]
+   if False in [ _is_numpy(Array) for Array in Arrays ]:
+      return None
+
+   # the fields (the wind of batch_advection and the factors of potential_temperature broadcast)
+   Fields = [ Array for Array in Arrays if Array.shape == tuple(Shape) ]
+   Diagnostic, Name = _Kernels[Kernel.__name__]
+   dtype = _result_dtype(*[ Array.dtype for Array in Fields ])
+   Grid = [ Arg for Arg in Args if isinstance(Arg, GridMetrics) ]
+   Casts = len([ Array for Array in Fields if _Options['dtype'] is not None and Array.dtype != dtype ])
+   # the compiled kernels get C-contiguous inputs in the dtype of the result (see _kernel)
+   Compiled = _compiled(Name, Grid[0].order if len(Grid) > 0 else 2) and False not in [ (Array.dtype == dtype and Array.flags.c_contiguous) or
+                                                                                          (_Options['dtype'] is not None and Array.dtype != dtype) for Array in Arrays ]
+   Bounded = out is not None or True in [ type(Arg) == np.memmap for Arg in Args ]
+   return _plan(Diagnostic, Shape, dtype, _Options['max_memory'], Compiled, Casts, sum([ Array.nbytes for Array in Arrays ]), Bounded,
+                out is not None)
+
+
+def memory_plan(Diagnostic, Shape, dtype='float64', max_memory=None, out=False):
+
+   '''
+   Estimates the peak memory of a diagnostic with Numpy arrays and the blocks of its
+   leading axes (time, and then level) that fit in a memory budget. They are the
+   blocks used by the diagnostic when the option max_memory of set_options is the
+   budget, e.g.:
+   print(memory_plan('advection', (24, 37, 721, 1440), 'float32', max_memory='4GB'))
+   set_options(max_memory='4GB')
+   adv = advection(Temperature, UComp, VComp, Lon=Lon, Lat=Lat)
+
+   The peak includes the result, the temporaries of the backend (the fused kernels
+   of numba allocate less than the 'numpy' backend) and the results of the blocks
+   of each worker (option workers). The inputs are not included, since the caller
+   already holds them (or reads them from np.memmap). When a block of one level does
+   not fit, the plan does not fit (fits is False) and the result must be written in
+   an out array such as a np.memmap.
+
+
+   Parameters
+   ----------
+   Diagnostic: String (str)
+               'relative_vorticity', 'absolute_vorticity', 'divergence', 'wind_gradients',
+               'advection', 'batch_advection' (Shape of the stack of fields),
+               'potential_temperature' or 'potential_vorticity'.
+
+   Shape: Tuple
+          Shape of the inputs, [lat,lon], [level or time,lat,lon] or [time,level,lat,lon].
+
+   dtype: String or Numpy dtype
+          dtype of the inputs, the dtype of the result follows the option dtype.
+          Default is 'float64'.
+
+   max_memory: Integer or String
+               Memory budget in bytes or as a size with units, e.g. '4GB' or '512MB'.
+               Default is None, the option max_memory.
+
+   out: Boolean
+        True if the result is written in an out array, which is not counted in the peak.
+        Default is False.
+
+
+   Returns
+   -------
+   Plan: MemoryPlan
+         Blocks, result, temporaries and predicted peak memory in bytes, and if it
+         fits in the budget. print(Plan) or Plan.report() shows them.
+
+   '''
+
+   try:
+      assert Diagnostic in _Temporaries
+   except AssertionError:
+      print('\nThe Diagnostic must be one of: {}\n'.format(', '.join(sorted(_Temporaries))))
+      return
+
+   try:
+      Shape = tuple( int(n) for n in Shape )
+      assert len(Shape) >= 2 and len(Shape) <= (5 if Diagnostic == 'batch_advection' else 4)
+      dtype = np.dtype(dtype)
+   except (TypeError, ValueError, AssertionError):
+      print('\nThe Shape must be a tuple of 2, 3 or 4 dimensions and dtype a Numpy dtype\n')
+      return
+
+   Budget = _Options['max_memory'] if max_memory is None else _memory_bytes(max_memory)
+
+   try:
+      assert max_memory is None or Budget is not None
+   except AssertionError:
+      print("\nThe max_memory must be a integer of bytes or a size as '4GB', '512MB' or '1.5GiB'\n")
+      return
+
+   Result = _result_dtype(dtype)
+   Name = dict(_Kernels.values()).get(Diagnostic)
+   Casts = _Inputs.get(Diagnostic, 2) if _Options['dtype'] is not None and dtype != Result else 0
+   Compiled = _compiled(Name) and (dtype == Result or _Options['dtype'] is not None)
+
+   Bounded = out and Diagnostic != 'potential_vorticity'
+   return _plan(Diagnostic, Shape, Result, Budget, Compiled, Casts, _Inputs.get(Diagnostic, 2)*int(np.prod(Shape))*dtype.itemsize,
+                Bounded, out)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
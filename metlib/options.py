@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Global options of metlib
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import re
+import numpy as np
+#-----------------------------------------------------------------------------------------------------------------------------------
+_Options = {'workers': 1, 'dtype': None, 'backend': 'auto', 'slab_size': 2**28, 'max_memory': None}
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _valid_workers(Value):
+   return type(Value) == int and Value >= 1
+
+
+def _valid_dtype(Value):
+   try:
+      return Value is None or np.dtype(Value) in [np.dtype(np.float32), np.dtype(np.float64)]
+   except TypeError:
+      return False
+
+
+def _valid_slab_size(Value):
+   return type(Value) == int and Value >= 1
+
+
+def _memory_bytes(Value):
+   # bytes of a size given as an integer or a string with units, e.g. '4GB', '512MB'
+   # or '1.5GiB' (KB, MB, GB and TB are powers of 1000, KiB, MiB, GiB and TiB of 1024).
+   # None if it is not a valid size.
+   if type(Value) == int:
+      return Value if Value >= 1 else None
+   if type(Value) != str:
+      return None
+   Match = re.match(r'^\s*([0-9]*\.?[0-9]+)\s*([kKmMgGtT]?)(i?)[bB]?\s*$', Value)
+   if Match is None:
+      return None
+   Power = ' KMGT'.index(Match.group(2).upper() or ' ')
+   Bytes = int(float(Match.group(1))*(1024 if Match.group(3) else 1000)**Power)
+   return Bytes if Bytes >= 1 else None
+
+
+def _valid_max_memory(Value):
+   return Value is None or _memory_bytes(Value) is not None
+
+
+def _valid_backend(Value):
+   # only the selected backend is loaded
+   from .backends import _Backends, _load
+   return Value == 'auto' or (Value in _Backends and _load(Value) is not None)
+
+
+_Validators = {'workers': _valid_workers, 'dtype': _valid_dtype, 'backend': _valid_backend, 'slab_size': _valid_slab_size,
+               'max_memory': _valid_max_memory}
+
+_Converters = {'dtype': lambda Value: None if Value is None else np.dtype(Value),
+               'max_memory': lambda Value: None if Value is None else _memory_bytes(Value)}
+
+_Messages = {'workers': 'The workers must be a integer greater or equal than 1',
+             'dtype': "The dtype must be None, 'float32' or 'float64'",
+             'backend': "The backend must be 'auto' or one of the available backends, see available_backends()",
+             'slab_size': 'The slab_size must be a integer greater or equal than 1 (bytes)',
+             'max_memory': "The max_memory must be None, a integer of bytes or a size as '4GB', '512MB' or '1.5GiB'"}
+
+
+class set_options(object):
+
+   '''
+   Sets the global options of metlib. It can be called as a function, or used in a
+   with statement to set the options only inside the block, e.g.:
+   set_options(workers=8)
+   with set_options(workers=8):
+      ...
+
+
+   Parameters
+   ----------
+   workers: Integer
+            Number of threads used to calculate the diagnostics of Numpy arrays over
+            their time and level axes. The result is the same that with 1 thread.
+            Default is 1.
+
+   dtype: String or Numpy dtype
+          Precision of the calculations and results: 'float32' or 'float64'. With
+          'float32' the inputs, grid metrics and results stay in single precision,
+          which halves the memory and bandwidth of the calculations. Relative to
+          the RMS of the 'float64' result, the error is below 5e-6 for cdiff,
+          vorticity, divergence, advection and potential temperature, and below
+          5e-5 for potential vorticity (see benchmarks/float32_accuracy.py and
+          tests/test_float32.py).
+          Default is None, the inputs are promoted to float64.
+
+   backend: String (str)
+            Compute backend of cdiff, relative_vorticity, absolute_vorticity, divergence
+            and advection: 'numpy', or 'numba' (fused kernels compiled with Numba, it
+            needs the numba package). The results are the same with both backends.
+            Default is 'auto', that uses 'numba' if it is installed and 'numpy' otherwise.
+            numba is imported in the first calculation, so short-lived processes with
+            small arrays can use 'numpy' to avoid that cost.
+
+   slab_size: Integer
+              Bytes of the inputs of each slab when the Numpy inputs are np.memmap (e.g.
+              raw binary files larger than the memory) or the results are written in
+              an out array. The leading axes (time and level) are processed in slabs of
+              this size, workers slabs at a time, so the peak memory is a few times
+              workers*slab_size instead of the size of the files. With a np.memmap in
+              out, the results are also written to disk slab by slab.
+              Default is 2**28 (256 MB).
+
+   max_memory: Integer or String
+               Memory budget of the calculations with Numpy arrays, in bytes or as a size
+               with units, e.g. '4GB', '512MB' or '1.5GiB'. The peak memory of each
+               diagnostic (its result and temporaries) is estimated from the shape and
+               dtype of the inputs, and when it is larger than max_memory the leading
+               axes (time, and then level) are computed in blocks that fit it. The
+               results are the same. memory_plan reports the blocks and the predicted
+               peak of a diagnostic.
+               Default is None, the calculations are not split by memory.
+
+   '''
+
+   def __init__(self, **kwargs):
+
+      self.Old = {}
+
+      for Key in kwargs:
+
+         try:
+            assert Key in _Options
+         except AssertionError:
+            print('\nThe option {} does not exist, the options are: {}\n'.format(Key, ', '.join(sorted(_Options))))
+            return
+
+         try:
+            assert _Validators[Key](kwargs[Key])
+         except AssertionError:
+            print('\n{}\n'.format(_Messages[Key]))
+            return
+
+      for Key in kwargs:
+         self.Old[Key] = _Options[Key]
+         _Options[Key] = _Converters.get(Key, lambda Value: Value)(kwargs[Key])
+
+
+   def __enter__(self):
+      return self
+
+
+   def __exit__(self, *args):
+      _Options.update(self.Old)
+
+
+
+def get_options():
+
+   '''
+   Returns a dictionary with the current global options of metlib.
+   '''
+
+   return dict(_Options)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
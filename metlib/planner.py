@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Calculates many diagnostics of a dataset at once, sharing their intermediate fields
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .options import _Options
+from .functions import (GridMetrics, grid_metrics, _grid_fits, _KinematicsAttrs, _is_xarray, _xr, _is_numpy, _is_dask, _data, _wrap,
+                        _cast, _metrics, _cdiff)
+from .profiling import _stage, _profiled
+#-----------------------------------------------------------------------------------------------------------------------------------
+# Nodes of the graph of calculations. The inputs are 'in:<role>' (e.g. 'in:u'), the
+# operators 'dx:', 'dy:', 'dz:' (centered differences, not divided by the metrics) and
+# 'cos:' (times cos(lat)) are prefixed to the node they use, e.g. 'dy:cos:in:u' is
+# the difference in y of u*cos(lat), and the other nodes are in _Formulas. The
+# expressions are the same (and in the same order) of the functions of metlib,
+# so the results are identical to them.
+_Operators = {
+   'dx': lambda C, F: _cdiff(F, 'X', C.Grid.periodic_x, C.Grid.order),
+   'dy': lambda C, F: _cdiff(F, 'Y', False, C.Grid.order),
+   'dz': lambda C, F: _cdiff(F, 'Z'),
+   'cos': lambda C, F: F*C.Grid.coslat,
+}
+
+
+def _pv(C, avor, dzpt, dxpt, dypt, dzu, dzv):
+   PVor = avor*(dzpt/C.dp)
+   PVor -= (dzv/C.dp)*(dxpt/C.Grid.dxm)
+   PVor += (dzu/C.dp)*(dypt/C.Grid.dym)
+   return PVor*-9.8
+
+
+_Formulas = {
+   'dudx': (['dx:in:u'], lambda C, d: d/C.Grid.dx),
+   'dvdx': (['dx:in:v'], lambda C, d: d/C.Grid.dx),
+   'dudy': (['dy:cos:in:u'], lambda C, d: d/C.Grid.dy),
+   'dvdy': (['dy:cos:in:v'], lambda C, d: d/C.Grid.dy),
+   'vor': (['dvdx', 'dudy'], lambda C, dvdx, dudy: (dvdx-dudy)/C.Grid.acoslat),
+   'avor': (['vor'], lambda C, vor: vor + C.Grid.fc),
+   'div': (['dudx', 'dvdy'], lambda C, dudx, dvdy: (dudx+dvdy)/C.Grid.acoslat),
+   'stdef': (['dudx', 'dvdy', 'in:v'], lambda C, dudx, dvdy, v: (dudx-dvdy)/C.Grid.acoslat - 2.0*v*C.Grid.tanlat/6.37e6),
+   'shdef': (['dvdx', 'dudy', 'in:u'], lambda C, dvdx, dudy, u: (dvdx+dudy)/C.Grid.acoslat + 2.0*u*C.Grid.tanlat/6.37e6),
+   'tdef': (['stdef', 'shdef'], lambda C, stdef, shdef: np.sqrt(stdef**2+shdef**2)),
+   'ptemp': (['in:t'], lambda C, t: t*C.Factor),
+   'pv': (['avor', 'dz:ptemp', 'dx:ptemp', 'dy:ptemp', 'dz:in:u', 'dz:in:v'], _pv),
+}
+
+# diagnostics that can be requested, besides adv_<name>
+_Diagnostics = ['vor', 'avor', 'div', 'stdef', 'shdef', 'tdef', 'ptemp', 'pv']
+
+_Attrs = dict(_KinematicsAttrs)
+_Attrs['ptemp'] = {'units':'K', 'long_name':'Potential_temperature', 'standard_name':'Potential_temperature'}
+_Attrs['pv'] = {'units':'s**-1', 'long_name':'Potential_vorticity', 'standard_name':'Potential_vorticity'}
+
+
+def _advected(Diagnostic):
+   # node advected by adv_<name>: a diagnostic of the planner (e.g. adv_ptemp) or the variable <name>
+   Name = Diagnostic[4:]
+   return Name if Name in _Diagnostics else 'in:'+Name
+
+
+def _advection(C, u, v, dfdx, dfdy):
+   return -1.0*( ((u*dfdx)/(C.Grid.coslat*C.Grid.dx)) + ((v*dfdy)/(C.Grid.dy)) )/6.37e6
+
+
+def _definition(Node):
+   # (nodes it uses, function of them) of Node, or None if it is an input
+   if Node.startswith('in:'):
+      return None
+   elif Node in _Formulas:
+      return _Formulas[Node]
+   elif Node.startswith('adv_'):
+      Field = _advected(Node)
+      return (['in:u', 'in:v', 'dx:'+Field, 'dy:'+Field], _advection)
+
+   Operator, Sep, Field = Node.partition(':')
+   return ([Field], _Operators[Operator])
+
+
+def _valid(Diagnostic):
+   return Diagnostic in _Diagnostics or (Diagnostic.startswith('adv_') and len(Diagnostic) > 4)
+
+
+class _Plan(object):
+   # Order: nodes in the order they are computed, each one after the nodes it uses
+   # Uses: number of nodes that use each node, to free it after the last one
+   # Inputs: roles of the input variables, e.g. ['t', 'u', 'v']
+
+   def __init__(self, Diagnostics):
+      self.Diagnostics = list(Diagnostics)
+      self.Order = []
+      self.Uses = {}
+      self.Definitions = {}
+
+      for Diagnostic in self.Diagnostics:
+         self._add(Diagnostic)
+
+      self.Inputs = sorted( Node[3:] for Node in self.Order if Node.startswith('in:') )
+      self.Vertical = True in [ Node.startswith('dz:') or Node == 'ptemp' for Node in self.Order ]
+
+
+   def _add(self, Node):
+      if Node in self.Definitions:
+         return
+      Definition = _definition(Node)
+      self.Definitions[Node] = Definition
+      self.Uses[Node] = 0
+      if Definition is not None:
+         for Input in Definition[0]:
+            self._add(Input)
+            self.Uses[Input] += 1
+      self.Order.append(Node)
+
+
+   def evaluate(self, Fields, Context):
+      # computes the diagnostics from the input Fields ({role: array}), each node
+      # only once, and frees the intermediate nodes after their last use
+      Values = {}
+      Uses = dict(self.Uses)
+      Keep = set(self.Diagnostics)
+
+      for Node in self.Order:
+         Definition = self.Definitions[Node]
+         if Definition is None:
+            Values[Node] = _cast(Fields[Node[3:]])
+            continue
+
+         Inputs, Function = Definition
+         with _stage(Node):
+            Values[Node] = Function(Context, *[ Values[Input] for Input in Inputs ])
+
+         for Input in Inputs:
+            Uses[Input] -= 1
+            if Uses[Input] == 0 and Input not in Keep:
+               del Values[Input]
+
+      return dict( (Diagnostic, Values[Diagnostic]) for Diagnostic in self.Diagnostics )
+
+
+class _Context(object):
+   # grid metrics and vertical factors of the calculations of a plan
+   def __init__(self, Grid, Levels, ndim):
+      self.Grid = _metrics(Grid)
+      if Levels is None:
+         return
+
+      Levels = np.asarray(Levels, dtype=np.float64)
+      Levels2 = Levels*100.0
+      dp = np.full(Levels.shape, np.nan)
+      dp[1:-1] = Levels2[2:] - Levels2[:-2]
+      Factor = np.power(1000.0/Levels,0.286)
+      if ndim >= 3:
+         Factor, dp = Factor[:,None,None], dp[:,None,None]
+      self.Factor = _cast(Factor)
+      self.dp = _cast(dp)
+
+
+def _evaluate(Plan, Fields, Grid, Levels):
+   # 4D Numpy fields (or np.memmap) are computed time by time (in a pool of threads
+   # with the workers option), so the intermediate fields only take the memory of one time
+   Shape = Fields[Plan.Inputs[0]].shape
+
+   if len(Shape) < 4 or True in [ _is_dask(Fields[Role]) for Role in Plan.Inputs ]:
+      return Plan.evaluate(Fields, _Context(Grid, Levels, len(Shape)))
+
+   Context = _Context(Grid, Levels, 3)
+   Out = {}
+
+   def step(t):
+      Results = Plan.evaluate(dict( (Role, np.asarray(Fields[Role][t])) for Role in Plan.Inputs ), Context)
+      for Diagnostic in Results:
+         if Diagnostic not in Out:
+            Out[Diagnostic] = np.empty(Shape, dtype=Results[Diagnostic].dtype)
+         Out[Diagnostic][t] = Results[Diagnostic]
+
+   # the first time allocates the outputs before the threads start
+   step(0)
+   Workers = min(_Options['workers'], Shape[0]-1)
+   if Workers <= 1:
+      for t in range(1, Shape[0]):
+         step(t)
+   else:
+      with ThreadPoolExecutor(max_workers=Workers) as Pool:
+         for Future in [ Pool.submit(step, t) for t in range(1, Shape[0]) ]:
+            Future.result()
+
+   return Out
+
+
+@_profiled
+def compute(Data, Diagnostics, Names=None, Lon=None, Lat=None, Levels=None, Grid=None, periodic_x=False, order=2):
+
+   '''
+   Calculates many diagnostics at once. The diagnostics are split in the fields they
+   need (e.g. the differences of u and v in x and y, the potential temperature and
+   the absolute vorticity), each of them is computed only once and freed as soon as
+   the last diagnostic that uses it is done, e.g. vor, div and pv share the
+   differences of the wind, and pv and adv_ptemp the ones of the potential
+   temperature. The results are the same of the functions of each diagnostic.
+
+
+   Parameters
+   ----------
+   Data: Xarray.Dataset or Dictionary
+         Dataset with the variables, or dictionary with their Numpy arrays (or
+         Xarray.DataArray). Their structure can be:
+         - 2D [y,x]
+         - 3D [z,y,x] or [t,y,x]
+         - 4D [t,z,y,x]
+         The diagnostics with pressure levels (ptemp and pv) need [z,y,x] or [t,z,y,x].
+
+   Diagnostics: List of strings
+                Names of the diagnostics:
+                - vor, avor, div: relative vorticity, absolute vorticity and divergence (need u, v)
+                - stdef, shdef, tdef: stretching, shearing and total deformation (need u, v)
+                - ptemp: potential temperature (needs t)
+                - pv: potential vorticity (needs t, u, v)
+                - adv_<name>: horizontal advection of the variable <name> (needs u, v), e.g. adv_t.
+                  If <name> is one of the diagnostics above, it is advected instead, e.g. adv_ptemp.
+
+   Names: Dictionary
+          Names of the variables of each role (u, v, t or the name of adv_<name>) in Data,
+          e.g. {'t': 'temperature'}. By default the name of the variable is the role.
+
+   Lon: Numpy array
+        1D or 2D array with the longitudes of the variables.
+        If the variables are xarray.DataArray is not necessary define this parameter.
+
+   Lat: Numpy array
+        1D or 2D array with the latitudes of the variables.
+        If the variables are xarray.DataArray is not necessary define this parameter.
+
+   Levels: Numpy array
+           1D array with pressure levels of the variables, for ptemp and pv.
+           If the variables are xarray.DataArray is not necessary define this parameter.
+
+   Grid: GridMetrics
+         Horizontal metrics of the grid returned by grid_metrics(Lon, Lat).
+         If it is defined, Lon and Lat are not necessary.
+
+   periodic_x: Boolean or String (str)
+               If True, the grid is global and periodic in X (see grid_metrics).
+               Default is False.
+
+   order: Integer
+          Order of the horizontal differences: 2, 4 or 6 (see cdiff). Default is 2.
+
+
+   Returns
+   -------
+   Results: Dictionary of Numpy arrays or Xarray.Dataset
+            Diagnostics with the names in Diagnostics.
+            If the inputs are Xarray.DataArray backed by Dask, the results are lazy.
+
+   '''
+
+   try:
+      assert type(Diagnostics) in [list, tuple] and len(Diagnostics) > 0 and False not in [ _valid(Diagnostic) for Diagnostic in Diagnostics ]
+   except AssertionError:
+      print('\nDiagnostics must be a list of diagnostics: {} or adv_<name>, e.g.:'.format(', '.join(_Diagnostics)))
+      print("compute(Data, ['vor', 'div', 'adv_t', 'pv'])\n")
+      return
+
+
+   try:
+      assert periodic_x is True or periodic_x is False or periodic_x == 'auto'
+   except AssertionError:
+      print("\nThe periodic_x must be True, False or 'auto'\n")
+      return
+
+
+   try:
+      assert order in [2, 4, 6]
+   except AssertionError:
+      print('\nThe order must be 2, 4 or 6\n')
+      return
+
+
+   Plan = _Plan(Diagnostics)
+   Names = {} if Names is None else Names
+
+   try:
+      Fields = dict( (Role, Data[Names.get(Role, Role)]) for Role in Plan.Inputs )
+   except (KeyError, TypeError):
+      print('\nData does not have the variables of the diagnostics: {}'.format(', '.join( Names.get(Role, Role) for Role in Plan.Inputs )))
+      print("Their names can be defined with Names, e.g. compute(Data, ['pv'], Names={'t': 'temperature'})\n")
+      return
+
+
+   First = Fields[Plan.Inputs[0]]
+
+   try:
+      assert len(set( Fields[Role].shape for Role in Plan.Inputs )) == 1 and First.ndim >= 2
+      assert not Plan.Vertical or First.ndim >= 3
+   except AssertionError:
+      print('\nThe variables must have the same shape, with unless two dimensions [latitude, longitude],')
+      print('and three [level, latitude, longitude] or four [time, level, latitude, longitude] for ptemp and pv\n')
+      return
+
+
+   try:
+      assert _grid_fits(Grid, First)
+   except AssertionError:
+      print('\nThe Grid has the shape {} but the variables have {} points [latitude, longitude]\n'.format(Grid.shape, First.shape[-2:]))
+      return
+
+
+   if _is_xarray(First):
+
+      try:
+         assert True in [ True if word in (First.dims)[-1] else False for word in ['lon','LON','Lon'] ]   and   True in [ True if word in (First.dims)[-2] else False for word in ['lat','LAT','Lat'] ]
+      except AssertionError:
+         print('\nThe variables are Xarray.DataArray and must have unless two dimensions [latitude, longitude]')
+         print('If they have three dimensions their structure must be [level, latitude, longitude] or [time, latitude, longitude]')
+         print('If they have four dimensions their structure must be [time, level, latitude, longitude]\n')
+         return
+
+      if Grid is None:
+         Grid = grid_metrics(First, periodic_x=periodic_x, order=order)
+      if Plan.Vertical:
+         Levels = First.coords[(First.dims)[-3]].values
+
+      Results = _evaluate(Plan, dict( (Role, _data(Fields[Role])) for Role in Plan.Inputs ), Grid, Levels)
+
+      with _stage('output'):
+         for Diagnostic in Diagnostics:
+            Results[Diagnostic] = _wrap(First, Results[Diagnostic])
+            Results[Diagnostic].name = Diagnostic
+            if Diagnostic in _Attrs:
+               Results[Diagnostic].attrs.update(_Attrs[Diagnostic])
+            else:
+               Advected = _advected(Diagnostic)
+               Attrs = Fields[Advected[3:]].attrs if Advected.startswith('in:') else _Attrs[Advected]
+               UnitsData = Attrs.get('units', 'Field_units')
+               LongNameData = Attrs.get('long_name', 'Field_Name')
+               Results[Diagnostic].attrs['units'] = UnitsData+'/s'
+               Results[Diagnostic].attrs['long_name'] = LongNameData+'_advection'
+               Results[Diagnostic].attrs['standard_name'] = 'Horizontal_advection_of_'+LongNameData
+
+         Results = _xr().Dataset(dict( (Diagnostic, Results[Diagnostic]) for Diagnostic in Diagnostics ))
+
+   else:
+
+      try:
+         assert False not in [ _is_numpy(Fields[Role]) or _is_dask(Fields[Role]) for Role in Plan.Inputs ]
+         assert (_is_numpy(Lon) and _is_numpy(Lat)) or type(Grid) == GridMetrics
+         assert not Plan.Vertical or _is_numpy(Levels)
+      except AssertionError:
+         print('\nThe variables are Numpy array, so you need pass 2D array of Lon and Lat (or their GridMetrics),')
+         print('and 1D array of Levels for ptemp and pv, e.g.:')
+         print("compute(Data, ['vor', 'pv'], Lon=2DLon, Lat=2DLat, Levels=1DLevels)\n")
+         return
+
+      if Grid is None:
+         Grid = grid_metrics(Lon, Lat, periodic_x=periodic_x, order=order)
+
+      Results = _evaluate(Plan, Fields, Grid, Levels)
+
+
+   return Results;
+
+#-----------------------------------------------------------------------------------------------------------------------------------
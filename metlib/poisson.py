@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Inversion of the horizontal Laplacian on the sphere: streamfunction and
+             velocity potential from the vorticity and divergence
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+from collections import OrderedDict
+import numpy as np
+from .functions import (GridMetrics, _is_numpy, _is_xarray, _is_dask, _data, _wrap, _run, _cast, _result_dtype, _periodic_lon,
+                        _wrap_lon, _fingerprint)
+from .profiling import _stage, _profiled
+#-----------------------------------------------------------------------------------------------------------------------------------
+_Radius = 6.37e6
+
+_Attrs = {'sf': {'units': 'm**2 s**-1', 'long_name': 'Streamfunction', 'standard_name': 'Streamfunction_of_wind'},
+          'vp': {'units': 'm**2 s**-1', 'long_name': 'Velocity_potential', 'standard_name': 'Velocity_potential_of_wind'}}
+#-----------------------------------------------------------------------------------------------------------------------------------
+class _Poisson(object):
+   # factorization of the Laplacian of a longitude-latitude grid. In longitude it is
+   # diagonal in the Fourier modes (periodic grids) or in the sine modes (regional
+   # grids, with zero at the points after the edges), and for each mode the equation
+   # in latitude is a tridiagonal system in finite volumes, closed at the poles (no
+   # flux) or with zero at the points after the edges. The systems do not depend on
+   # the fields, so their elimination (Thomas algorithm) is done once per grid and
+   # each field only needs the forward and back substitutions.
+
+   def __init__(self, Lat, nx, dLon, Periodic):
+
+      Phi = Lat*np.pi/180.0
+      ny = len(Phi)
+      self.Periodic = Periodic
+      self.nx = nx
+
+      # eigenvalues of the centered second difference in longitude of each mode
+      if Periodic:
+         k2 = (2.0*np.sin(0.5*np.arange(nx//2+1)*dLon)/dLon)**2
+      else:
+         k2 = (2.0*np.sin(0.5*np.pi*np.arange(1, nx+1)/(nx+1))/dLon)**2
+
+      # faces of the cells in latitude. An edge whose face reaches a pole is closed,
+      # the other ones have zero at a point after the edge
+      h = np.diff(Phi)
+      Faces = np.concatenate([Phi[:1]-0.5*h[:1], 0.5*(Phi[1:]+Phi[:-1]), Phi[-1:]+0.5*h[-1:]])
+      Closed = np.abs(Faces[[0,-1]]) >= 0.5*np.pi - 1e-6
+      Faces = np.clip(Faces, -0.5*np.pi, 0.5*np.pi)
+      cosFaces = np.cos(Faces)
+      cosFaces[[0,-1]] = np.where(Closed, 0.0, cosFaces[[0,-1]])
+
+      Area = np.sin(Faces[1:]) - np.sin(Faces[:-1])
+      cosLat = np.cos(Phi)
+      Pole = np.abs(cosLat) < 1e-10
+      W = (Faces[1:] - Faces[:-1])/np.where(Pole, 1.0, cosLat)
+
+      Lower = cosFaces[:-1]/np.concatenate([h[:1], h])
+      Upper = cosFaces[1:]/np.concatenate([h, h[-1:]])
+      Diagonal = -(Lower + Upper)[:,None] - W[:,None]*k2[None,:]
+      Lower = np.repeat(Lower[:,None], len(k2), axis=1)
+      Upper = np.repeat(Upper[:,None], len(k2), axis=1)
+      Lower[0], Upper[-1] = 0.0, 0.0
+      Scale = np.repeat((_Radius**2*Area)[:,None], len(k2), axis=1)
+
+      # the modes of wavenumber greater than 0 are zero at the poles
+      Zero = Pole[:,None] & (k2[None,:] > 0)
+      Diagonal[Zero], Lower[Zero], Upper[Zero], Scale[Zero] = 1.0, 0.0, 0.0, 0.0
+
+      # with both poles closed the mode 0 of a periodic grid is defined up to a constant:
+      # the area mean of the field is removed and the first latitude is set to 0
+      self.Singular = Periodic and bool(np.all(Closed))
+      if self.Singular:
+         Diagonal[0,0], Upper[0,0] = 1.0, 0.0
+      self.Area = Area
+
+      Inverse = np.empty(Diagonal.shape)
+      Factor = np.empty(Diagonal.shape)
+      Inverse[0] = 1.0/Diagonal[0]
+      Factor[0] = Upper[0]*Inverse[0]
+      for j in range(1, ny):
+         Inverse[j] = 1.0/(Diagonal[j] - Lower[j]*Factor[j-1])
+         Factor[j] = Upper[j]*Inverse[j]
+
+      self.Lower, self.Factor, self.Inverse, self.Scale = Lower, Factor, Inverse, Scale
+      self._Casts = {}
+
+
+   def astype(self, dtype):
+      # coefficients in dtype, kept after the first conversion
+      dtype = np.dtype(dtype)
+      if dtype == np.float64:
+         return self.Lower, self.Factor, self.Inverse, self.Scale
+      if dtype not in self._Casts:
+         self._Casts[dtype] = tuple( Array.astype(dtype) for Array in [self.Lower, self.Factor, self.Inverse, self.Scale] )
+      return self._Casts[dtype]
+
+
+   def solve(self, Spectra):
+      # solves in place the systems of the modes of Spectra [...,y,modes]
+      Lower, Factor, Inverse, Scale = self.astype(Spectra.real.dtype)
+      ny = Spectra.shape[-2]
+
+      Spectra *= Scale
+      if self.Singular:
+         Mean = Spectra[...,0].sum(axis=-1)/self.Area.sum()
+         Spectra[...,0] -= Mean[...,None]*self.Area.astype(Spectra.real.dtype)
+         Spectra[...,0,0] = 0.0
+
+      Spectra[...,0,:] *= Inverse[0]
+      for j in range(1, ny):
+         Spectra[...,j,:] -= Lower[j]*Spectra[...,j-1,:]
+         Spectra[...,j,:] *= Inverse[j]
+      for j in range(ny-2, -1, -1):
+         Spectra[...,j,:] -= Factor[j]*Spectra[...,j+1,:]
+
+      if self.Singular:
+         # zero area mean
+         Spectra[...,0] -= ((Spectra[...,0]*self.Area).sum(axis=-1)/self.Area.sum())[...,None]
+      return Spectra
+
+
+   def __dask_tokenize__(self):
+      return self.Key
+
+
+
+def _sine(Field):
+   # sine transform (DST-I) of the last axis, from the Fourier transform of its odd extension
+   nx = Field.shape[-1]
+   Odd = np.zeros(Field.shape[:-1]+(2*(nx+1),), dtype=Field.dtype)
+   Odd[...,1:nx+1] = Field
+   Odd[...,nx+2:] = -Field[...,::-1]
+   return np.fft.rfft(Odd, axis=-1)[...,1:nx+1].imag*(-0.5)
+
+
+def _inverse_laplacian(Field, Solver):
+   # Numpy array [...,y,x] whose Laplacian on the sphere is Field
+   dtype = _result_dtype(Field.dtype)
+   Field = _cast(Field).astype(dtype, copy=False)
+   Missing = np.isnan(Field)
+   if Missing.any():
+      Field = np.where(Missing, 0, Field)
+   del Missing
+
+   if Solver.Periodic:
+      Spectra = Solver.solve(np.fft.rfft(Field, axis=-1))
+      return np.fft.irfft(Spectra, n=Solver.nx, axis=-1).astype(dtype, copy=False)
+
+   Spectra = Solver.solve(_sine(Field))
+   Result = _sine(Spectra)
+   Result *= 2.0/(Solver.nx+1)
+   return Result.astype(dtype, copy=False)
+
+
+_SolverCache = OrderedDict()
+_SolverCacheSize = 16
+
+
+def _solver(Lon, Lat, Grid, periodic_x, Shape):
+   # _Poisson of a regular longitude-latitude grid, kept in a LRU cache; None if the
+   # grid is not regular or does not have the shape of the field
+   if Grid is not None:
+      Lon, Lat, periodic_x = Grid.Lon, Grid.Lat, Grid.periodic_x
+
+   Lon = np.asarray(Lon, dtype=np.float64)
+   Lat = np.asarray(Lat, dtype=np.float64)
+   Lon1 = Lon[0,:] if Lon.ndim == 2 else Lon
+   Lat1 = Lat[:,0] if Lat.ndim == 2 else Lat
+
+   try:
+      assert Lon1.ndim == 1 and Lat1.ndim == 1 and len(Lon1) == Shape[-1] and len(Lat1) == Shape[-2] and len(Lon1) >= 3 and len(Lat1) >= 3
+      assert Lon.ndim == 1 or np.allclose(Lon, Lon1[None,:])
+      assert Lat.ndim == 1 or np.allclose(Lat, Lat1[:,None])
+      Step = _wrap_lon(np.diff(Lon1))
+      assert np.all(np.abs(Step - Step[0]) <= 1e-3*abs(Step[0])) and Step[0] != 0.0
+      assert np.all(np.diff(Lat1) > 0) or np.all(np.diff(Lat1) < 0)
+   except AssertionError:
+      print('\nThe streamfunction and velocity potential need a regular longitude-latitude grid with the shape [y,x] of the Field:')
+      print('longitudes with a constant step and latitudes increasing or decreasing\n')
+      return
+
+   if periodic_x == 'auto':
+      periodic_x = _periodic_lon(Lon1)
+
+   Key = (_fingerprint(Lat1), len(Lon1), float(abs(Step).mean()), bool(periodic_x))
+   if Key in _SolverCache:
+      _SolverCache.move_to_end(Key)
+      return _SolverCache[Key]
+
+   with _stage('build'):
+      Solver = _Poisson(Lat1, len(Lon1), abs(Step).mean()*np.pi/180.0, bool(periodic_x))
+   Solver.Key = Key
+   _SolverCache[Key] = Solver
+   while len(_SolverCache) > _SolverCacheSize:
+      _SolverCache.popitem(last=False)
+   return Solver
+
+
+def _poisson(Field, Lon, Lat, Grid, periodic_x, out, Name):
+
+   try:
+      assert periodic_x is True or periodic_x is False or periodic_x == 'auto'
+   except AssertionError:
+      print("\nThe periodic_x must be True, False or 'auto'\n")
+      return
+
+
+   if _is_numpy(Field):
+
+      try:
+         assert out is None or (_is_numpy(out) and out.shape == Field.shape)
+      except AssertionError:
+         print('\nThe out must be Numpy array with the shape of the Field\n')
+         return
+
+      try:
+         assert _is_numpy(Lon) and _is_numpy(Lat) or type(Grid) == GridMetrics
+      except AssertionError:
+         print('\nThe data input is Numpy array, so you need pass 1D or 2D array of Lon and Lat (or their GridMetrics)\n')
+         return
+
+      Solver = _solver(Lon, Lat, Grid, periodic_x, Field.shape)
+      if Solver is None:
+         return
+      return _run(_inverse_laplacian, (Field, Solver), Field.shape, out)
+
+
+   elif _is_xarray(Field):
+
+      try:
+         assert True in [ True if word in (Field.dims)[-1] else False for word in ['lon','LON','Lon'] ]   and   True in [ True if word in (Field.dims)[-2] else False for word in ['lat','LAT','Lat'] ]
+      except AssertionError:
+         print('\nThe data input is Xarray.DataArray and must have unless two dimensions [latitude, longitude]')
+         print('If data input have three dimensions their structure must be [level, latitude, longitude] or [time, latitude, longitude]')
+         print('If data input have four dimensions their structure must be [time, level, latitude, longitude] or [level, time, latitude, longitude]\n')
+         return
+
+      if Grid is None:
+         Lon, Lat = Field.coords[(Field.dims)[-1]].values, Field.coords[(Field.dims)[-2]].values
+      Solver = _solver(Lon, Lat, Grid, periodic_x, Field.shape)
+      if Solver is None:
+         return
+
+      if _is_dask(Field.data):
+         # each block has the whole grid [y,x], the leading axes keep their chunks
+         import dask.array as da
+         ndim = Field.ndim
+         Data = Field.data.rechunk(dict( (axis, -1) for axis in [ndim-2, ndim-1] ))
+         with _stage('kernel'):
+            Result = da.map_blocks(_inverse_laplacian, Data, Solver, dtype=_result_dtype(Data.dtype))
+      else:
+         Result = _run(_inverse_laplacian, (_data(Field), Solver), Field.shape)
+
+      with _stage('output'):
+         Result = _wrap(Field, Result, Name)
+         Result.attrs.update(_Attrs[Name])
+      return Result
+
+
+   print('\nThe Field must be Numpy array or Xarray.DataArray\n')
+   return
+
+
+@_profiled
+def streamfunction(Vorticity, Lon=None, Lat=None, Grid=None, periodic_x='auto', out=None):
+
+   '''
+   Calculates the streamfunction of the horizontal wind from its relative vorticity,
+   solving the Poisson equation Laplacian(sf) = Vorticity on the sphere. It is solved
+   in one vectorized pass for all the times and levels: a Fourier transform in
+   longitude (or a sine transform in regional grids) and a tridiagonal system in
+   latitude for each wavenumber, whose elimination is computed once per grid and
+   kept in a cache. The wind is u = -d(sf)/dy and v = d(sf)/dx.
+
+   The first and last latitudes whose cells reach a pole (e.g. -90 and 90, or -89.5
+   and 89.5 in a grid of 1 degree) close the domain, and on global grids closed at
+   both poles the result has zero area mean. At the other edges (the longitudes of
+   regional grids with periodic_x False, and the latitudes that do not reach a pole)
+   the streamfunction is zero at the points after the edge, so the result is the
+   part of the streamfunction due to the vorticity inside the grid. The NaN of
+   Vorticity (e.g. the first and last latitudes returned by relative_vorticity) are
+   taken as 0.
+
+
+   Parameters
+   ----------
+   Vorticity: Numpy array or Xarray.DataArray
+              Relative vorticity [1/s] (see relative_vorticity). Their structure can be:
+              - 2D [y,x]
+              - 3D [z,y,x] or [t,y,x]
+              - 4D [t,z,y,x]
+
+   Lon: Numpy array
+        1D or 2D array with the longitudes of Vorticity, with a constant step.
+        If Vorticity is xarray.DataArray is not necessary define this parameter.
+
+   Lat: Numpy array
+        1D or 2D array with the latitudes of Vorticity, increasing or decreasing (they
+        can be non-uniform, e.g. Gaussian latitudes).
+        If Vorticity is xarray.DataArray is not necessary define this parameter.
+
+   Grid: GridMetrics
+         Horizontal metrics of the grid returned by grid_metrics(Lon, Lat).
+         If it is defined, Lon and Lat are not necessary and its periodic_x is used.
+
+   periodic_x: Boolean or String (str)
+               If True, the grid is global and periodic in X. If 'auto', it is
+               detected from the longitudes. Default is 'auto'.
+
+   out: Numpy array
+        Optional array (e.g. a np.memmap) with the shape of Vorticity where the result
+        is written. It is only used with Numpy arrays.
+
+
+   Returns
+   -------
+   sf: Numpy array or Xarray.DataArray
+       Streamfunction [m**2/s].
+       If the input is Xarray.DataArray backed by Dask, the result is lazy (with the
+       whole grid [y,x] in each chunk).
+
+   '''
+
+   return _poisson(Vorticity, Lon, Lat, Grid, periodic_x, out, 'sf')
+
+
+@_profiled
+def velocity_potential(Divergence, Lon=None, Lat=None, Grid=None, periodic_x='auto', out=None):
+
+   '''
+   Calculates the velocity potential of the horizontal wind from its divergence,
+   solving the Poisson equation Laplacian(vp) = Divergence on the sphere with the
+   solver of streamfunction. The divergent wind is u = d(vp)/dx and v = d(vp)/dy.
+
+   The edges of the grid are treated as in streamfunction: closed at the poles (with
+   zero area mean on global grids), and with zero at the points after the other
+   edges. The NaN of Divergence (e.g. the first and last latitudes returned by
+   divergence) are taken as 0.
+
+
+   Parameters
+   ----------
+   Divergence: Numpy array or Xarray.DataArray
+               Horizontal divergence [1/s] (see divergence). Their structure can be:
+               - 2D [y,x]
+               - 3D [z,y,x] or [t,y,x]
+               - 4D [t,z,y,x]
+
+   Lon: Numpy array
+        1D or 2D array with the longitudes of Divergence, with a constant step.
+        If Divergence is xarray.DataArray is not necessary define this parameter.
+
+   Lat: Numpy array
+        1D or 2D array with the latitudes of Divergence, increasing or decreasing.
+        If Divergence is xarray.DataArray is not necessary define this parameter.
+
+   Grid: GridMetrics
+         Horizontal metrics of the grid returned by grid_metrics(Lon, Lat).
+         If it is defined, Lon and Lat are not necessary and its periodic_x is used.
+
+   periodic_x: Boolean or String (str)
+               If True, the grid is global and periodic in X. If 'auto', it is
+               detected from the longitudes. Default is 'auto'.
+
+   out: Numpy array
+        Optional array (e.g. a np.memmap) with the shape of Divergence where the
+        result is written. It is only used with Numpy arrays.
+
+
+   Returns
+   -------
+   vp: Numpy array or Xarray.DataArray
+       Velocity potential [m**2/s].
+       If the input is Xarray.DataArray backed by Dask, the result is lazy (with the
+       whole grid [y,x] in each chunk).
+
+   '''
+
+   return _poisson(Divergence, Lon, Lat, Grid, periodic_x, out, 'vp')
+
+#-----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Profiling of the stages of the calculations of metlib
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import functools
+import json
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+#-----------------------------------------------------------------------------------------------------------------------------------
+# profile that is recording, None when the profiling is disabled
+_Active = None
+#-----------------------------------------------------------------------------------------------------------------------------------
+class _NullStage(object):
+   # stage used when the profiling is disabled
+   def __enter__(self):
+      return self
+
+   def __exit__(self, *args):
+      return False
+
+
+_Null = _NullStage()
+
+
+def _stage(Name):
+   # context manager that records the stage Name of the current function
+   if _Active is None:
+      return _Null
+   return _Active._stage(Name)
+
+
+def _profiled(Function):
+   # records the calls of a public function as a stage with its name
+   Name = Function.__name__
+
+   @functools.wraps(Function)
+   def wrapper(*args, **kwargs):
+      if _Active is None:
+         return Function(*args, **kwargs)
+      with _Active._stage(Name):
+         return Function(*args, **kwargs)
+
+   return wrapper
+
+
+class _Stage(object):
+
+   def __init__(self, Profile, Name):
+      self.Profile = Profile
+      self.Name = Name
+
+
+   def __enter__(self):
+      Profile = self.Profile
+      if threading.get_ident() != Profile.Thread:
+         # the stages of the threads of workers and Dask are part of the stage that started them
+         self.Key = None
+         return self
+
+      if Profile.memory:
+         # the peak of the parent stage until now, the peak of this stage starts here
+         Parent = Profile.Stack[-1] if len(Profile.Stack) > 0 else None
+         if Parent is not None:
+            Parent.Peak = max(Parent.Peak, tracemalloc.get_traced_memory()[1])
+         tracemalloc.reset_peak()
+         self.Memory = tracemalloc.get_traced_memory()[0]
+         self.Peak = self.Memory
+
+      Profile.Stack.append(self)
+      self.Key = '/'.join([ Stage.Name for Stage in Profile.Stack ])
+      if self.Key not in Profile.Stages:
+         Profile.Stages[self.Key] = {'calls': 0, 'time': 0.0, 'self_time': 0.0, 'bytes': 0, 'peak': 0}
+      self.Children = 0.0
+      self.Start = time.perf_counter()
+      return self
+
+
+   def __exit__(self, *args):
+      if self.Key is None:
+         return False
+
+      Elapsed = time.perf_counter() - self.Start
+      Profile = self.Profile
+      Profile.Stack.pop()
+
+      Record = Profile.Stages[self.Key]
+      Record['calls'] += 1
+      Record['time'] += Elapsed
+      Record['self_time'] += Elapsed - self.Children
+
+      if Profile.memory:
+         Current, Peak = tracemalloc.get_traced_memory()
+         self.Peak = max(self.Peak, Peak)
+         Record['bytes'] += Current - self.Memory
+         Record['peak'] = max(Record['peak'], self.Peak - self.Memory)
+
+      if len(Profile.Stack) > 0:
+         Profile.Stack[-1].Children += Elapsed
+         if Profile.memory:
+            Profile.Stack[-1].Peak = max(Profile.Stack[-1].Peak, self.Peak)
+
+      return False
+
+
+
+class profile(object):
+
+   '''
+   Records the time, memory and number of calls of the stages of the functions of
+   metlib called inside a with statement, e.g.:
+   with profile() as Prof:
+      PVor = potential_vorticity(Temperature, UComp, VComp)
+   print(Prof.report())
+
+   Each public function is a stage with its name, and inside it there are stages for
+   the grid metrics (grid_metrics, and build when they are not in the cache), the
+   calculations (kernel) and the construction of the Xarray.DataArray (output).
+   The self_time of a function is the time out of its stages, e.g. the validation of
+   the inputs. The stages are recorded only in the thread that opened the profile,
+   and with Dask the kernel stage is the time to build the lazy graph.
+   When no profile is open, the stages do not record anything.
+
+
+   Parameters
+   ----------
+   memory: Boolean
+           If True, the memory allocated in each stage is traced with tracemalloc.
+           It slows down the calculations, so it can be disabled to profile only the times.
+           Default is True.
+
+
+   Attributes
+   ----------
+   Stages: Dictionary
+           Records of each stage, their keys are the names of the stage and the stages
+           that contain it, separated by '/', e.g. 'potential_vorticity/kernel'.
+           Each record has:
+           - calls: number of calls
+           - time: total wall time [s]
+           - self_time: wall time out of the stages inside it [s]
+           - bytes: memory allocated and not released at the end of the stage [bytes]
+           - peak: maximum memory allocated during a call of the stage [bytes]
+
+   '''
+
+   def __init__(self, memory=True):
+      self.memory = memory
+      self.Stages = OrderedDict()
+      self.Stack = []
+      self.Thread = None
+      self.Previous = None
+      self.Tracing = False
+
+
+   def __enter__(self):
+      global _Active
+      self.Thread = threading.get_ident()
+      if self.memory and not tracemalloc.is_tracing():
+         tracemalloc.start()
+         self.Tracing = True
+      self.Previous = _Active
+      _Active = self
+      return self
+
+
+   def __exit__(self, *args):
+      global _Active
+      _Active = self.Previous
+      if self.Tracing:
+         tracemalloc.stop()
+         self.Tracing = False
+      return False
+
+
+   def _stage(self, Name):
+      return _Stage(self, Name)
+
+
+   def to_dict(self):
+
+      '''
+      Returns a dictionary with the records of the stages.
+      '''
+
+      return {'memory': self.memory, 'stages': dict( (Key, dict(Record)) for Key, Record in self.Stages.items() )}
+
+
+   def to_json(self, Path=None):
+
+      '''
+      Returns the records of the stages as a JSON string, and writes it in the file Path if it is defined.
+      '''
+
+      Text = json.dumps(self.to_dict(), indent=1)
+      if Path is not None:
+         with open(Path, 'w') as File:
+            File.write(Text)
+      return Text
+
+
+   def report(self):
+
+      '''
+      Returns a table with the records of the stages.
+      '''
+
+      Lines = ['{:<48} {:>7} {:>10} {:>10} {:>10} {:>10}'.format('stage', 'calls', 'time [s]', 'self [s]', 'bytes [MB]', 'peak [MB]')]
+      for Key, Record in self.Stages.items():
+         Lines.append('{:<48} {:7d} {:10.4f} {:10.4f} {:10.1f} {:10.1f}'.format(Key, Record['calls'], Record['time'], Record['self_time'],
+                                                                              Record['bytes']/2.0**20, Record['peak']/2.0**20))
+      return '\n'.join(Lines)
+
+#-----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Streams the calculations over the time steps of a dataset
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .functions import _is_xarray, _xr, _is_numpy, _result_dtype
+from .profiling import _stage
+#-----------------------------------------------------------------------------------------------------------------------------------
+def _time_dim(Data):
+   Dims = [ dim for dim in Data.dims if True in [ True if word in dim else False for word in ['time','TIME','Time'] ] ]
+   if len(Dims) == 0:
+      return None
+   return Dims[0]
+
+
+def _load_step(Data, TimeDim, i):
+   return Data.isel({TimeDim:i}).load()
+
+
+def _stream(Data, Diagnostics, TimeDim, Prefetch):
+
+   nt = Data.sizes[TimeDim]
+   Pool = ThreadPoolExecutor(max_workers=1)
+   Pending = deque()
+
+   try:
+      # the current step and the Prefetch steps read ahead of it are the only ones in memory
+      for i in range(min(max(Prefetch, 1), nt)):
+         Pending.append(Pool.submit(_load_step, Data, TimeDim, i))
+      Next = len(Pending)
+
+      while len(Pending) > 0:
+
+         Step = Pending.popleft().result()
+
+         # the next step is read while the current one is computed
+         if Prefetch > 0 and Next < nt:
+            Pending.append(Pool.submit(_load_step, Data, TimeDim, Next))
+            Next += 1
+
+         Results = _xr().Dataset(dict((Name, Diagnostics[Name](Step)) for Name in Diagnostics))
+         del Step
+
+         # without prefetch, the next step is read after the current one is computed
+         if Prefetch == 0 and Next < nt:
+            Pending.append(Pool.submit(_load_step, Data, TimeDim, Next))
+            Next += 1
+
+         yield Results
+
+   finally:
+      for Future in Pending:
+         Future.cancel()
+      Pool.shutdown(wait=True)
+
+
+def stream(Data, Diagnostics, Variables=None, Prefetch=1):
+
+   '''
+   Iterates over the time dimension of a Xarray.Dataset and returns the diagnostics
+   of each time step as soon as they are computed. The next time steps are read in
+   a background thread while the current one is computed, so only 1+Prefetch time
+   steps are kept in memory. The time steps can be written to a file as they are
+   computed with write, e.g. write(stream(Data, Diagnostics), 'out.nc').
+
+
+   Parameters
+   ----------
+   Data: Xarray.Dataset
+         Dataset with a time dimension, e.g. opened with xarray.open_dataset.
+
+   Diagnostics: Dictionary
+                Names of the output fields and the functions that calculate them
+                from the Xarray.Dataset of one time step, e.g.:
+                {'PVor': lambda ds: potential_vorticity(ds.t, ds.u, ds.v),
+                 'TAdv': lambda ds: advection(ds.t, ds.u, ds.v)}
+
+   Variables: List of strings
+              Variables of Data that are read in each time step.
+              If it is not defined, all the variables are read.
+
+   Prefetch: Integer
+             Number of time steps that are read ahead of the current one.
+             With 0 the next time step is read after the current one is computed.
+
+
+   Returns
+   -------
+   Steps: Generator of Xarray.Dataset
+          Diagnostics of each time step.
+
+   '''
+
+   try:
+      assert _is_xarray(Data, 'Dataset') and type(Diagnostics) == dict
+   except AssertionError:
+      print('\nThe Data must be Xarray.Dataset and Diagnostics a dictionary of functions, e.g.:')
+      print("stream(Data, {'TAdv': lambda ds: advection(ds.t, ds.u, ds.v)})\n")
+      return
+
+
+   TimeDim = _time_dim(Data)
+
+   try:
+      assert TimeDim is not None
+   except AssertionError:
+      print('\nThe Data must have a time dimension\n')
+      return
+
+
+   try:
+      assert int(Prefetch) >= 0
+   except AssertionError:
+      print('\nThe Prefetch must be a integer greater or equal than 0\n')
+      return
+
+
+   if Variables is not None:
+      Data = Data[list(Variables)]
+
+
+   return _stream(Data, Diagnostics, TimeDim, int(Prefetch))
+
+
+
+def _step_time(Step):
+   # time of a Xarray time step: its scalar time coordinate, or None
+   if not (_is_xarray(Step) or _is_xarray(Step, 'Dataset')):
+      return None
+   Names = [ Name for Name in Step.coords if Step.coords[Name].ndim == 0 and True in [ True if word in Name else False for word in ['time','TIME','Time'] ] ]
+   return Step.coords[Names[0]].values if len(Names) > 0 else None
+
+
+def _seconds(Interval):
+   # seconds of a time interval, a np.timedelta64 or a number of seconds
+   if isinstance(Interval, np.timedelta64):
+      return Interval / np.timedelta64(1, 's')
+   return float(Interval)
+
+
+def _tendency_attrs(Attrs):
+   Units = Attrs.get('units')
+   if Units is None:
+      Units = 's**-1'
+   elif Units.endswith('s**-1'):
+      Units = Units[:-len('s**-1')]+'s**-2'
+   else:
+      Units = Units+' s**-1'
+   LongName = Attrs.get('long_name', 'field')
+   return {'units': Units,
+           'long_name': 'Tendency_of_'+LongName,
+           'standard_name': 'Centered_time_tendency_of_'+Attrs.get('standard_name', LongName)}
+
+
+class TimeTendency(object):
+
+   '''
+   Centered time tendency of fields whose time steps arrive one at a time, e.g. the
+   steps of a forecast as they are produced. Only the last three time steps are kept
+   in a ring buffer, and each time step pushed returns the tendency of the previous
+   one, so the memory and the time of each step do not grow with the number of steps:
+   Tend = TimeTendency({'pv': lambda ds: potential_vorticity(ds.t, ds.u, ds.v)})
+   for Step in Steps:
+      Tendencies = Tend.push(Step)
+
+   The tendency of the step n is (Field[n+1]-Field[n-1])/(Time[n+1]-Time[n-1]), the
+   same as cdiff(Field, 'T') divided by the time between the steps n-1 and n+1.
+   The first and the last time steps do not have a centered tendency.
+
+
+   Parameters
+   ----------
+   Diagnostics: Dictionary
+                Names and functions of fields derived from each time step, e.g.
+                vorticity or potential vorticity, whose tendencies are also returned.
+                They are calculated once per time step, as in stream, e.g.:
+                {'vor': lambda ds: relative_vorticity(ds.u, ds.v)}
+
+   Variables: List of strings
+              Variables of the Xarray.Dataset time steps whose tendencies are returned.
+              By default all the data variables, and [] to return only the tendencies
+              of the Diagnostics.
+
+   dt: Float or np.timedelta64
+       Time between two consecutive steps (a number is in seconds). If it is not
+       defined, the time of each step is taken from the argument Time of push or from
+       the scalar time coordinate of the Xarray time steps (e.g. Data.isel(time=i)).
+
+
+   Attributes
+   ----------
+   Count: Integer
+          Number of time steps pushed.
+
+   '''
+
+   def __init__(self, Diagnostics=None, Variables=None, dt=None):
+      self.Diagnostics = {} if Diagnostics is None else dict(Diagnostics)
+      self.Variables = None if Variables is None else list(Variables)
+      self.dt = None if dt is None else _seconds(dt)
+      self.Count = 0
+      # the three slots of the ring buffer: the fields, time and coordinates of a step
+      self.Fields = [None, None, None]
+      self.Times = [None, None, None]
+      self.Templates = [None, None, None]
+
+
+   def _fields(self, Step):
+      # fields of a time step: the Step (Numpy array or Xarray.DataArray), or the
+      # Variables of a Xarray.Dataset, plus the Diagnostics
+      if _is_xarray(Step, 'Dataset'):
+         Names = list(Step.data_vars) if self.Variables is None else self.Variables
+         Fields = [ (Name, Step[Name]) for Name in Names ]
+      else:
+         Fields = [ (None, Step) ] if self.Variables is None or len(self.Variables) > 0 else []
+      for Name in self.Diagnostics:
+         with _stage(Name):
+            Fields.append((Name, self.Diagnostics[Name](Step)))
+      return Fields
+
+
+   def push(self, Step, Time=None):
+
+      '''
+      Adds the next time step and returns the centered time tendency of the previous one.
+
+
+      Parameters
+      ----------
+      Step: Numpy array, Xarray.DataArray or Xarray.Dataset
+            Fields of one time step, e.g. [z,y,x].
+
+      Time: np.datetime64 or Float
+            Time of the step (a number is in seconds). Only used if dt is not defined,
+            by default it is the scalar time coordinate of the Xarray time steps.
+
+
+      Returns
+      -------
+      Tendency: Numpy array, Xarray.DataArray, Xarray.Dataset, Dictionary or None
+                Tendency of the previous time step [units of the field per second],
+                of the same type of Step. If Step is a Xarray.Dataset, it has the
+                tendencies of Variables and Diagnostics, and if Step is a Numpy array
+                or Xarray.DataArray with Diagnostics, it is a dictionary of them (the
+                key of Step is None). It is None for the first two time steps.
+
+      '''
+
+      try:
+         assert _is_numpy(Step) or _is_xarray(Step) or _is_xarray(Step, 'Dataset')
+      except AssertionError:
+         print('\nThe Step must be Numpy array, Xarray.DataArray or Xarray.Dataset\n')
+         return
+
+
+      if Time is None:
+         Time = _step_time(Step)
+
+      try:
+         assert self.dt is not None or Time is not None
+      except AssertionError:
+         print('\nThe time of the steps is unknown, it must be defined with dt or Time, e.g.:')
+         print('TimeTendency(dt=3600.0).push(Step) or TimeTendency().push(Step, Time=3600.0*i)\n')
+         return
+
+
+      Arrays = {}
+      Templates = {}
+      for Name, Field in self._fields(Step):
+         if _is_xarray(Field):
+            Templates[Name] = (Field.name, Field.dims, dict(Field.coords), dict(Field.attrs))
+            Field = Field.values
+         Arrays[Name] = np.asarray(Field)
+
+      Last = self.Fields[(self.Count-1) % 3] if self.Count > 0 else None
+
+      try:
+         assert Last is None or (set(Arrays) == set(Last) and False not in [ Arrays[Name].shape == Last[Name].shape for Name in Arrays ])
+      except AssertionError:
+         print('\nThe fields of the Step must have the same names and shapes as the previous steps\n')
+         return
+
+
+      Slot = self.Count % 3
+      Fields = self.Fields[Slot] if self.Fields[Slot] is not None else {}
+
+      with _stage('buffer'):
+         for Name in Arrays:
+            Field = Arrays[Name]
+            # the slot of the oldest step is reused when the field keeps its dtype
+            if Name in Fields and Fields[Name].shape == Field.shape and Fields[Name].dtype == Field.dtype:
+               np.copyto(Fields[Name], Field)
+            else:
+               Fields[Name] = Field.copy()
+
+      self.Fields[Slot] = Fields
+      self.Times[Slot] = Time
+      self.Templates[Slot] = Templates
+      self.Count += 1
+
+      if self.Count < 3:
+         return None
+
+      # the steps n+1 (the new one), n and n-1 in the ring buffer
+      Next, Middle, Previous = Slot, (Slot-1) % 3, (Slot-2) % 3
+      Interval = 2.0*self.dt if self.dt is not None else _seconds(self.Times[Next] - self.Times[Previous])
+
+      Tendencies = {}
+      with _stage('tendency'):
+         for Name in Fields:
+            dtype = np.dtype(_result_dtype(Fields[Name].dtype))
+            Tendency = np.subtract(Fields[Name], self.Fields[Previous][Name], dtype=dtype)
+            Tendency /= dtype.type(Interval)
+            Tendencies[Name] = Tendency
+
+      return self._output(Step, Tendencies, self.Templates[Middle])
+
+
+   def _output(self, Step, Tendencies, Templates):
+      # tendencies with the type of Step and the coordinates of the step n
+      for Name in Templates:
+         FieldName, Dims, Coords, Attrs = Templates[Name]
+         Tendencies[Name] = _xr().DataArray(Tendencies[Name], coords=Coords, dims=Dims, attrs=_tendency_attrs(Attrs),
+                                            name=FieldName if Name is None else Name)
+
+      if _is_xarray(Step, 'Dataset'):
+         return _xr().Dataset(Tendencies)
+      if len(self.Diagnostics) == 0:
+         return Tendencies[None]
+      return Tendencies
+
+#-----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: Writes the diagnostics incrementally to netCDF or Zarr files
+Author: Joao Henry Huaman Chinchay
+E-mail: joaohenry23@gmail.com
+Created date: Oct 17, 2026
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import numpy as np
+from .functions import _is_xarray, _xr, _is_dask
+from .stream import _time_dim
+from .profiling import _stage, _profiled
+#-----------------------------------------------------------------------------------------------------------------------------------
+_Formats = ['netcdf', 'zarr']
+
+
+def _format(Path, Format):
+   if Format is not None:
+      return Format
+   return 'zarr' if str(Path).rstrip('/').endswith('.zarr') else 'netcdf'
+
+
+def _blocks(Data, Dim):
+   # blocks of a Xarray.Dataset along Dim, one per Dask chunk (or the whole Dataset)
+   if Dim is None or Dim not in Data.dims:
+      yield Data
+      return
+
+   Chunks = Data.chunks.get(Dim) if len(Data.chunks) > 0 else None
+   if Chunks is None:
+      yield Data
+      return
+
+   Start = 0
+   for Size in Chunks:
+      yield Data.isel({Dim: slice(Start, Start+Size)})
+      Start += Size
+
+
+def _chunks(Block, Variable, Dim, Chunks):
+   # chunks of a variable: the block length along Dim, and Chunks or the whole size
+   # in the other dimensions
+   Sizes = []
+   for i, Name in enumerate(Variable.dims):
+      if Name == Dim:
+         Sizes.append(Block.sizes[Dim])
+      else:
+         Sizes.append(max(1, min(int(Chunks.get(Name, Variable.shape[i])), Variable.shape[i])))
+   return tuple(Sizes)
+
+
+def _time_encoding(Variable):
+   # encoding of a time coordinate with the units of its first value, so the blocks
+   # appended later keep the same units
+   First = np.datetime_as_string(Variable.values.ravel()[0], unit='s').replace('T', ' ')
+   return {'units': 'hours since '+First, 'calendar': 'proleptic_gregorian', 'dtype': np.dtype('float64')}
+
+
+def _append_dim(Data):
+   # time dimension of Data, or its scalar time coordinate (e.g. a time step of stream)
+   Dim = _time_dim(Data)
+   if Dim is None:
+      Names = [ Name for Name in Data.coords if Data.coords[Name].ndim == 0 and True in [ True if word in Name else False for word in ['time','TIME','Time'] ] ]
+      Dim = Names[0] if len(Names) > 0 else None
+   return Dim
+
+
+def _compute_chunks(Data, Dim, Chunks):
+   # chunks of the file in the dimensions other than Dim: the Dask chunks of Data (the
+   # compute blocks), updated with the ones of the user
+   Sizes = {}
+   for Name in Data.variables:
+      if Data[Name].chunks is not None:
+         for Dimension, Sizes1 in zip(Data[Name].dims, Data[Name].chunks):
+            if Dimension != Dim:
+               Sizes[Dimension] = max(Sizes.get(Dimension, 0), Sizes1[0])
+   Sizes.update(Chunks)
+   return Sizes
+
+
+class _NetCDF(object):
+   # netCDF4 file with Dim as unlimited dimension, appended block by block
+
+   def __init__(self, Path, Compression, Level, Chunks):
+      import netCDF4
+      self.File = netCDF4.Dataset(Path, 'w')
+      self.Compression = Compression
+      self.Level = Level
+      self.Chunks = Chunks
+      self.Length = 0
+      self.TimeEncoding = None
+
+
+   def _encode(self, Block, Dim):
+      # CF encoding of the variables of the block (e.g. datetime64 to numbers). The
+      # coordinate Dim keeps the units of the first block in all the blocks.
+      Variables = dict(Block.variables)
+      if Dim is not None and Dim in Variables and np.issubdtype(Variables[Dim].dtype, np.datetime64):
+         Variable = Variables[Dim].copy()
+         if self.TimeEncoding is None:
+            self.TimeEncoding = _time_encoding(Variable)
+         Variable.encoding = dict(self.TimeEncoding)
+         Variables[Dim] = Variable
+      return _xr().conventions.cf_encoder(Variables, Block.attrs)
+
+
+   def append(self, Block, Dim):
+      Variables, Attrs = self._encode(Block, Dim)
+      First = len(self.File.variables) == 0
+
+      if First:
+         self.File.setncatts(Attrs)
+         for Name in Block.dims:
+            self.File.createDimension(Name, None if Name == Dim else Block.sizes[Name])
+
+      n = Block.sizes[Dim] if Dim is not None and Dim in Block.dims else 0
+
+      for Name, Variable in Variables.items():
+         if First:
+            VarAttrs = dict(Variable.attrs)
+            Fill = VarAttrs.pop('_FillValue', None)
+            if Name in Block.dims:
+               Fill = None
+            Options = {}
+            if Variable.ndim > 0 and Name not in Block.dims:
+               Options['chunksizes'] = _chunks(Block, Block.variables[Name], Dim, self.Chunks)
+               if self.Compression is not None:
+                  Options['compression'] = self.Compression
+                  Options['complevel'] = self.Level
+            File = self.File.createVariable(Name, Variable.dtype, Variable.dims, fill_value=Fill, **Options)
+            File.set_auto_maskandscale(False)
+            File.setncatts(VarAttrs)
+         elif Dim not in Variable.dims:
+            continue
+
+         if Dim is not None and Dim in Variable.dims:
+            axis = Variable.dims.index(Dim)
+            Index = [slice(None)]*Variable.ndim
+            Index[axis] = slice(self.Length, self.Length+n)
+            self.File.variables[Name][tuple(Index)] = Variable.values
+         elif Variable.ndim == 0:
+            self.File.variables[Name].assignValue(Variable.values)
+         else:
+            self.File.variables[Name][...] = Variable.values
+
+      self.Length += n
+
+
+   def close(self):
+      self.File.close()
+
+
+class _Zarr(object):
+   # Zarr store appended block by block along Dim with xarray
+
+   def __init__(self, Path, Compression, Level, Chunks):
+      self.Path = Path
+      self.Compression = Compression
+      self.Level = Level
+      self.Chunks = Chunks
+      self.First = True
+
+
+   def _compressor(self):
+      # Blosc compressor with the codec Compression (e.g. 'zstd', 'lz4' or 'zlib')
+      import zarr
+      if self.Compression is None:
+         return {'compressors': None} if int(zarr.__version__.split('.')[0]) >= 3 else {'compressor': None}
+      if int(zarr.__version__.split('.')[0]) >= 3:
+         from zarr.codecs import BloscCodec
+         return {'compressors': (BloscCodec(cname=self.Compression, clevel=self.Level),)}
+      from numcodecs import Blosc
+      return {'compressor': Blosc(cname=self.Compression, clevel=self.Level)}
+
+
+   def append(self, Block, Dim):
+      if self.First:
+         Encoding = {}
+         for Name in Block.data_vars:
+            Encoding[Name] = {'chunks': _chunks(Block, Block[Name].variable, Dim, self.Chunks)}
+            Encoding[Name].update(self._compressor())
+         if Dim is not None and Dim in Block.variables and np.issubdtype(Block[Dim].dtype, np.datetime64):
+            Encoding[Dim] = _time_encoding(Block[Dim].variable)
+         Block.to_zarr(self.Path, mode='w', encoding=Encoding)
+         self.First = False
+      else:
+         Block.to_zarr(self.Path, append_dim=Dim)
+
+
+   def close(self):
+      pass
+
+
+def _as_dataset(Block, Dim):
+   # Xarray.Dataset of a block, with Dim as dimension when it is a scalar coordinate
+   # (e.g. the time steps of stream)
+   if _is_xarray(Block):
+      Block = Block.to_dataset(name=Block.name if Block.name is not None else 'data')
+   if Dim is not None and Dim not in Block.dims and Dim in Block.coords:
+      Block = Block.expand_dims(Dim)
+   return Block
+
+
+@_profiled
+def write(Data, Path, Format=None, Compression=None, Level=4, Chunks=None, Dim=None):
+
+   '''
+   Writes diagnostics to a netCDF or Zarr file block by block, so the whole result is
+   never held in memory. It receives a Xarray.Dataset (e.g. lazy, backed by Dask) or
+   the Xarray.Dataset of each time step as soon as they are computed, e.g.:
+   write(stream(Data, {'PVor': lambda ds: potential_vorticity(ds.t, ds.u, ds.v)}), 'pv.nc')
+   Each block is appended along the time dimension, and the chunks of the file follow
+   the blocks: one block along time (e.g. one time step of stream, or one Dask chunk)
+   and the Dask chunks (or the whole size) in the other dimensions. The attributes of
+   the variables (e.g. units, long_name and standard_name) are kept.
+
+
+   Parameters
+   ----------
+   Data: Xarray.Dataset, Xarray.DataArray or iterable of them
+         Diagnostics to write. If it is a Xarray.Dataset backed by Dask, each chunk
+         along the time dimension is computed and written in turn.
+
+   Path: String (str)
+         Path of the output file.
+
+   Format: String (str)
+           'netcdf' (it needs netCDF4) or 'zarr' (it needs zarr). By default it is
+           'zarr' if Path ends with '.zarr' and 'netcdf' otherwise.
+
+   Compression: String (str)
+                Compression of the variables, or None to write them uncompressed.
+                In netCDF it is a compression of netCDF4, e.g. 'zlib' or 'zstd', and
+                in Zarr a codec of Blosc, e.g. 'zstd', 'lz4' or 'zlib'. The
+                compression is slower than the calculations of the diagnostics.
+                Default is None.
+
+   Level: Integer
+          Level of the compression, from 1 (fast) to 9 (small). Default is 4.
+
+   Chunks: Dictionary
+           Chunk sizes of some dimensions, e.g. {'lat': 180}, instead of the ones of
+           the blocks.
+
+   Dim: String (str)
+        Dimension along which the blocks are appended. By default it is the time
+        dimension of the first block. Without it, Data is written at once.
+
+
+   Returns
+   -------
+   Path: String (str)
+         Path of the output file.
+
+   '''
+
+   Format = _format(Path, Format)
+
+   try:
+      assert Format in _Formats
+   except AssertionError:
+      print("\nThe Format must be 'netcdf' or 'zarr'\n")
+      return
+
+
+   try:
+      assert Chunks is None or type(Chunks) == dict
+      assert Compression is None or type(Compression) == str
+      assert int(Level) >= 0
+   except (AssertionError, TypeError, ValueError):
+      print('\nChunks must be a dictionary of sizes, Compression a string or None and Level a integer, e.g.:')
+      print("write(Results, 'out.nc', Compression='zlib', Level=4, Chunks={'lat': 180})\n")
+      return
+
+
+   if _is_xarray(Data, 'Dataset') or _is_xarray(Data):
+      Steps = [Data]
+   else:
+      try:
+         Steps = iter(Data)
+      except TypeError:
+         print('\nData must be a Xarray.Dataset, a Xarray.DataArray or an iterable of them\n')
+         return
+
+
+   Writer = None
+
+   try:
+      for Step in Steps:
+         if Dim is None:
+            Dim = _append_dim(Step)
+         Step = _as_dataset(Step, Dim)
+
+         if Writer is None:
+            Writer = (_Zarr if Format == 'zarr' else _NetCDF)(Path, Compression, int(Level), _compute_chunks(Step, Dim, {} if Chunks is None else Chunks))
+
+         for Block in _blocks(Step, Dim):
+            with _stage('write'):
+               if True in [ _is_dask(Block[Name].data) for Name in Block.variables ]:
+                  Block = Block.load()
+               Writer.append(Block, Dim if Dim in Block.dims else None)
+            del Block
+
+   finally:
+      if Writer is not None:
+         Writer.close()
+
+
+   return Path;
+
+#-----------------------------------------------------------------------------------------------------------------------------------
@@ -14,12 +14,14 @@ setuptools.setup(
    url="https://github.com/joaohenry23/metlib",
    license='BSD 3-Clause',
    packages=setuptools.find_packages(),
+   entry_points={
+      "console_scripts": ["metlib-batch=metlib.cli:main"],
+   },
    classifiers=[
-      "Programming Language :: Python :: 2",
       "Programming Language :: Python :: 3",
       "License :: OSI Approved :: BSD License",
       "Operating System :: OS Independent",
    ],
-   python_requires='>=2.7',
-   install_requires=["numpy","xarray",],
+   python_requires='>=3.9',
+   install_requires=["numpy>=1.21","xarray",],
 )
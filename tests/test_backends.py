@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: The compiled kernels of the 'numba' backend give the same results, bit for
+             bit, that the Numpy ones in float64 and float32, with C-contiguous inputs
+             and with non-contiguous views (which fall back to the Numpy kernels). Their
+             times are compared in benchmarks/backend_parity.py.
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import numpy as np
+import pytest
+import metlib
+
+pytest.importorskip('numba')
+#-----------------------------------------------------------------------------------------------------------------------------------
+def synthetic_fields(nt=3, Levels=np.array([1000.,850.,700.,500.,300.,200.]), dLon=2.0):
+   # smooth waves plus noise on a global grid, with twice the times so that every other
+   # time is a non-contiguous view of the same fields
+   Lon = np.arange(0.0, 360.0, dLon)
+   Lat = np.arange(-88.0, 88.0+dLon/2, dLon)
+   Rng = np.random.default_rng(0)
+   Lon3 = np.deg2rad(Lon)[None,None,None,:]
+   Lat3 = np.deg2rad(Lat)[None,None,:,None]
+   Lev3 = Levels[None,:,None,None]
+   Time = np.arange(2*nt)[:,None,None,None]
+   Shape = (2*nt, Levels.size, Lat.size, Lon.size)
+
+   Temperature = 300.0*(Lev3/1000.0)**0.2 - 30.0*np.sin(Lat3)**2 + 3.0*np.cos(4*Lon3-0.3*Time)*np.cos(Lat3) + 0.1*Rng.standard_normal(Shape)
+   UComp = 30.0*np.cos(Lat3)**2*(1.0-Lev3/1200.0) + 8.0*np.sin(5*Lon3+Time)*np.cos(2*Lat3) + 0.5*Rng.standard_normal(Shape)
+   VComp = 8.0*np.cos(5*Lon3+Time)*np.cos(Lat3) + 0.5*Rng.standard_normal(Shape)
+
+   return Temperature, UComp, VComp, Lon, Lat
+
+
+Temperature, UComp, VComp, Lon, Lat = synthetic_fields()
+Grid = metlib.grid_metrics(Lon, Lat)
+
+Diagnostics = [
+   ('cdiff X', lambda T, U, V: metlib.cdiff(T, 'X')),
+   ('cdiff Y', lambda T, U, V: metlib.cdiff(T, 'Y')),
+   ('cdiff Z', lambda T, U, V: metlib.cdiff(T, 'Z')),
+   ('cdiff T', lambda T, U, V: metlib.cdiff(T, 'T')),
+   ('relative_vorticity', lambda T, U, V: metlib.relative_vorticity(U, V, Grid=Grid)),
+   ('absolute_vorticity', lambda T, U, V: metlib.absolute_vorticity(U, V, Grid=Grid)),
+   ('divergence', lambda T, U, V: metlib.divergence(U, V, Grid=Grid)),
+   ('advection', lambda T, U, V: metlib.advection(T, U, V, Grid=Grid)),
+   ('batch_advection', lambda T, U, V: metlib.batch_advection(np.stack([T, U, V]), U, V, Grid=Grid)),
+]
+
+
+def inputs(dtype, Layout):
+   Fields = [ Field.astype(dtype) for Field in (Temperature, UComp, VComp) ]
+   if Layout == 'contiguous':
+      Fields = [ Field[::2].copy() for Field in Fields ]
+   else:
+      Fields = [ Field[::2] for Field in Fields ]
+   assert False not in [ Field.flags['C_CONTIGUOUS'] == (Layout == 'contiguous') for Field in Fields ]
+   return Fields
+
+
+@pytest.mark.parametrize('Layout', ['contiguous', 'strided'])
+@pytest.mark.parametrize('dtype', ['float64', 'float32'])
+@pytest.mark.parametrize('Name, Function', Diagnostics, ids=[ Case[0] for Case in Diagnostics ])
+def test_numba_equals_numpy(Name, Function, dtype, Layout):
+   Fields = inputs(dtype, Layout)
+   with metlib.set_options(dtype=dtype, backend='numba'):
+      Numba = Function(*Fields)
+   with metlib.set_options(dtype=dtype, backend='numpy'):
+      Numpy = Function(*Fields)
+
+   assert Numba.dtype == Numpy.dtype == np.dtype(dtype)
+   np.testing.assert_array_equal(Numba, Numpy)
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'float32'])
+def test_numba_kernels_selected(dtype):
+   # the C-contiguous inputs of the parity test use the compiled kernels, and the views
+   # the kernels of the 'numpy' backend
+   from metlib.functions import _kernel
+   from metlib.backends import _load
+   Contiguous = inputs(dtype, 'contiguous')[0]
+   Strided = inputs(dtype, 'strided')[0]
+   with metlib.set_options(dtype=dtype, backend='numba'):
+      assert _kernel('cdiff', Contiguous) is _load('numba')['cdiff']
+      assert _kernel('cdiff', Strided) is _load('numpy')['cdiff']
+
+
+Smaller = metlib.grid_metrics(Lon[:10], Lat[:10])
+
+Mismatched = [
+   ('relative_vorticity larger grid', lambda T, U, V: metlib.relative_vorticity(U[...,:-1], V[...,:-1], Grid=Grid)),
+   ('relative_vorticity smaller grid', lambda T, U, V: metlib.relative_vorticity(U, V, Grid=Smaller)),
+   ('absolute_vorticity', lambda T, U, V: metlib.absolute_vorticity(U, V, Grid=Smaller)),
+   ('divergence', lambda T, U, V: metlib.divergence(U, V, Grid=Smaller)),
+   ('wind_gradients', lambda T, U, V: metlib.wind_gradients(U, V, Grid=Smaller)),
+   ('advection larger grid', lambda T, U, V: metlib.advection(T[...,:-1], U[...,:-1], V[...,:-1], Grid=Grid)),
+   ('advection smaller grid', lambda T, U, V: metlib.advection(T, U, V, Grid=Smaller)),
+   ('batch_advection', lambda T, U, V: metlib.batch_advection(np.stack([T, U]), U, V, Grid=Smaller)),
+   ('compute', lambda T, U, V: metlib.compute({'u': U, 'v': V}, ['vor', 'div'], Grid=Smaller)),
+]
+
+
+@pytest.mark.parametrize('Backend', ['numba', 'numpy'])
+@pytest.mark.parametrize('Name, Function', Mismatched, ids=[ Case[0] for Case in Mismatched ])
+def test_mismatched_grid(Name, Function, Backend, capsys):
+   # a GridMetrics of other longitudes and latitudes is rejected by both backends
+   with metlib.set_options(backend=Backend):
+      assert Function(*inputs('float64', 'contiguous')) is None
+   assert 'The Grid has the shape' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('Backend', ['numba', 'numpy'])
+@pytest.mark.parametrize('Metrics', [Grid, Smaller], ids=['larger grid', 'smaller grid'])
+def test_mismatched_grid_kernels(Metrics, Backend):
+   # below the checks of the functions, the compiled kernels are not used with the
+   # metrics of another grid, so both backends fail the same way instead of reading
+   # out of the bounds of the metrics
+   from metlib.functions import _relative_vorticity, _advection
+   UComp = inputs('float64', 'contiguous')[1][...,:-1].copy()
+   with metlib.set_options(backend=Backend):
+      with pytest.raises(ValueError):
+         _relative_vorticity(UComp, UComp, Metrics)
+      with pytest.raises(ValueError):
+         _advection(UComp, UComp, UComp, Metrics)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: With set_options(dtype='float32') the results stay in float32 end-to-end,
+             and their error relative to the RMS of the float64 results is below the
+             bounds documented in the option dtype (see benchmarks/float32_accuracy.py).
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import numpy as np
+import pytest
+import metlib
+#-----------------------------------------------------------------------------------------------------------------------------------
+def synthetic_fields(nt=3, Levels=np.array([1000.,925.,850.,700.,500.,300.,250.,200.]), dLon=1.0):
+   # the fields of benchmarks/float32_accuracy.py, with three times for cdiff in T
+   Lon = np.arange(0.0, 360.0, dLon)
+   Lat = np.arange(-89.0, 89.0+dLon/2, dLon)
+   Rng = np.random.default_rng(0)
+   Lon3 = np.deg2rad(Lon)[None,None,None,:]
+   Lat3 = np.deg2rad(Lat)[None,None,:,None]
+   Lev3 = Levels[None,:,None,None]
+   Time = np.arange(nt)[:,None,None,None]
+   Shape = (nt, Levels.size, Lat.size, Lon.size)
+
+   Temperature = 300.0*(Lev3/1000.0)**0.2 - 30.0*np.sin(Lat3)**2 + 3.0*np.cos(4*Lon3-0.3*Time)*np.cos(Lat3) + 0.1*Rng.standard_normal(Shape)
+   UComp = 30.0*np.cos(Lat3)**2*(1.0-Lev3/1200.0) + 8.0*np.sin(5*Lon3+Time)*np.cos(2*Lat3) + 0.5*Rng.standard_normal(Shape)
+   VComp = 8.0*np.cos(5*Lon3+Time)*np.cos(Lat3) + 0.5*Rng.standard_normal(Shape)
+
+   return Temperature.astype(np.float32), UComp.astype(np.float32), VComp.astype(np.float32), Lon, Lat, Levels
+
+
+Temperature, UComp, VComp, Lon, Lat, Levels = synthetic_fields()
+
+# name, function and bound of the error relative to the RMS of the float64 result
+Diagnostics = [
+   ('cdiff X', lambda: metlib.cdiff(Temperature, 'X'), 5e-6),
+   ('cdiff Y', lambda: metlib.cdiff(Temperature, 'Y'), 5e-6),
+   ('cdiff Z', lambda: metlib.cdiff(Temperature, 'Z'), 5e-6),
+   ('cdiff T', lambda: metlib.cdiff(Temperature, 'T'), 5e-6),
+   ('relative_vorticity', lambda: metlib.relative_vorticity(UComp, VComp, Lon, Lat), 5e-6),
+   ('absolute_vorticity', lambda: metlib.absolute_vorticity(UComp, VComp, Lon, Lat), 5e-6),
+   ('divergence', lambda: metlib.divergence(UComp, VComp, Lon, Lat), 5e-6),
+   ('advection', lambda: metlib.advection(Temperature, UComp, VComp, Lon, Lat), 5e-6),
+   ('potential_temperature', lambda: metlib.potential_temperature(Temperature, Levels), 5e-6),
+   ('potential_vorticity', lambda: metlib.potential_vorticity(Temperature, UComp, VComp, Lon, Lat, Levels), 5e-5),
+]
+
+
+@pytest.mark.parametrize('Name, Function, Bound', Diagnostics, ids=[ Case[0] for Case in Diagnostics ])
+def test_float32(Name, Function, Bound):
+   Double = Function()
+   with metlib.set_options(dtype='float32'):
+      Single = Function()
+
+   assert Double.dtype == np.float64
+   assert Single.dtype == np.float32
+   assert Single.shape == Double.shape
+   np.testing.assert_array_equal(np.isfinite(Single), np.isfinite(Double))
+
+   Mask = np.isfinite(Double)
+   Error = np.abs(Single[Mask].astype(np.float64) - Double[Mask])
+   Scale = np.sqrt(np.mean(Double[Mask]**2))
+   assert np.max(Error)/Scale < Bound
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: The diagnostics computed in a pool of threads over the time and level axes
+             (option workers) are identical, bit for bit, to the serial ones, for the
+             results built by the workers and for the ones written in out.
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import numpy as np
+import pytest
+import metlib
+#-----------------------------------------------------------------------------------------------------------------------------------
+def synthetic_fields(nt=5, Levels=np.array([1000.,925.,850.,700.,500.,300.,250.]), dLon=2.0):
+   # smooth waves plus noise on a global grid, with numbers of times and levels that are
+   # not multiples of the workers
+   Lon = np.arange(0.0, 360.0, dLon)
+   Lat = np.arange(-88.0, 88.0+dLon/2, dLon)
+   Rng = np.random.default_rng(0)
+   Lon3 = np.deg2rad(Lon)[None,None,None,:]
+   Lat3 = np.deg2rad(Lat)[None,None,:,None]
+   Lev3 = Levels[None,:,None,None]
+   Time = np.arange(nt)[:,None,None,None]
+   Shape = (nt, Levels.size, Lat.size, Lon.size)
+
+   Temperature = 300.0*(Lev3/1000.0)**0.2 - 30.0*np.sin(Lat3)**2 + 3.0*np.cos(4*Lon3-0.3*Time)*np.cos(Lat3) + 0.1*Rng.standard_normal(Shape)
+   UComp = 30.0*np.cos(Lat3)**2*(1.0-Lev3/1200.0) + 8.0*np.sin(5*Lon3+Time)*np.cos(2*Lat3) + 0.5*Rng.standard_normal(Shape)
+   VComp = 8.0*np.cos(5*Lon3+Time)*np.cos(Lat3) + 0.5*Rng.standard_normal(Shape)
+
+   return Temperature, UComp, VComp, Lon, Lat, Levels
+
+
+Temperature, UComp, VComp, Lon, Lat, Levels = synthetic_fields()
+
+Diagnostics = [
+   ('cdiff X', lambda T, U, V, **kw: metlib.cdiff(T, 'X', **kw)),
+   ('cdiff Y', lambda T, U, V, **kw: metlib.cdiff(T, 'Y', **kw)),
+   ('cdiff Z', lambda T, U, V, **kw: metlib.cdiff(T, 'Z', **kw)),
+   ('relative_vorticity', lambda T, U, V, **kw: metlib.relative_vorticity(U, V, Lon, Lat, periodic_x=True, **kw)),
+   ('divergence', lambda T, U, V, **kw: metlib.divergence(U, V, Lon, Lat, periodic_x=True, **kw)),
+   ('advection', lambda T, U, V, **kw: metlib.advection(T, U, V, Lon, Lat, periodic_x=True, **kw)),
+   ('potential_vorticity', lambda T, U, V, **kw: metlib.potential_vorticity(T, U, V, Lon, Lat, Levels, periodic_x=True, **kw)),
+]
+
+
+@pytest.mark.parametrize('Backend', ['numpy', 'auto'])
+@pytest.mark.parametrize('ndim', [3, 4])
+@pytest.mark.parametrize('Name, Function', Diagnostics, ids=[ Case[0] for Case in Diagnostics ])
+def test_workers(Name, Function, ndim, Backend):
+   Fields = (Temperature, UComp, VComp) if ndim == 4 else (Temperature[0], UComp[0], VComp[0])
+   with metlib.set_options(workers=1, backend=Backend):
+      Serial = Function(*Fields)
+   with metlib.set_options(workers=4, backend=Backend):
+      Threaded = Function(*Fields)
+      Out = Function(*Fields, out=np.empty(Serial.shape, dtype=Serial.dtype))
+
+   assert Threaded.dtype == Serial.dtype
+   assert np.array_equal(Threaded, Serial, equal_nan=True)
+   assert np.array_equal(Out, Serial, equal_nan=True)
+
+
+def test_workers_cdiff_time():
+   with metlib.set_options(workers=1):
+      Serial = metlib.cdiff(Temperature, 'T')
+   with metlib.set_options(workers=4):
+      Threaded = metlib.cdiff(Temperature, 'T')
+   assert np.array_equal(Threaded, Serial, equal_nan=True)
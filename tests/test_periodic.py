@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: On global grids (periodic_x=True) the differences across the edges of the
+             longitudes, computed with the opposite side of the fields without a wrapped
+             copy, are the ones of the fields padded by hand with the opposite columns.
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import numpy as np
+import pytest
+import metlib
+#-----------------------------------------------------------------------------------------------------------------------------------
+Rng = np.random.default_rng(1)
+Lon = np.arange(144)*2.5
+Lat = np.linspace(-80.0, 80.0, 30)
+Levels = np.array([1000.,850.,700.,500.,300.])
+Temperature = 250.0 + 30.0*Rng.random((2, Levels.size, Lat.size, Lon.size))
+UComp = 20.0*Rng.standard_normal(Temperature.shape)
+VComp = 20.0*Rng.standard_normal(Temperature.shape)
+
+
+def padded(Array, h):
+   # the h columns of the opposite side of the grid at each edge
+   return np.concatenate([Array[...,-h:], Array, Array[...,:h]], axis=-1)
+
+
+def padded_lon(h):
+   return np.concatenate([Lon[-h:]-360.0, Lon, Lon[:h]+360.0])
+
+
+@pytest.mark.parametrize('Backend', ['numpy', 'auto'])
+@pytest.mark.parametrize('order', [2, 4, 6])
+def test_cdiff(order, Backend):
+   h = order//2
+   with metlib.set_options(backend=Backend):
+      Periodic = metlib.cdiff(Temperature, 'X', periodic_x=True, order=order)
+      Padded = metlib.cdiff(padded(Temperature, h), 'X', order=order)[...,h:-h]
+   assert np.isfinite(Periodic).all()
+   assert np.array_equal(Periodic, Padded)
+
+
+Diagnostics = [
+   ('relative_vorticity', lambda T, U, V, Lon, **kw: metlib.relative_vorticity(U, V, Lon, Lat, **kw)),
+   ('divergence', lambda T, U, V, Lon, **kw: metlib.divergence(U, V, Lon, Lat, **kw)),
+   ('advection', lambda T, U, V, Lon, **kw: metlib.advection(T, U, V, Lon, Lat, **kw)),
+   ('potential_vorticity', lambda T, U, V, Lon, **kw: metlib.potential_vorticity(T, U, V, Lon, Lat, Levels, **kw)),
+]
+
+
+@pytest.mark.parametrize('order', [2, 4])
+@pytest.mark.parametrize('Name, Function', Diagnostics, ids=[ Case[0] for Case in Diagnostics ])
+def test_dynamic_calcs(Name, Function, order):
+   # the grid metrics of the padded longitudes differ from the wrapped ones by rounding
+   h = order//2
+   Periodic = Function(Temperature, UComp, VComp, Lon, periodic_x=True, order=order)
+   Padded = Function(*[ padded(Field, h) for Field in (Temperature, UComp, VComp) ], padded_lon(h), order=order)[...,h:-h]
+   assert np.isfinite(Periodic[...,1:-1,[0, -1]]).any()
+   np.testing.assert_allclose(Periodic, Padded, rtol=1e-12, atol=0)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#-----------------------------------------------------------------------------------------------------------------------------------
+'''
+Description: The diagnostics computed over a window with region=(lon_min, lon_max,
+             lat_min, lat_max), also across the dateline and the edges of the longitudes,
+             are bit-identical to the window of the results of the whole grid.
+'''
+#-----------------------------------------------------------------------------------------------------------------------------------
+import numpy as np
+import pytest
+import metlib
+#-----------------------------------------------------------------------------------------------------------------------------------
+Rng = np.random.default_rng(2)
+Lon = np.arange(0.0, 360.0, 5.0)
+Lat = np.arange(-85.0, 85.1, 5.0)
+Levels = np.array([1000.,850.,700.,500.,300.])
+Temperature = 250.0 + 30.0*Rng.random((2, Levels.size, Lat.size, Lon.size))
+UComp = 20.0*Rng.standard_normal(Temperature.shape)
+VComp = 20.0*Rng.standard_normal(Temperature.shape)
+
+# longitudes from 0 to 360 and from -180 to 180, regions and the rows and columns of their windows
+Windows = [
+   ('south america', Lon, (-80.0, -30.0, -60.0, 15.0), np.arange(5, 21), np.arange(56, 67)),
+   ('across 0', Lon, (340.0, 20.0, -30.0, 30.0), np.arange(11, 24), np.r_[68:72, 0:5]),
+   ('dateline', np.where(Lon >= 180.0, Lon-360.0, Lon), (170.0, -170.0, -30.0, 30.0), np.arange(11, 24), np.arange(34, 39)),
+   ('across the edges', np.where(Lon >= 180.0, Lon-360.0, Lon), (-40.0, 40.0, 60.0, 85.0), np.arange(29, 35), np.r_[64:72, 0:9]),
+]
+
+Diagnostics = [
+   ('relative_vorticity', lambda Lon, **kw: metlib.relative_vorticity(UComp, VComp, Lon, Lat, **kw)),
+   ('absolute_vorticity', lambda Lon, **kw: metlib.absolute_vorticity(UComp, VComp, Lon, Lat, **kw)),
+   ('divergence', lambda Lon, **kw: metlib.divergence(UComp, VComp, Lon, Lat, **kw)),
+   ('advection', lambda Lon, **kw: metlib.advection(Temperature, UComp, VComp, Lon, Lat, **kw)),
+   ('potential_vorticity', lambda Lon, **kw: metlib.potential_vorticity(Temperature, UComp, VComp, Lon, Lat, Levels, **kw)),
+]
+
+
+@pytest.mark.parametrize('order', [2, 4])
+@pytest.mark.parametrize('Window, Longitudes, Region, Rows, Columns', Windows, ids=[ Case[0] for Case in Windows ])
+@pytest.mark.parametrize('Name, Function', Diagnostics, ids=[ Case[0] for Case in Diagnostics ])
+def test_region(Name, Function, Window, Longitudes, Region, Rows, Columns, order):
+   Whole = Function(Longitudes, periodic_x=True, order=order)
+   Part = Function(Longitudes, periodic_x=True, order=order, region=Region)
+   assert np.array_equal(Part, Whole[...,Rows,:][...,Columns], equal_nan=True)
+
+
+def test_region_xarray():
+   xr = pytest.importorskip('xarray')
+   Window, Longitudes, Region, Rows, Columns = Windows[1]
+   Dims = ('time', 'level', 'lat', 'lon')
+   Coords = {'time': np.arange(2), 'level': Levels, 'lat': Lat, 'lon': Lon}
+   Fields = [ xr.DataArray(Field, dims=Dims, coords=Coords) for Field in (Temperature, UComp, VComp) ]
+   Part = metlib.potential_vorticity(*Fields, periodic_x=True, region=Region)
+   Whole = metlib.potential_vorticity(Temperature, UComp, VComp, Lon, Lat, Levels, periodic_x=True)
+   assert np.array_equal(Part.values, Whole[...,Rows,:][...,Columns], equal_nan=True)
+   assert np.array_equal(Part.lon.values, Lon[Columns])